@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+
+import psutil
+
+from file_transfer import check_path
+from stack_profiler import StackProfiler
+
+class QueryHandler:
+    """Answer typed server queries in-process from the agent's cached state"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = time.time()
+        self.profiler = StackProfiler()
+
+    def supported(self):
+        return sorted(name[len("query_"):] for name in dir(self) if name.startswith("query_"))
+
+    async def answer(self, name, params):
+        handler = getattr(self, f"query_{name}", None)
+        if handler is None:
+            raise ValueError(f"Unknown query: {name}")
+        return await handler(params or {})
+
+    async def query_version(self, params):
+        return {"version": self.agent.updater.current_version}
+
+    async def query_system_info(self, params):
+        inventory, inventory_hash = self.agent.inventory.get()
+        return {
+            "system_info": self.agent.get_system_info(),
+            "inventory": inventory,
+            "inventory_hash": inventory_hash
+        }
+
+    async def query_metrics(self, params):
+        return self.agent.get_system_metrics()
+
+    async def query_uptime(self, params):
+        now = time.time()
+        return {
+            "system_uptime": now - psutil.boot_time(),
+            "agent_uptime": now - self.started
+        }
+
+    async def query_agent_stats(self, params):
+        stats = self.agent.telemetry.snapshot()
+        stats["collector_ages"] = self.agent.sampler.ages()
+        return stats
+
+    async def query_profile(self, params):
+        # The sampler sleeps between samples, so a worker thread is the cheapest place for it
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            self.profiler.run,
+            params.get("seconds", 10),
+            float(params.get("interval_ms", 10)) / 1000,
+            bool(params.get("memory", False)),
+            params.get("limit", 500)
+        )
+
+    async def query_file_stat(self, params):
+        # Lets the server pick a resume offset before pushing a file
+        path = check_path(params.get("path"))
+        partial = path + ".part"
+        return {
+            "exists": os.path.isfile(path),
+            "size": os.path.getsize(path) if os.path.isfile(path) else None,
+            "partial_size": os.path.getsize(partial) if os.path.isfile(partial) else 0
+        }
+
+    async def query_processes(self, params):
+        # Walking the process table takes tens of ms, so keep it off the event loop
+        limit = int(params.get("limit", 25))
+        sort_by = params.get("sort", "memory_percent")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.list_processes, limit, sort_by)
+
+    def list_processes(self, limit, sort_by):
+        processes = []
+        for proc in psutil.process_iter(["pid", "name", "username", "memory_percent", "cpu_percent"]):
+            info = proc.info
+            info["memory_percent"] = round(info["memory_percent"] or 0, 2)
+            info["cpu_percent"] = info["cpu_percent"] or 0
+            processes.append(info)
+        if sort_by not in ("memory_percent", "cpu_percent", "pid"):
+            sort_by = "memory_percent"
+        processes.sort(key=lambda p: p[sort_by], reverse=sort_by != "pid")
+        return {"count": len(processes), "processes": processes[:limit]}
@@ -0,0 +1,166 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+# Histogram bucket upper bounds; the same buckets serve milliseconds and bytes
+BUCKET_BOUNDS = [
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+    1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000
+]
+PROCESS_CPU_INTERVAL = 5  # Seconds between samples of the agent's own CPU usage
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are bucket upper bounds, capped at max"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else 0,
+            "p50": round(self.percentile(0.5), 3),
+            "p95": round(self.percentile(0.95), 3),
+            "p99": round(self.percentile(0.99), 3),
+            "max": round(self.max, 3)
+        }
+
+class AgentTelemetry:
+    """Counters and histograms describing what the agent itself costs
+
+    Safe to update from the sampler and executor threads as well as the event loop.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+        self.process = psutil.Process()
+        self.process.cpu_percent(None)
+        self.process_cpu = 0.0
+        self.process_cpu_sampled = time.monotonic()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, read):
+        """Register a callable that reports a current value whenever stats are read"""
+        self.gauges[name] = read
+
+    def read_gauges(self):
+        values = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                values[name] = read()
+            except Exception:
+                values[name] = None
+        return values
+
+    @contextmanager
+    def timer(self, name):
+        """Record the duration of a block in milliseconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - started) * 1000)
+
+    async def monitor_loop_lag(self, interval=0.5):
+        """Measure how late the event loop wakes us up; that lateness is time other tasks held it"""
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            self.observe("loop_lag_ms", max(0.0, (time.perf_counter() - expected) * 1000))
+            if time.monotonic() - self.process_cpu_sampled >= PROCESS_CPU_INTERVAL:
+                self.sample_process_cpu()
+
+    def sample_process_cpu(self):
+        """The only cpu_percent() caller: each call resets psutil's interval, so readers share this value"""
+        self.process_cpu = self.process.cpu_percent(None)
+        self.process_cpu_sampled = time.monotonic()
+
+    def process_stats(self):
+        with self.process.oneshot():
+            memory = self.process.memory_info()
+            return {
+                "rss": memory.rss,
+                "cpu_percent": self.process_cpu,
+                "threads": self.process.num_threads()
+            }
+
+    def snapshot(self):
+        """Full in-memory telemetry for the on-demand agent_stats query"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {name: h.summary() for name, h in self.histograms.items()}
+        return {
+            "uptime": time.time() - self.started,
+            "process": self.process_stats(),
+            "counters": counters,
+            "gauges": self.read_gauges(),
+            "histograms": histograms
+        }
+
+    def export(self):
+        """Counters plus copies of raw histogram buckets, for exporters"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {
+                name: (list(h.buckets), h.count, h.total) for name, h in self.histograms.items()
+            }
+        return counters, histograms
+
+    def heartbeat_block(self):
+        """Compact summary small enough to ride along with heartbeats"""
+        with self._lock:
+            def p95(name):
+                histogram = self.histograms.get(name)
+                return round(histogram.percentile(0.95), 2) if histogram else None
+
+            heartbeat_bytes = self.histograms.get("heartbeat_bytes")
+            block = {
+                "loop_lag_p95_ms": p95("loop_lag_ms"),
+                "collect_p95_ms": p95("collect_metrics_ms"),
+                "send_p95_ms": p95("send_ms"),
+                "heartbeat_bytes_avg": round(heartbeat_bytes.total / heartbeat_bytes.count) if heartbeat_bytes and heartbeat_bytes.count else None,
+                "bytes_sent": self.counters.get("bytes_sent", 0),
+                "bytes_received": self.counters.get("bytes_received", 0)
+            }
+        block.update(self.process_stats())
+        block.update(self.read_gauges())
+        return block
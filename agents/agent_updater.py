@@ -1,5 +1,10 @@
 import requests
+import asyncio
+import functools
+import hashlib
 import os
+import random
+import socket
 import sys
 import subprocess
 import tempfile
@@ -8,13 +13,123 @@ import shutil
 import json
 import time
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as TransportError
+from binary_delta import DeltaError, apply_patch
+
+# Executable downloads: hard size cap, adaptive read sizes, retries that resume via Range
+MAX_UPDATE_BYTES = 256 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+DOWNLOAD_ATTEMPTS = 6
+
+def server_mirror_url(server_url):
+    """Update mirror served by the SysWatch server the agent connects to"""
+    parts = urlsplit(server_url)
+    scheme = "https" if parts.scheme == "wss" else "http"
+    return urlunsplit((scheme, parts.netloc, "/agent-updates", "", ""))
+
+class MirrorSource:
+    """HTTP mirror publishing manifest.json with per-artifact URLs and SHA-256 checksums"""
+    
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.name = f"mirror {self.base_url}"
+        self.manifest = None
+    
+    def latest(self, updater):
+        response = updater.session.get(urljoin(self.base_url, "manifest.json"), timeout=10)
+        response.raise_for_status()
+        self.manifest = response.json()
+        
+        artifact = self.artifact(updater.platform_asset_name())
+        if not artifact:
+            raise ValueError("no artifact for this platform")
+        return {
+            "version": self.manifest["version"].replace("v", ""),
+            "download_url": artifact["url"],
+            "sha256": artifact.get("sha256"),
+            "size": artifact.get("size"),
+            "deltas": {
+                from_version: {**delta, "url": urljoin(self.base_url, delta["url"])}
+                for from_version, delta in (artifact.get("deltas") or {}).items()
+            },
+            "release_notes": self.manifest.get("release_notes", "")
+        }
+    
+    def artifact(self, name):
+        entry = (self.manifest or {}).get("artifacts", {}).get(name)
+        if not entry:
+            return None
+        return {**entry, "url": urljoin(self.base_url, entry["url"])}
+
+class GitHubSource:
+    """GitHub releases, the source of truth and last resort"""
+    
+    name = "github"
+    
+    def latest(self, updater):
+        release = updater.fetch_latest_release()
+        asset = updater.get_platform_asset(release) or {}
+        # GitHub publishes a "sha256:<hex>" digest for each release asset
+        digest = asset.get("digest") or ""
+        return {
+            "version": release["tag_name"].replace("v", ""),
+            "download_url": updater.get_platform_download_url(release),
+            "sha256": digest[len("sha256:"):] if digest.startswith("sha256:") else None,
+            "size": asset.get("size"),
+            "deltas": {},
+            "release_notes": release.get("body", "")
+        }
+    
+    def artifact(self, name):
+        return None
 
 class AgentUpdater:
-    def __init__(self, repo_owner="wslabn", repo_name="nxtclone"):
+    def __init__(self, repo_owner="wslabn", repo_name="nxtclone", cache_path=None):
         self.repo_owner = repo_owner
         self.repo_name = repo_name
         self.current_version = self.get_current_version()
         
+        # Release metadata plus ETag/Last-Modified, so polls are conditional requests
+        self.cache_path = cache_path
+        self.release_cache = self.load_release_cache()
+        
+        # Survives the restart so the new version can report its health
+        self.health_marker_path = os.path.join(os.path.dirname(cache_path), "update-health.json") if cache_path else None
+        self.self_check_failed = False
+        
+        # Mirrors are tried in order before falling back to GitHub
+        self.github = GitHubSource()
+        self.sources = [self.github]
+        self.active_source = self.github
+        
+        # One pooled session so metadata, agent and companion downloads reuse connections
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "syswatch-agent-updater"
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # Blocking update work runs here, one step at a time, off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="updater")
+    
+    async def run_async(self, func, *args, **kwargs):
+        """Run a blocking updater method on the updater thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+    
+    async def check_for_updates_async(self):
+        return await self.run_async(self.check_for_updates)
+    
+    async def install_update_async(self, update_info, progress=None):
+        return await self.run_async(self.install_update, update_info, progress)
+    
+    async def restart_agent_async(self):
+        return await self.run_async(self.restart_agent)
+        
     def get_current_version(self):
         try:
             # Try to import version from version.py (embedded in executable)
@@ -43,47 +158,204 @@ class AgentUpdater:
             print(f"Error reading version: {e}")
             return "1.0.0"
     
+    def load_release_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_release_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = self.cache_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(self.release_cache, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not save release cache: {e}")
+    
+    def fetch_latest_release(self):
+        """Fetch release metadata with a conditional request, falling back to the cache"""
+        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/releases/latest"
+        cached = self.release_cache
+        headers = {}
+        if cached.get("release"):
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        
+        try:
+            response = self.session.get(url, headers=headers, timeout=10)
+        except requests.RequestException:
+            if cached.get("release"):
+                print("Release check failed, using cached release metadata")
+                return cached["release"]
+            raise
+        
+        if response.status_code == 304:
+            # Unchanged; a 304 does not count against the GitHub rate limit
+            cached["checked_at"] = time.time()
+            self.save_release_cache()
+            return cached["release"]
+        
+        if response.status_code in (403, 429) and cached.get("release"):
+            print(f"Release check rate limited ({response.status_code}), using cached release metadata")
+            return cached["release"]
+        
+        response.raise_for_status()
+        release = response.json()
+        
+        # Keep only the fields the updater uses
+        self.release_cache = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "checked_at": time.time(),
+            "release": {
+                "tag_name": release["tag_name"],
+                "body": release.get("body", ""),
+                "zipball_url": release.get("zipball_url"),
+                "assets": [
+                    {
+                        "name": a["name"],
+                        "browser_download_url": a["browser_download_url"],
+                        "size": a.get("size"),
+                        "digest": a.get("digest")
+                    }
+                    for a in release.get("assets", [])
+                ]
+            }
+        }
+        self.save_release_cache()
+        return self.release_cache["release"]
+    
+    def record_pending_health(self, target_version):
+        """Note an install in progress; the restarted agent reports on it"""
+        if not self.health_marker_path:
+            return
+        try:
+            with open(self.health_marker_path, 'w') as f:
+                json.dump({
+                    "previous_version": self.current_version,
+                    "target_version": target_version,
+                    "installed_at": time.time()
+                }, f)
+        except OSError as e:
+            print(f"Could not write update health marker: {e}")
+    
+    def pending_health(self):
+        if not self.health_marker_path:
+            return None
+        try:
+            with open(self.health_marker_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def clear_pending_health(self):
+        if self.health_marker_path and os.path.exists(self.health_marker_path):
+            os.remove(self.health_marker_path)
+    
+    def poll_delay(self, interval):
+        """Per-host jittered delay until the next release poll
+        
+        Each host gets a stable phase from its hostname so a fleet started
+        together spreads its polls over the interval instead of syncing up.
+        """
+        digest = hashlib.sha256(socket.gethostname().encode("utf-8")).digest()
+        phase = int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
+        return interval * (0.5 + phase) + random.uniform(0, interval * 0.05)
+    
+    def set_mirrors(self, mirror_urls):
+        """Use these HTTP mirrors, in order, ahead of GitHub"""
+        self.sources = [MirrorSource(url) for url in mirror_urls if url] + [self.github]
+        self.active_source = self.sources[0]
+    
     def check_for_updates(self):
         try:
             # Refresh current version on each check
             current_version = self.get_current_version()
             
-            url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/releases/latest"
-            headers = {"User-Agent": "syswatch-agent-updater"}
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            release = response.json()
-            latest_version = release["tag_name"].replace("v", "")
-            
-            # Get platform-specific download URL
-            download_url = self.get_platform_download_url(release)
+            latest = None
+            errors = []
+            for source in self.sources:
+                try:
+                    latest = source.latest(self)
+                    self.active_source = source
+                    break
+                except Exception as e:
+                    print(f"Update source {source.name} failed: {e}")
+                    errors.append(f"{source.name}: {e}")
+            if latest is None:
+                return {"error": "; ".join(errors)}
             
             return {
-                "has_update": self.compare_versions(latest_version, current_version) > 0,
+                "has_update": self.compare_versions(latest["version"], current_version) > 0,
                 "current_version": current_version,
-                "latest_version": latest_version,
-                "download_url": download_url,
-                "release_notes": release.get("body", "")
+                "latest_version": latest["version"],
+                "download_url": latest["download_url"],
+                "sha256": latest["sha256"],
+                "size": latest["size"],
+                "delta": latest["deltas"].get(current_version),
+                "source": self.active_source.name,
+                "release_notes": latest["release_notes"]
             }
         except Exception as e:
             return {"error": str(e)}
     
-    def get_platform_download_url(self, release):
-        """Get the correct download URL for current platform"""
-        assets = release.get("assets", [])
+    def install_update(self, update_info, progress=None):
+        """Download and apply an update, falling back to GitHub if a mirror fails"""
+        self.self_check_failed = False
+        if update_info.get("delta") and update_info.get("sha256") and not self.running_from_source():
+            if self.delta_update(update_info, progress):
+                return True
+            print("Delta update failed, downloading the full executable")
+        if self.download_and_update(update_info["download_url"], progress, update_info.get("sha256"), update_info.get("size")):
+            return True
+        if update_info.get("source", "github") == "github":
+            return False
         
+        print("Mirror download failed, falling back to GitHub")
+        try:
+            latest = self.github.latest(self)
+        except Exception as e:
+            print(f"GitHub fallback failed: {e}")
+            return False
+        if latest["version"] != update_info["latest_version"]:
+            print(f"GitHub has {latest['version']}, expected {update_info['latest_version']}; skipping")
+            return False
+        self.active_source = self.github
+        return self.download_and_update(latest["download_url"], progress, latest["sha256"], latest["size"])
+    
+    def platform_asset_name(self):
         if sys.platform.startswith('win'):
-            # Look for Windows executable
-            for asset in assets:
-                if asset["name"] == "syswatch-agent-windows.exe":
-                    return asset["browser_download_url"]
-        else:
-            # Look for Linux executable
-            for asset in assets:
-                if asset["name"] == "syswatch-agent-linux":
-                    return asset["browser_download_url"]
+            return "syswatch-agent-windows.exe"
+        return "syswatch-agent-linux"
+    
+    def companion_url(self, name):
+        """Download URL for a companion app, preferring the active mirror"""
+        artifact = self.active_source.artifact(name)
+        if artifact:
+            return artifact["url"]
+        return f"https://github.com/{self.repo_owner}/{self.repo_name}/releases/latest/download/{name}"
+    
+    def get_platform_asset(self, release):
+        asset_name = self.platform_asset_name()
+        for asset in release.get("assets", []):
+            if asset["name"] == asset_name:
+                return asset
+        return None
+    
+    def get_platform_download_url(self, release):
+        """Get the correct download URL for current platform"""
+        asset = self.get_platform_asset(release)
+        if asset:
+            return asset["browser_download_url"]
         
         # Fallback to source code
         return release["zipball_url"]
@@ -104,14 +376,14 @@ class AgentUpdater:
                 return -1
         return 0
     
-    def download_and_update(self, download_url):
+    def download_and_update(self, download_url, progress=None, sha256=None, size=None):
         try:
             print(f"Downloading update from: {download_url}")
             
             # Check if this is a direct executable download
             if download_url.endswith(('.exe', '-linux')):
                 print("Starting executable update process...")
-                result = self.download_executable_update(download_url)
+                result = self.download_executable_update(download_url, progress, sha256, size)
                 print(f"Executable update result: {result}")
                 return result
             else:
@@ -126,39 +398,208 @@ class AgentUpdater:
             print(f"Traceback: {traceback.format_exc()}")
             return False
     
-    def download_executable_update(self, download_url):
-        """Download and replace executable using external updater"""
+    def running_from_source(self):
+        return sys.argv[0].endswith(".py")
+    
+    def delta_update(self, update_info, progress=None):
+        """Patch the installed executable up to the new version"""
+        current_exe = sys.argv[0]
+        patch_path = current_exe + ".delta"
+        new_exe = current_exe + ".new"
+        delta = update_info["delta"]
+        try:
+            print(f"Downloading {delta['size']}-byte delta patch...")
+            self.download_verified(delta["url"], patch_path, delta["sha256"], delta["size"], progress)
+            print("Applying delta patch...")
+            digest = apply_patch(current_exe, patch_path, new_exe)
+            if digest != update_info["sha256"].lower():
+                raise DeltaError("Patched executable does not match the release checksum")
+            os.chmod(new_exe, 0o755)
+            return self.install_executable(new_exe)
+        except (DeltaError, ValueError, OSError, requests.RequestException, TransportError) as e:
+            print(f"Delta update failed: {e}")
+            if os.path.exists(new_exe):
+                os.remove(new_exe)
+            return False
+        finally:
+            if os.path.exists(patch_path):
+                os.remove(patch_path)
+    
+    def download_executable_update(self, download_url, progress=None, sha256=None, size=None):
+        """Download, verify and swap in the new executable"""
+        current_exe = sys.argv[0]
+        new_exe = current_exe + ".new"
         try:
-            current_exe = sys.argv[0]
-            new_exe = current_exe + ".new"
-            
             # Download new executable
             print("Downloading new executable...")
-            response = requests.get(download_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            with open(new_exe, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
+            self.download_verified(download_url, new_exe, sha256, size, progress)
+            os.chmod(new_exe, 0o755)
+            return self.install_executable(new_exe)
+        except Exception as e:
+            print(f"Executable update failed: {e}")
+            # Clean up downloaded file; an interrupted .part is kept for resume
+            if os.path.exists(new_exe):
+                os.remove(new_exe)
+            return False
+    
+    def install_executable(self, new_exe):
+        """Swap a verified executable into place"""
+        current_exe = sys.argv[0]
+        try:
             if sys.platform.startswith('win'):
+                # The swap stops this service, so check the new binary before handing over
+                if not self.self_check(new_exe):
+                    self.self_check_failed = True
+                    raise ValueError("New executable failed its self-check")
                 # Windows: Use external updater
                 return self.update_with_external_updater(new_exe, current_exe)
-            else:
-                # Linux: direct replace (works fine on Linux)
-                os.chmod(new_exe, 0o755)
-                os.rename(new_exe, current_exe)
-                self.update_control_app_if_exists()
-                print("Executable updated successfully")
-                return True
+            
+            # Linux: atomic replace, then roll back if the installed binary won't start
+            backup_exe = current_exe + ".backup"
+            shutil.copy2(current_exe, backup_exe)
+            os.replace(new_exe, current_exe)
+            if not self.self_check(current_exe):
+                self.self_check_failed = True
+                os.replace(backup_exe, current_exe)
+                print("New executable failed its self-check, rolled back to previous version")
+                return False
+            self.update_control_app_if_exists()
+            print("Executable updated successfully")
+            return True
             
         except Exception as e:
-            print(f"Executable update failed: {e}")
-            # Clean up downloaded file
+            print(f"Executable install failed: {e}")
             if os.path.exists(new_exe):
                 os.remove(new_exe)
             return False
     
+    def download_verified(self, url, destination, sha256=None, size=None, progress=None):
+        """Stream url to destination, resuming interrupted transfers and verifying SHA-256"""
+        partial = destination + ".part"
+        state_path = partial + ".json"
+        state = {}
+        try:
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            pass
+        
+        # A partial file from a different artifact can't be resumed
+        if state.get("url") != url or state.get("sha256") != sha256:
+            state = {"url": url, "sha256": sha256}
+            if os.path.exists(partial):
+                os.remove(partial)
+        
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                digest, downloaded = self.download_range(url, partial, state, state_path, size, progress)
+                break
+            except (requests.RequestException, TransportError, OSError) as e:
+                if attempt == DOWNLOAD_ATTEMPTS - 1:
+                    raise
+                delay = min(30, 2 ** attempt)
+                print(f"Download interrupted ({e}), resuming in {delay}s")
+                time.sleep(delay)
+        
+        try:
+            if size and downloaded != size:
+                raise ValueError(f"Size mismatch: expected {size} bytes, got {downloaded}")
+            if sha256 and digest != sha256.lower():
+                raise ValueError(f"Checksum mismatch: expected {sha256}, got {digest}")
+        except ValueError:
+            os.remove(partial)
+            os.remove(state_path)
+            raise
+        
+        os.replace(partial, destination)
+        os.remove(state_path)
+        return digest
+    
+    def download_range(self, url, partial, state, state_path, size=None, progress=None):
+        """One download attempt, continuing from whatever is already in the partial file"""
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        digest = hashlib.sha256()
+        # Offsets, Content-Length and the size check all count raw bytes, so never let a
+        # proxy or mirror compress the body
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            # Hash the bytes we already have so the checksum still covers the whole file
+            with open(partial, 'rb') as f:
+                for block in iter(lambda: f.read(MAX_CHUNK_SIZE), b""):
+                    digest.update(block)
+            headers["Range"] = f"bytes={offset}-"
+            if state.get("etag"):
+                # Only resume if the artifact hasn't changed underneath us
+                headers["If-Range"] = state["etag"]
+        
+        with self.session.get(url, headers=headers, stream=True, timeout=30) as response:
+            if response.status_code == 416 and offset:
+                if offset == size:
+                    return digest.hexdigest(), offset
+                # Partial file is longer than the artifact; start over
+                os.remove(partial)
+                raise IOError("Resume offset out of range")
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                print("Server did not honor the resume request, restarting download")
+                offset = 0
+                digest = hashlib.sha256()
+            elif offset:
+                print(f"Resuming download at {offset} bytes")
+            
+            length = response.headers.get("Content-Length")
+            total = offset + int(length) if length else (size or 0)
+            if total > MAX_UPDATE_BYTES or (size and total > size):
+                raise ValueError(f"Refusing {total}-byte download (expected {size}, limit {MAX_UPDATE_BYTES})")
+            
+            state["etag"] = response.headers.get("ETag")
+            with open(state_path, 'w') as f:
+                json.dump(state, f)
+            
+            downloaded = offset
+            chunk_size = MIN_CHUNK_SIZE
+            last_report = 0
+            with open(partial, 'ab' if offset else 'wb') as f:
+                while True:
+                    started = time.monotonic()
+                    chunk = response.raw.read(chunk_size, decode_content=False)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    digest.update(chunk)
+                    downloaded += len(chunk)
+                    if downloaded > MAX_UPDATE_BYTES or (size and downloaded > size):
+                        raise ValueError(f"Download exceeded {size or MAX_UPDATE_BYTES} bytes")
+                    
+                    # Aim for reads of a few hundred ms: bigger on fast links, smaller on slow ones
+                    elapsed = time.monotonic() - started
+                    if elapsed < 0.1:
+                        chunk_size = min(MAX_CHUNK_SIZE, chunk_size * 2)
+                    elif elapsed > 0.5:
+                        chunk_size = max(MIN_CHUNK_SIZE, chunk_size // 2)
+                    
+                    # Report at most about once a second
+                    if progress and time.monotonic() - last_report >= 1:
+                        last_report = time.monotonic()
+                        progress(downloaded, total)
+            if progress:
+                progress(downloaded, total)
+        
+        if length and downloaded != total:
+            raise IOError(f"Connection closed after {downloaded} of {total} bytes")
+        return digest.hexdigest(), downloaded
+    
+    def self_check(self, exe_path):
+        """Run a freshly downloaded agent binary with --self-check"""
+        try:
+            result = subprocess.run([exe_path, "--self-check"], capture_output=True, text=True, timeout=60)
+            if result.returncode == 0 and "self-check ok" in result.stdout:
+                return True
+            print(f"Self-check failed (exit {result.returncode}): {result.stdout.strip()} {result.stderr.strip()}")
+        except Exception as e:
+            print(f"Self-check failed: {e}")
+        return False
+    
     def update_with_external_updater(self, new_exe, current_exe):
         """Simple file replacement - no admin needed in LOCALAPPDATA"""
         try:
@@ -185,8 +626,14 @@ class AgentUpdater:
                 with open(log_file, 'a') as f:
                     f.write("Created backup file\n")
             
-            # Replace with new file
-            shutil.copy2(new_exe, current_exe)
+            # Replace with new file, restoring the backup if the copy fails part-way
+            try:
+                shutil.copy2(new_exe, current_exe)
+            except Exception:
+                if os.path.exists(current_exe + ".backup"):
+                    shutil.copy2(current_exe + ".backup", current_exe)
+                subprocess.run(['sc', 'start', 'SysWatch Agent'], capture_output=True)
+                raise
             os.remove(new_exe)
             
             with open(log_file, 'a') as f:
@@ -275,7 +722,7 @@ if __name__ == "__main__": main()
     def download_source_update(self, download_url):
         """Download and update from source (fallback)"""
         try:
-            response = requests.get(download_url, stream=True, timeout=30)
+            response = self.session.get(download_url, stream=True, timeout=30)
             response.raise_for_status()
             
             with tempfile.TemporaryDirectory() as temp_dir:
@@ -318,8 +765,8 @@ if __name__ == "__main__": main()
             if os.path.exists(tray_path):
                 print("Updating tray application...")
                 # Download latest tray app
-                url = f"https://github.com/{self.repo_owner}/{self.repo_name}/releases/latest/download/syswatch-tray.exe"
-                response = requests.get(url, timeout=30)
+                url = self.companion_url("syswatch-tray.exe")
+                response = self.session.get(url, stream=True, timeout=30)
                 response.raise_for_status()
                 
                 # Replace tray app
@@ -327,7 +774,8 @@ if __name__ == "__main__": main()
                 shutil.copy2(tray_path, backup_path)
                 
                 with open(tray_path + ".new", 'wb') as f:
-                    f.write(response.content)
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
                 
                 # Kill existing tray processes
                 subprocess.run(['taskkill', '/f', '/im', 'syswatch-tray.exe'], 
@@ -354,8 +802,8 @@ if __name__ == "__main__": main()
             if os.path.exists(control_path):
                 print("Updating control application...")
                 # Download latest control app
-                url = f"https://github.com/{self.repo_owner}/{self.repo_name}/releases/latest/download/syswatch-control"
-                response = requests.get(url, timeout=30)
+                url = self.companion_url("syswatch-control")
+                response = self.session.get(url, stream=True, timeout=30)
                 response.raise_for_status()
                 
                 # Replace control app
@@ -363,7 +811,8 @@ if __name__ == "__main__": main()
                 shutil.copy2(control_path, backup_path)
                 
                 with open(control_path + ".new", 'wb') as f:
-                    f.write(response.content)
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
                 
                 os.chmod(control_path + ".new", 0o755)
                 os.rename(control_path, control_path + ".old")
@@ -0,0 +1,66 @@
+import hashlib
+import struct
+import zlib
+
+# Patch format produced by server/delta.js
+MAGIC = b"SWDELTA1"
+OP_COPY = 0x01
+OP_INSERT = 0x02
+HEADER = struct.Struct(">8sQQ32s32s")
+
+class DeltaError(Exception):
+    pass
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.digest()
+
+def apply_patch(old_path, patch_path, new_path):
+    """Rebuild the new file from the old file and a patch; returns sha256 hex of the result"""
+    with open(patch_path, "rb") as f:
+        header = f.read(HEADER.size)
+        body = f.read()
+    if len(header) < HEADER.size:
+        raise DeltaError("Patch header truncated")
+    magic, old_size, new_size, old_hash, new_hash = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise DeltaError("Not a SysWatch delta patch")
+    if file_sha256(old_path) != old_hash:
+        raise DeltaError("Installed file does not match the patch base")
+
+    try:
+        ops = memoryview(zlib.decompress(body))
+    except zlib.error as e:
+        raise DeltaError(f"Corrupt patch body: {e}")
+
+    digest = hashlib.sha256()
+    written = 0
+    pos = 0
+    with open(old_path, "rb") as old, open(new_path, "wb") as out:
+        while pos < len(ops):
+            op = ops[pos]
+            if op == OP_COPY:
+                offset, length = struct.unpack_from(">QI", ops, pos + 1)
+                pos += 13
+                if offset + length > old_size:
+                    raise DeltaError("Copy past end of base file")
+                old.seek(offset)
+                data = old.read(length)
+            elif op == OP_INSERT:
+                (length,) = struct.unpack_from(">I", ops, pos + 1)
+                data = ops[pos + 5:pos + 5 + length]
+                pos += 5 + length
+                if len(data) != length:
+                    raise DeltaError("Insert past end of patch")
+            else:
+                raise DeltaError(f"Unknown patch op {op}")
+            out.write(data)
+            digest.update(data)
+            written += length
+
+    if written != new_size or digest.digest() != new_hash:
+        raise DeltaError("Patched file failed verification")
+    return digest.hexdigest()
@@ -0,0 +1,189 @@
+import asyncio
+import base64
+import itertools
+
+DEFAULT_WINDOW = 256 * 1024
+DEFAULT_CHUNK = 32 * 1024
+
+class ChannelError(Exception):
+    pass
+
+class Channel:
+    """One logical stream over the agent connection with credit-based flow control
+
+    A sender may have at most `credit` bytes in flight; the receiver hands
+    credit back as it consumes data, so a slow consumer stalls only its own
+    channel. Each writer keeps at most one chunk queued on the connection, so
+    concurrent channels take turns chunk by chunk.
+
+    Closing is per direction: a clean channel_close from the peer ends its
+    stream (and may carry result fields), and the channel is forgotten once
+    both sides have closed.
+    """
+
+    def __init__(self, mux, channel_id, kind, meta):
+        self.mux = mux
+        self.id = channel_id
+        self.kind = kind
+        self.meta = meta or {}
+        self.credit = mux.window
+        self.credit_changed = asyncio.Event()
+        self.inbound = asyncio.Queue()
+        self.unacknowledged = 0
+        self.error = None
+        self.closed = False
+        self.remote_closed = False
+
+    async def write(self, data, **fields):
+        """Send data in chunk_size pieces; `fields` ride along on every chunk message"""
+        view = memoryview(data).cast("B")
+        for start in range(0, len(view), self.mux.chunk_size):
+            chunk = view[start:start + self.mux.chunk_size]
+            while self.credit < len(chunk):
+                if self.error:
+                    raise self.error
+                self.credit_changed.clear()
+                await self.credit_changed.wait()
+            if self.error:
+                raise self.error
+            self.credit -= len(chunk)
+            await self.mux.send({
+                **fields,
+                "type": "channel_data",
+                "channel": self.id,
+                "data": self.mux.pack(chunk)
+            })
+
+    async def close(self, error=None, **fields):
+        """End our side of the stream; with `error` the peer treats it as aborted"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.remote_closed or error:
+            self.mux.channels.pop(self.id, None)
+        message = {**fields, "type": "channel_close", "channel": self.id}
+        if error:
+            message["error"] = str(error)
+        await self.mux.send(message)
+
+    async def read_frame(self):
+        """Next channel_data message (data already decoded), or the peer's channel_close at the end"""
+        frame = await self.inbound.get()
+        if isinstance(frame, Exception):
+            raise frame
+        if frame["type"] == "channel_data" and frame["data"]:
+            # Hand credit back in batches rather than one message per chunk
+            self.unacknowledged += len(frame["data"])
+            if self.unacknowledged >= self.mux.window // 4:
+                await self.mux.send({"type": "channel_window", "channel": self.id, "credit": self.unacknowledged})
+                self.unacknowledged = 0
+        return frame
+
+    async def read(self):
+        """Next chunk of data, or b"" once the peer has closed the channel"""
+        frame = await self.read_frame()
+        return frame.get("data", b"")
+
+    def end(self, message):
+        self.remote_closed = True
+        # The peer won't read any more either, so stop our writers
+        self.error = ChannelError("Channel closed by peer")
+        self.credit_changed.set()
+        self.inbound.put_nowait(message)
+
+    def fail(self, error):
+        self.remote_closed = True
+        self.error = error
+        self.credit_changed.set()
+        self.inbound.put_nowait(error)
+
+class ChannelMux:
+    """Multiplexes logical channels over one connection's message stream
+
+    Agent-opened channels use odd ids and server-opened ones even ids, so the
+    two ends never collide. Handlers registered with on() receive channels the
+    server opens.
+    """
+
+    def __init__(self, send, binary, window=DEFAULT_WINDOW, chunk_size=DEFAULT_CHUNK):
+        self.send = send
+        self.binary = binary
+        self.window = window
+        self.chunk_size = min(chunk_size, window)
+        self.channels = {}
+        self.handlers = {}
+        self.tasks = set()
+        self._ids = itertools.count(1, 2)
+
+    def on(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def pack(self, chunk):
+        # Binary frames carry raw bytes, JSON frames carry base64
+        return chunk if self.binary else base64.b64encode(chunk).decode("ascii")
+
+    def unpack(self, data):
+        return base64.b64decode(data) if isinstance(data, str) else data
+
+    async def open(self, kind, meta=None):
+        channel = Channel(self, next(self._ids), kind, meta)
+        self.channels[channel.id] = channel
+        await self.send({"type": "channel_open", "channel": channel.id, "kind": kind, "meta": channel.meta})
+        return channel
+
+    def handle(self, message):
+        """Route a channel_* message from the server"""
+        kind = message["type"]
+        channel = self.channels.get(message.get("channel"))
+        if kind == "channel_open":
+            self.accept(message)
+        elif channel is None:
+            return
+        elif kind == "channel_data":
+            message["data"] = self.unpack(message["data"])
+            channel.inbound.put_nowait(message)
+        elif kind == "channel_window":
+            channel.credit += int(message.get("credit", 0))
+            channel.credit_changed.set()
+        elif kind == "channel_close":
+            if message.get("error"):
+                # An abort ends both directions
+                self.channels.pop(channel.id, None)
+                channel.closed = True
+                channel.fail(ChannelError(message["error"]))
+            else:
+                if channel.closed:
+                    self.channels.pop(channel.id, None)
+                channel.end(message)
+
+    def accept(self, message):
+        channel = Channel(self, message["channel"], message.get("kind"), message.get("meta"))
+        handler = self.handlers.get(channel.kind)
+        if handler is None:
+            task = asyncio.create_task(self.send({
+                "type": "channel_close",
+                "channel": channel.id,
+                "error": f"Unknown channel kind: {channel.kind}"
+            }))
+        else:
+            self.channels[channel.id] = channel
+            task = asyncio.create_task(self.run_handler(handler, channel))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_handler(self, handler, channel):
+        try:
+            await handler(channel)
+        except Exception as e:
+            print(f"Channel {channel.kind} failed: {e}")
+            try:
+                await channel.close(e)
+            except Exception:
+                pass
+
+    def close_all(self, error):
+        for channel in list(self.channels.values()):
+            channel.fail(error)
+        self.channels.clear()
+        for task in self.tasks:
+            task.cancel()
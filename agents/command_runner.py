@@ -0,0 +1,249 @@
+import asyncio
+import codecs
+import locale
+import time
+
+import psutil
+
+TRUNCATION_MARKER = "\n[output truncated after {} bytes]\n"
+
+async def kill_process_tree(process):
+    """Kill a subprocess and every descendant it spawned"""
+    if process is None or process.returncode is not None:
+        return
+    try:
+        parent = psutil.Process(process.pid)
+        children = parent.children(recursive=True)
+    except psutil.NoSuchProcess:
+        children = []
+    for child in children:
+        try:
+            child.kill()
+        except psutil.NoSuchProcess:
+            pass
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+    try:
+        await asyncio.wait_for(process.wait(), timeout=5)
+    except asyncio.TimeoutError:
+        print(f"Process {process.pid} did not exit after kill")
+
+class CommandOutput:
+    """Capture or stream one command's stdout/stderr under a size cap
+
+    If a streamed chunk can't be sent (the agent disconnected), streaming
+    stops and the rest of the output, including that chunk, is captured into
+    the final result instead, which is spooled with the command_result.
+    """
+
+    def __init__(self, on_output=None, max_output=1024 * 1024, flush_size=16 * 1024):
+        self.on_output = on_output
+        self.max_output = max_output
+        self.flush_size = flush_size
+        encoding = locale.getpreferredencoding(False) or "utf-8"
+        self.decoders = {
+            "stdout": codecs.getincrementaldecoder(encoding)(errors="replace"),
+            "stderr": codecs.getincrementaldecoder(encoding)(errors="replace")
+        }
+        self.buffers = {"stdout": [], "stderr": []}
+        self.buffered = {"stdout": 0, "stderr": 0}
+        self.total = 0
+        self.truncated = False
+        self.seq = 0
+        self.stream_error = None
+        self.last_flush = time.monotonic()
+
+    async def pump(self, stream, name):
+        """Read a pipe until EOF; output past the cap is drained and dropped"""
+        while True:
+            data = await stream.read(4096)
+            if not data:
+                break
+            await self.write(name, data)
+        text = self.decoders[name].decode(b"", final=True)
+        if text:
+            self.buffers[name].append(text)
+
+    async def write(self, name, data):
+        if self.truncated:
+            return
+        room = self.max_output - self.total
+        if len(data) > room:
+            data = data[:room]
+            self.truncated = True
+        self.total += len(data)
+        self.buffers[name].append(self.decoders[name].decode(data))
+        self.buffered[name] += len(data)
+        if self.truncated:
+            self.buffers[name].append(TRUNCATION_MARKER.format(self.max_output))
+
+        if self.on_output and (self.buffered[name] >= self.flush_size or self.truncated):
+            await self.flush(name)
+
+    async def flush(self, name=None):
+        """Send buffered output as sequence-numbered command_output chunks"""
+        if not self.on_output:
+            return
+        self.last_flush = time.monotonic()
+        for stream_name in ([name] if name else ["stdout", "stderr"]):
+            if not self.buffers[stream_name]:
+                continue
+            data = "".join(self.buffers[stream_name])
+            try:
+                await self.on_output({"seq": self.seq + 1, "stream": stream_name, "data": data})
+            except Exception as e:
+                # Keep the unsent text buffered and capture from here on; never fail the command
+                print(f"Streaming command output failed, capturing the rest: {e}")
+                self.stream_error = str(e)
+                self.on_output = None
+                return
+            self.seq += 1
+            self.buffers[stream_name] = []
+            self.buffered[stream_name] = 0
+
+    async def flush_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self.last_flush >= interval:
+                await self.flush()
+
+    def result(self):
+        if self.on_output:
+            return {"streamed": True, "chunks": self.seq, "bytes": self.total, "truncated": self.truncated}
+        result = {
+            "stdout": "".join(self.buffers["stdout"]),
+            "stderr": "".join(self.buffers["stderr"]),
+            "truncated": self.truncated
+        }
+        if self.stream_error:
+            # stdout/stderr hold only what came after the last chunk the server received
+            result.update(streamed=False, chunks_sent=self.seq, stream_error=self.stream_error)
+        return result
+
+class CommandRunner:
+    """Run remote commands as asyncio subprocesses with bounded concurrency"""
+
+    def __init__(self, max_concurrent=4, max_output=1024 * 1024, flush_size=16 * 1024, flush_interval=0.5):
+        self.max_concurrent = max_concurrent
+        self.max_output = max_output
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.running = {}
+
+    async def run(self, command_id, argv, timeout=30, on_output=None, max_output=None):
+        """Run a command and return its result dict; registered for cancellation while pending
+
+        With on_output set, output is streamed as chunks and the result only
+        carries the exit status; otherwise output is captured up to the cap.
+        """
+        self.running[command_id] = asyncio.current_task()
+        process = None
+        output = CommandOutput(on_output, max_output or self.max_output, self.flush_size)
+        flusher = None
+        try:
+            async with self.semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    *argv,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                if on_output:
+                    flusher = asyncio.create_task(output.flush_periodically(self.flush_interval))
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        output.pump(process.stdout, "stdout"),
+                        output.pump(process.stderr, "stderr"),
+                        process.wait()
+                    ),
+                    timeout=timeout
+                )
+                if flusher:
+                    flusher.cancel()
+                await output.flush()
+                result = output.result()
+                result["returncode"] = process.returncode
+                return result
+        except asyncio.TimeoutError:
+            await self.kill_process_tree(process)
+            await self.flush_partial(output)
+            return {"error": "Command timed out"}
+        except asyncio.CancelledError:
+            await self.kill_process_tree(process)
+            await self.flush_partial(output)
+            return {"error": "Command cancelled"}
+        except Exception as e:
+            await self.kill_process_tree(process)
+            return {"error": str(e)}
+        finally:
+            if flusher:
+                flusher.cancel()
+            self.running.pop(command_id, None)
+
+    async def run_pooled(self, command_id, pool, command, session=None, timeout=30, on_output=None,
+                         max_output=None, env=None, cwd=None):
+        """Run a command in a warm shell from a ShellPool; same result shape as run()
+
+        Without `session` the command runs isolated in any idle shell; with it,
+        the named session's shell keeps its environment and directory between
+        commands. A shell whose command times out or is cancelled is killed and
+        replaced rather than reused.
+        """
+        self.running[command_id] = asyncio.current_task()
+        output = CommandOutput(on_output, max_output or self.max_output, self.flush_size)
+        flusher = None
+        shell = None
+        healthy = False
+        try:
+            async with self.semaphore:
+                shell = await pool.acquire(session, env, cwd)
+                if on_output:
+                    flusher = asyncio.create_task(output.flush_periodically(self.flush_interval))
+                returncode = await asyncio.wait_for(
+                    shell.execute(command, output, isolated=session is None),
+                    timeout=timeout
+                )
+                healthy = True
+                if flusher:
+                    flusher.cancel()
+                await output.flush()
+                result = output.result()
+                result["returncode"] = returncode
+                if session is not None:
+                    result["session"] = session
+                return result
+        except asyncio.TimeoutError:
+            await self.flush_partial(output)
+            return {"error": "Command timed out"}
+        except asyncio.CancelledError:
+            await self.flush_partial(output)
+            return {"error": "Command cancelled"}
+        except Exception as e:
+            return {"error": str(e)}
+        finally:
+            if flusher:
+                flusher.cancel()
+            if shell:
+                await pool.release(shell, healthy)
+            self.running.pop(command_id, None)
+
+    async def flush_partial(self, output):
+        """Deliver whatever streamed output arrived before a command was stopped"""
+        try:
+            await output.flush()
+        except Exception as e:
+            print(f"Failed to flush command output: {e}")
+
+    def cancel(self, command_id):
+        """Cancel a queued or running command; returns False if it is unknown"""
+        task = self.running.get(command_id)
+        if not task or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def kill_process_tree(self, process):
+        await kill_process_tree(process)
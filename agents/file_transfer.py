@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import os
+import zlib
+
+class FileTransferError(Exception):
+    pass
+
+def check_path(path):
+    if not path or not os.path.isabs(path):
+        raise FileTransferError(f"An absolute path is required, got {path!r}")
+    return os.path.normpath(path)
+
+def hash_prefix(f, length, digest, view):
+    """Feed the first `length` bytes of an open file into `digest`, reusing `view`"""
+    f.seek(0)
+    remaining = length
+    while remaining > 0:
+        n = f.readinto(view[:min(len(view), remaining)])
+        if not n:
+            raise FileTransferError("File is shorter than the resume offset")
+        digest.update(view[:n])
+        remaining -= n
+
+class FileTransfer:
+    """Serve file_get and file_put channels without loading files into memory
+
+    Files move in channel-sized chunks read into one reused buffer. Every chunk
+    carries its offset and CRC-32, the finished transfer is checked against a
+    SHA-256 of the whole file, and an interrupted push leaves a .part file the
+    server can resume from.
+    """
+
+    def register(self, mux):
+        mux.on("file_get", self.serve_get)
+        mux.on("file_put", self.receive_put)
+
+    async def serve_get(self, channel):
+        path = check_path(channel.meta.get("path"))
+        offset = int(channel.meta.get("offset", 0))
+        loop = asyncio.get_running_loop()
+        buffer = bytearray(channel.mux.chunk_size)
+        view = memoryview(buffer)
+        digest = hashlib.sha256()
+
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if offset > size:
+                raise FileTransferError(f"Resume offset {offset} is past the end of the file ({size} bytes)")
+            # The whole-file hash also covers the part the server already has
+            await loop.run_in_executor(None, hash_prefix, f, offset, digest, view)
+            position = offset
+            while True:
+                n = await loop.run_in_executor(None, f.readinto, view)
+                if not n:
+                    break
+                chunk = view[:n]
+                digest.update(chunk)
+                # write() returns once the chunk is on the wire, so the buffer can be reused
+                await channel.write(chunk, offset=position, size=size, crc=zlib.crc32(chunk))
+                position += n
+
+        await channel.close(size=position, sha256=digest.hexdigest())
+
+    async def receive_put(self, channel):
+        meta = channel.meta
+        path = check_path(meta.get("path"))
+        offset = int(meta.get("offset", 0))
+        partial = path + ".part"
+        loop = asyncio.get_running_loop()
+        digest = hashlib.sha256()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if offset and (not os.path.exists(partial) or os.path.getsize(partial) < offset):
+            raise FileTransferError("No partial file to resume from")
+
+        with open(partial, "r+b" if offset else "wb") as f:
+            if offset:
+                view = memoryview(bytearray(min(offset, channel.mux.chunk_size)))
+                await loop.run_in_executor(None, hash_prefix, f, offset, digest, view)
+                f.truncate(offset)
+                f.seek(offset)
+            position = offset
+            while True:
+                frame = await channel.read_frame()
+                if frame["type"] == "channel_close":
+                    break
+                chunk = frame["data"]
+                # Anything already written is intact, so a failure here leaves a resumable .part
+                if frame.get("offset") != position:
+                    raise FileTransferError(f"Expected data at offset {position}, got {frame.get('offset')}")
+                if zlib.crc32(chunk) != frame.get("crc"):
+                    raise FileTransferError(f"Checksum mismatch in chunk at offset {position}")
+                await loop.run_in_executor(None, f.write, chunk)
+                digest.update(chunk)
+                position += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        sha256 = digest.hexdigest()
+        if position != meta.get("size", position) or sha256 != meta.get("sha256", sha256):
+            os.remove(partial)
+            raise FileTransferError(f"File hash mismatch after transfer ({position} bytes, sha256 {sha256})")
+        os.replace(partial, path)
+        if meta.get("executable"):
+            os.chmod(path, 0o755)
+        print(f"Received file {path} ({position} bytes)")
+        await channel.close(size=position, sha256=sha256)
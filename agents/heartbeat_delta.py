@@ -0,0 +1,75 @@
+DEFAULT_EPSILONS = {
+    "cpu_percent": 0.5,
+    "memory_percent": 0.2,
+    "disk_percent": 0.1,
+    "memory_used": 1024 * 1024,
+    "disk_used": 16 * 1024 * 1024
+}
+
+# Fields that change on every sample and are only worth sending in keyframes
+KEYFRAME_ONLY = {"timestamp"}
+
+def flatten_metrics(metrics, prefix=""):
+    """Flatten nested metric dicts into dotted keys (network_io.bytes_sent)"""
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+class HeartbeatDeltaEncoder:
+    """Encode heartbeat metrics as deltas against the last values sent, with periodic keyframes"""
+
+    def __init__(self, keyframe_interval=20, epsilons=None):
+        self.keyframe_interval = keyframe_interval
+        self.epsilons = dict(DEFAULT_EPSILONS)
+        if epsilons:
+            self.epsilons.update(epsilons)
+        self.sent = {}
+        self.seq = 0
+        self.since_keyframe = 0
+        self.keyframe_pending = True
+
+    def request_keyframe(self):
+        """Force the next heartbeat to carry the full metrics"""
+        self.keyframe_pending = True
+
+    def encode(self, metrics):
+        """Return the heartbeat fields for these metrics: a keyframe or a delta"""
+        self.seq += 1
+        flat = flatten_metrics(metrics)
+
+        if (self.keyframe_pending or "error" in metrics
+                or self.since_keyframe + 1 >= self.keyframe_interval):
+            self.keyframe_pending = False
+            self.since_keyframe = 0
+            self.sent = flat
+            return {"seq": self.seq, "keyframe": True, "metrics": metrics}
+
+        self.since_keyframe += 1
+        delta = {}
+        for key, value in flat.items():
+            if key in KEYFRAME_ONLY:
+                continue
+            if self.changed(key, self.sent.get(key), value):
+                delta[key] = value
+                self.sent[key] = value
+
+        removed = [key for key in self.sent if key not in flat]
+        for key in removed:
+            del self.sent[key]
+
+        message = {"seq": self.seq, "delta": delta}
+        if removed:
+            message["removed"] = removed
+        return message
+
+    def changed(self, key, old, new):
+        if old is None:
+            return True
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            return abs(new - old) > self.epsilons.get(key, 0)
+        return old != new
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import platform
+import re
+import struct
+import sys
+import time
+
+import psutil
+
+# SMBIOS type 17 "Memory Type" values
+SMBIOS_MEMORY_TYPES = {
+    0x0F: "SDRAM", 0x12: "DDR", 0x13: "DDR2", 0x14: "DDR2 FB-DIMM", 0x18: "DDR3",
+    0x1A: "DDR4", 0x1B: "LPDDR", 0x1C: "LPDDR2", 0x1D: "LPDDR3", 0x1E: "LPDDR4",
+    0x22: "DDR5", 0x23: "LPDDR5"
+}
+
+SSD_MODEL_PATTERN = re.compile(r"SSD|Solid|NVMe|M\.2", re.IGNORECASE)
+
+def parse_smbios_structures(data):
+    """Split a raw SMBIOS table into (type, formatted_bytes, strings) tuples"""
+    structures = []
+    offset = 0
+    while offset + 4 <= len(data):
+        struct_type, length = data[offset], data[offset + 1]
+        if length < 4 or offset + length > len(data):
+            break
+        formatted = data[offset:offset + length]
+
+        # The string set follows the formatted area and ends with a double NUL
+        end = data.find(b"\x00\x00", offset + length)
+        if end < 0:
+            break
+        raw_strings = data[offset + length:end]
+        strings = [s.decode("ascii", errors="replace").strip() for s in raw_strings.split(b"\x00") if s]
+        structures.append((struct_type, formatted, strings))
+
+        offset = end + 2
+        if struct_type == 127:  # End-of-table
+            break
+    return structures
+
+def parse_memory_modules(structures):
+    """Extract installed memory modules from SMBIOS type 17 structures"""
+    modules = []
+    for struct_type, formatted, strings in structures:
+        if struct_type != 17 or len(formatted) < 0x15:
+            continue
+        size = struct.unpack_from("<H", formatted, 0x0C)[0]
+        if size in (0, 0xFFFF):
+            continue  # Empty slot or unknown size
+        if size == 0x7FFF and len(formatted) >= 0x20:
+            size_mb = struct.unpack_from("<I", formatted, 0x1C)[0] & 0x7FFFFFFF
+        elif size & 0x8000:
+            size_mb = (size & 0x7FFF) // 1024
+        else:
+            size_mb = size
+
+        def string_at(index_offset):
+            index = formatted[index_offset] if len(formatted) > index_offset else 0
+            return strings[index - 1] if 0 < index <= len(strings) else None
+
+        speed = struct.unpack_from("<H", formatted, 0x15)[0] if len(formatted) >= 0x17 else 0
+        modules.append({
+            "size_mb": size_mb,
+            "type": SMBIOS_MEMORY_TYPES.get(formatted[0x12], f"Type {formatted[0x12]}"),
+            "speed_mts": speed or None,
+            "locator": string_at(0x10),
+            "manufacturer": string_at(0x17)
+        })
+    return modules
+
+class InventoryCollector:
+    """Collect hardware inventory straight from the OS, cached with a content hash"""
+
+    def __init__(self, max_age=24 * 3600):
+        self.max_age = max_age
+        self.cached = None
+        self.cached_hash = None
+        self.collected_at = 0
+
+    def get(self, refresh=False):
+        """Return (inventory, hash), re-collecting at most once per max_age"""
+        if refresh or self.cached is None or time.time() - self.collected_at > self.max_age:
+            self.cached = self.collect()
+            self.cached_hash = hashlib.sha256(json.dumps(self.cached, sort_keys=True).encode("utf-8")).hexdigest()
+            self.collected_at = time.time()
+        return self.cached, self.cached_hash
+
+    def collect(self):
+        try:
+            if sys.platform.startswith('win'):
+                inventory = self.collect_windows()
+            else:
+                inventory = self.collect_linux()
+        except Exception as e:
+            print(f"Inventory collection failed: {e}")
+            inventory = {}
+
+        # Flat summary fields the dashboard already displays
+        modules = inventory.get("memory_modules") or []
+        if modules:
+            inventory["memory_type"] = modules[0]["type"]
+        disks = inventory.get("disks") or []
+        if disks:
+            inventory["disk_drives"] = [f"{d['model']} ({d['kind']})" for d in disks]
+        return inventory
+
+    def read_sysfs(self, path):
+        try:
+            with open(path, "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def collect_linux(self):
+        inventory = {}
+        dmi = "/sys/class/dmi/id"
+        vendor = self.read_sysfs(f"{dmi}/sys_vendor")
+        product = self.read_sysfs(f"{dmi}/product_name")
+        if vendor and product:
+            inventory["computer_model"] = f"{vendor} {product}"
+        bios_version = self.read_sysfs(f"{dmi}/bios_version")
+        if bios_version:
+            inventory["bios_version"] = bios_version
+        bios_vendor = self.read_sysfs(f"{dmi}/bios_vendor")
+        if bios_vendor:
+            inventory["bios_vendor"] = bios_vendor
+
+        cpu_model = self.linux_cpu_model()
+        if cpu_model:
+            inventory["cpu_model"] = cpu_model
+        inventory["cpu_cores"] = psutil.cpu_count(logical=False)
+        inventory["cpu_threads"] = psutil.cpu_count()
+
+        # The raw SMBIOS table is only readable by root
+        try:
+            with open("/sys/firmware/dmi/tables/DMI", "rb") as f:
+                inventory["memory_modules"] = parse_memory_modules(parse_smbios_structures(f.read()))
+        except OSError:
+            pass
+
+        inventory["disks"] = self.linux_disks()
+        return inventory
+
+    def linux_cpu_model(self):
+        try:
+            with open("/proc/cpuinfo", "r") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key.strip() in ("model name", "Model", "Hardware") and value.strip():
+                        return value.strip()
+        except OSError:
+            pass
+        return platform.processor() or None
+
+    def linux_disks(self):
+        disks = []
+        try:
+            names = sorted(os.listdir("/sys/block"))
+        except OSError:
+            return disks
+        for name in names:
+            if name.startswith(("loop", "ram", "zram", "dm-", "md", "sr", "fd")):
+                continue
+            base = f"/sys/block/{name}"
+            sectors = self.read_sysfs(f"{base}/size")
+            if not sectors or int(sectors) == 0:
+                continue
+            rotational = self.read_sysfs(f"{base}/queue/rotational")
+            model = self.read_sysfs(f"{base}/device/model") or name
+            disks.append({
+                "name": name,
+                "model": model,
+                "size": int(sectors) * 512,
+                "kind": "HDD" if rotational == "1" else "SSD"
+            })
+        return disks
+
+    def collect_windows(self):
+        import winreg
+
+        inventory = {}
+        try:
+            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"HARDWARE\DESCRIPTION\System\BIOS")
+            values = {}
+            for name in ("SystemManufacturer", "SystemProductName", "BIOSVersion", "BIOSVendor"):
+                try:
+                    values[name] = str(winreg.QueryValueEx(key, name)[0]).strip()
+                except OSError:
+                    pass
+            winreg.CloseKey(key)
+            if values.get("SystemManufacturer") and values.get("SystemProductName"):
+                inventory["computer_model"] = f"{values['SystemManufacturer']} {values['SystemProductName']}"
+            if values.get("BIOSVersion"):
+                inventory["bios_version"] = values["BIOSVersion"]
+            if values.get("BIOSVendor"):
+                inventory["bios_vendor"] = values["BIOSVendor"]
+        except OSError:
+            pass
+
+        try:
+            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"HARDWARE\DESCRIPTION\System\CentralProcessor\0")
+            inventory["cpu_model"] = str(winreg.QueryValueEx(key, "ProcessorNameString")[0]).strip()
+            winreg.CloseKey(key)
+        except OSError:
+            pass
+        inventory["cpu_cores"] = psutil.cpu_count(logical=False)
+        inventory["cpu_threads"] = psutil.cpu_count()
+
+        smbios = self.windows_smbios_table()
+        if smbios:
+            inventory["memory_modules"] = parse_memory_modules(parse_smbios_structures(smbios))
+
+        inventory["disks"] = self.windows_disks(winreg)
+        return inventory
+
+    def windows_smbios_table(self):
+        """Read the raw SMBIOS table via GetSystemFirmwareTable('RSMB')"""
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            provider = 0x52534D42  # 'RSMB'
+            size = kernel32.GetSystemFirmwareTable(provider, 0, None, 0)
+            if not size:
+                return None
+            buf = ctypes.create_string_buffer(size)
+            kernel32.GetSystemFirmwareTable(provider, 0, buf, size)
+            # RawSMBIOSData header: 4 version bytes + DWORD table length
+            length = struct.unpack_from("<I", buf.raw, 4)[0]
+            return buf.raw[8:8 + length]
+        except Exception as e:
+            print(f"Could not read SMBIOS table: {e}")
+            return None
+
+    def windows_disks(self, winreg):
+        disks = []
+        try:
+            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SYSTEM\CurrentControlSet\Services\disk\Enum")
+            count = winreg.QueryValueEx(key, "Count")[0]
+            for i in range(count):
+                instance = winreg.QueryValueEx(key, str(i))[0]
+                model = instance.split("\\")[1] if "\\" in instance else instance
+                try:
+                    device = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, f"SYSTEM\\CurrentControlSet\\Enum\\{instance}")
+                    model = winreg.QueryValueEx(device, "FriendlyName")[0]
+                    winreg.CloseKey(device)
+                except OSError:
+                    pass
+                disks.append({
+                    "name": f"PhysicalDrive{i}",
+                    "model": model,
+                    "kind": "SSD" if SSD_MODEL_PATTERN.search(model) else "HDD"
+                })
+            winreg.CloseKey(key)
+        except OSError:
+            pass
+        return disks
@@ -1,15 +1,44 @@
 #!/usr/bin/env python3
 import asyncio
+import base64
+import hashlib
 import websockets
 import json
+import multiprocessing
 import socket
 import platform
 import subprocess
 import sys
 import os
 import psutil
+import random
 import time
-from agent_updater import AgentUpdater
+from agent_queries import QueryHandler
+from agent_telemetry import AgentTelemetry
+from agent_updater import AgentUpdater, server_mirror_url
+from channels import ChannelMux
+from command_runner import CommandRunner
+from file_transfer import FileTransfer
+from heartbeat_delta import HeartbeatDeltaEncoder
+from inventory import InventoryCollector
+from metrics_exporter import MetricsExporter
+from metrics_sampler import MetricsSampler
+from offline_spool import OfflineSpool
+from outbound_queue import OutboundQueue
+from python_workers import PythonWorkerPool
+from reconnect_backoff import ReconnectBackoff
+from rollout import RolloutPolicy
+from shell_pool import ShellPool, BASH_ARGV
+import wire_codec
+
+# Release polling: without server pushes poll every 2h, otherwise once a day as a safety net
+RELEASE_POLL_INTERVAL = 2 * 3600
+RELEASE_SAFETY_POLL = 24 * 3600
+RELEASE_PUSH_SPREAD = 600  # Seconds over which agents spread checks after a release push
+HEALTH_REPORT_DELAY = 60  # Stay connected this long after an update before reporting healthy
+HEARTBEAT_INTERVAL = 15
+INVENTORY_REFRESH = 24 * 3600
+CHANNEL_RESULT_THRESHOLD = 64 * 1024  # Query results bigger than this stream over a channel
 
 class LinuxAgent:
     def __init__(self, server_url="ws://localhost:3000"):
@@ -17,19 +46,73 @@ class LinuxAgent:
         self.client_id = None
         self.hostname = socket.gethostname()
         self.platform = f"{platform.system()} {platform.release()}"
-        self.updater = AgentUpdater()
+        self.updater = AgentUpdater(cache_path=os.path.expanduser("~/.local/share/SysWatch/update-cache.json"))
+        self.updater.set_mirrors([server_mirror_url(server_url)])
+        self.release_announced = asyncio.Event()
+        self.rollout = RolloutPolicy()
+        self.rollout_changed = asyncio.Event()
+        self.update_in_progress = False
+        self.health_task = None
+        self.stats_every = 0
+        self.exporter = None
+        self.heartbeat_count = 0
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self.command_runner = CommandRunner()
+        self.shell_pool = ShellPool(BASH_ARGV, "bash")
+        self.warm_shells = False
+        self.python_workers = PythonWorkerPool()
+        self.command_tasks = set()
+        self.heartbeat_encoder = None
+        self.wire_format = "json"
+        self.connected = False
+        self.websocket = None
+        self.outbound = None
+        self.channels = None
+        self.file_transfer = FileTransfer()
+        self.replay_task = None
+        self.backoff = ReconnectBackoff()
+        self.session = {}
+        self.inventory = InventoryCollector()
+        self.queries = QueryHandler(self)
+        
+        # Metrics and results produced while disconnected are spooled to disk and replayed
+        self.spool = OfflineSpool(os.path.expanduser("~/.local/share/SysWatch/spool"))
+        
+        # Metrics are sampled on a background thread so heartbeats never block the loop
+        self.telemetry = AgentTelemetry()
+        self.telemetry.gauge("outbound_queue_depth", lambda: self.outbound.depth() if self.outbound else 0)
+        self.sampler = MetricsSampler(disk_path='/', telemetry=self.telemetry)
         
-        # Initialize CPU measurement for more accurate readings
-        psutil.cpu_percent(interval=None)
+        # Inventory is read at registration; refresh it daily in the background so that stays cheap
+        self.sampler.add_collector("inventory", lambda: self.inventory.get(refresh=True),
+                                   INVENTORY_REFRESH, "slow", delay=INVENTORY_REFRESH)
         
     async def connect(self):
+        # Start background metrics sampling
+        self.sampler.start()
+        
+        # Optional localhost Prometheus endpoint served from the sampler cache
+        if os.environ.get("SYSWATCH_METRICS_PORT"):
+            self.set_metrics_exporter(int(os.environ["SYSWATCH_METRICS_PORT"]))
+        
         # Start periodic update check
         update_task = asyncio.create_task(self.periodic_update_check())
+        offline_task = asyncio.create_task(self.record_offline_metrics())
+        lag_task = asyncio.create_task(self.telemetry.monitor_loop_lag())
+        self.python_workers.start()
+        
+        # Spread initial connections so a fleet restart doesn't hit the server at once
+        await asyncio.sleep(self.backoff.initial_delay())
         
         while True:
             try:
-                async with websockets.connect(self.server_url) as websocket:
+                async with websockets.connect(self.server_url, compression="deflate") as websocket:
                     print(f"Connected to server: {self.server_url}")
+                    self.websocket = websocket
+                    
+                    # Every outgoing message goes through one writer, most urgent first
+                    self.outbound = OutboundQueue(websocket, self.write_message, self.telemetry)
+                    writer_task = asyncio.create_task(self.outbound.run())
                     
                     # Register with server
                     await self.register(websocket)
@@ -40,45 +123,220 @@ class LinuxAgent:
                     # Listen for messages
                     try:
                         async for message in websocket:
-                            await self.handle_message(websocket, json.loads(message))
+                            message = self.decode_message(message)
+                            with self.telemetry.timer(f"handler.{message.get('type')}_ms"):
+                                await self.handle_message(websocket, message)
                     except websockets.exceptions.ConnectionClosed:
                         print("Connection closed by server")
                     finally:
+                        self.connected = False
+                        self.websocket = None
                         heartbeat_task.cancel()
+                        writer_task.cancel()
+                        self.outbound.close(ConnectionError("Connection closed"))
+                        self.outbound = None
+                        if self.channels:
+                            self.channels.close_all(ConnectionError("Connection closed"))
+                            self.channels = None
+                        if self.replay_task:
+                            self.replay_task.cancel()
                         
             except Exception as e:
                 print(f"Connection failed: {e}")
-                print("Retrying in 10 seconds...")
-                await asyncio.sleep(10)
+            
+            delay = self.backoff.next_delay()
+            print(f"Retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
     
     async def periodic_update_check(self):
-        """Check for updates every 2 hours and auto-update"""
+        """Poll for updates on a per-host jittered schedule and auto-update"""
         while True:
             try:
-                # Check for manual update trigger file
-                if os.path.exists('/tmp/syswatch-update-now'):
-                    os.remove('/tmp/syswatch-update-now')
-                    print("Manual update trigger detected")
-                    update_info = self.updater.check_for_updates()
-                    if update_info.get("has_update"):
-                        print(f"Manual update: {update_info['current_version']} -> {update_info['latest_version']}")
-                        if self.updater.download_and_update(update_info["download_url"]):
-                            print("Manual update successful, restarting...")
-                            self.updater.restart_agent()
-                
-                await asyncio.sleep(30)  # Check every 30 seconds for trigger file
+                # Once the server pushes release announcements, polling is only a safety net
+                interval = RELEASE_SAFETY_POLL if self.session.get("release_push") else RELEASE_POLL_INTERVAL
+                reason = await self.wait_for_update_poll(self.updater.poll_delay(interval))
+                if reason == "release":
+                    # Every agent hears the push at once; spread the resulting checks
+                    await asyncio.sleep(random.uniform(0, RELEASE_PUSH_SPREAD))
                 
-                # Regular 2-hour update check
-                await asyncio.sleep(2 * 3600 - 30)  # 2 hours minus the 30 seconds above
-                update_info = self.updater.check_for_updates()
+                update_info = await self.updater.check_for_updates_async()
                 if update_info.get("has_update"):
-                    print(f"Auto-update available: {update_info['current_version']} -> {update_info['latest_version']}")
-                    if self.updater.download_and_update(update_info["download_url"]):
-                        print("Auto-update successful, restarting...")
-                        self.updater.restart_agent()
+                    print(f"Auto-update available ({reason}): {update_info['current_version']} -> {update_info['latest_version']}")
+                    if await self.rollout_gate(update_info):
+                        await self.apply_update(update_info)
             except Exception as e:
                 print(f"Periodic update check failed: {e}")
     
+    async def rollout_gate(self, update_info):
+        """Wait until the server's rollout policy lets this host install; False to skip this release"""
+        delayed = False
+        while True:
+            self.rollout_changed.clear()
+            allowed, reason, wait = self.rollout.check(self.hostname)
+            if allowed:
+                delay = 0 if delayed else self.rollout.start_delay()
+                if not delay:
+                    return True
+                print(f"Rollout delay: installing in {delay:.0f} seconds")
+                delayed = True
+                wait = delay
+            else:
+                print(f"Update {update_info['latest_version']} deferred: {reason}")
+                await self.send_update_status("deferred", version=update_info["latest_version"], reason=reason)
+                if wait is None:
+                    return False
+            
+            # Re-evaluate once the wait is over, or sooner if the server changes the policy
+            try:
+                await asyncio.wait_for(self.rollout_changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def apply_update(self, update_info):
+        """Install an update and restart; the restarted agent reports its health"""
+        version = update_info["latest_version"]
+        # The periodic check and dashboard requests can race here; only one install runs
+        if self.update_in_progress:
+            print(f"Update to {version} skipped: an update is already in progress")
+            await self.send_update_status("in_progress", version=version, reason="Update already in progress")
+            return False
+        self.update_in_progress = True
+        try:
+            return await self.install_and_restart(update_info)
+        except Exception as e:
+            # Tell the server, so the rollout doesn't wait on this host's health report
+            self.updater.clear_pending_health()
+            await self.send_update_status("error", version=version, error=str(e))
+            raise
+        finally:
+            self.update_in_progress = False
+    
+    async def install_and_restart(self, update_info):
+        version = update_info["latest_version"]
+        await self.send_update_status("installing", version=version)
+        self.updater.record_pending_health(version)
+        if await self.updater.install_update_async(update_info, self.update_progress_reporter()):
+            print("Auto-update successful, restarting...")
+            await self.updater.restart_agent_async()
+            return True
+        
+        self.updater.clear_pending_health()
+        if self.updater.self_check_failed:
+            await self.send_update_health("failed", version, self.updater.current_version)
+        else:
+            await self.send_update_status("error", version=version, error="Update install failed")
+        return False
+    
+    async def report_update_health(self):
+        """After an update, report the new version healthy once it has stayed connected a while"""
+        pending = self.updater.pending_health()
+        if not pending:
+            return
+        await asyncio.sleep(HEALTH_REPORT_DELAY)
+        if not self.connected:
+            return  # Retried after the next registration
+        
+        # An unchanged version means the install was reverted before we restarted
+        status = "healthy" if self.updater.current_version == pending["target_version"] else "reverted"
+        await self.send_update_health(status, pending["target_version"], pending["previous_version"])
+        self.updater.clear_pending_health()
+    
+    async def send_update_status(self, status, **fields):
+        websocket = self.websocket
+        if websocket is None or not self.connected:
+            return
+        try:
+            await self.send_message(websocket, {"type": "update_status", "hostname": self.hostname, "status": status, **fields})
+        except Exception as e:
+            print(f"Failed to send update status: {e}")
+    
+    async def send_update_health(self, status, version, previous_version):
+        websocket = self.websocket
+        if websocket is None or not self.connected:
+            return
+        print(f"Reporting update health: {status} ({previous_version} -> {version})")
+        try:
+            await self.send_message(websocket, {
+                "type": "update_health",
+                "hostname": self.hostname,
+                "status": status,
+                "version": version,
+                "previous_version": previous_version
+            })
+        except Exception as e:
+            print(f"Failed to send update health: {e}")
+    
+    async def wait_for_update_poll(self, delay):
+        """Sleep until the next poll is due; returns why the wait ended"""
+        deadline = time.monotonic() + delay
+        while True:
+            # Check for manual update trigger file every 30 seconds
+            if os.path.exists('/tmp/syswatch-update-now'):
+                os.remove('/tmp/syswatch-update-now')
+                print("Manual update trigger detected")
+                return "manual"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "timer"
+            try:
+                await asyncio.wait_for(self.release_announced.wait(), timeout=min(30, remaining))
+                self.release_announced.clear()
+                return "release"
+            except asyncio.TimeoutError:
+                pass
+    
+    def announce_release(self, version):
+        """Wake the update loop if the server knows of a newer release"""
+        if version and self.updater.compare_versions(version, self.updater.current_version) > 0:
+            print(f"Server announced release {version}")
+            self.release_announced.set()
+    
+    def update_progress_reporter(self):
+        """Build a progress callback the updater thread uses to report download progress"""
+        loop = asyncio.get_running_loop()
+        
+        def report(downloaded, total):
+            websocket = self.websocket
+            if websocket is None or not self.connected:
+                return
+            asyncio.run_coroutine_threadsafe(self.send_message(websocket, {
+                "type": "update_status",
+                "hostname": self.hostname,
+                "status": "downloading",
+                "downloaded": downloaded,
+                "total": total
+            }), loop)
+        return report
+    
+    async def record_offline_metrics(self):
+        """Spool metric samples while disconnected so history has no gaps"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if not self.connected:
+                try:
+                    await self.spool.append_async({"kind": "metrics", "metrics": self.get_system_metrics()})
+                except Exception as e:
+                    print(f"Failed to spool metrics: {e}")
+    
+    async def replay_spool(self, websocket):
+        """Replay spooled records as compressed, rate-limited bulk batches"""
+        async def send_batch(data, count):
+            if self.wire_format != wire_codec.WIRE_FORMAT:
+                data = base64.b64encode(data).decode("ascii")
+            await self.send_message(websocket, {
+                "type": "spool_batch",
+                "hostname": self.hostname,
+                "encoding": "zlib+json",
+                "count": count,
+                "data": data
+            })
+        
+        try:
+            replayed = await self.spool.replay(send_batch)
+            print(f"Replayed {replayed} spooled records")
+        except Exception as e:
+            print(f"Spool replay interrupted: {e}")
+    
     async def register(self, websocket):
         system_info = self.get_system_info()
         
@@ -103,122 +361,195 @@ class LinuxAgent:
             "type": "register",
             "hostname": self.hostname,
             "platform": self.platform,
-            "system_info": system_info,
-            "agentVersion": version
+            "system_info_hash": self.system_info_hash(system_info),
+            "agentVersion": version,
+            "capabilities": {
+                "heartbeat_delta": True,
+                "wire_formats": [wire_codec.WIRE_FORMAT, "json"],
+                "offline_spool": True,
+                "inventory": True,
+                "release_push": True,
+                "agent_stats": True,
+                "channels": True,
+                "shell_sessions": True,
+                "python_exec": True,
+                "queries": self.queries.supported()
+            }
         }
-        await websocket.send(json.dumps(register_msg))
+        
+        # Resume the previous session, resending static info only if it changed
+        if self.session.get("resume_token"):
+            register_msg["resume_token"] = self.session["resume_token"]
+        if self.session.get("info_hash") != register_msg["system_info_hash"]:
+            register_msg["system_info"] = system_info
+        
+        # Hardware inventory is collected in-process and only sent when it changed
+        with self.telemetry.timer("collect_inventory_ms"):
+            inventory, inventory_hash = self.inventory.get()
+        register_msg["inventory_hash"] = inventory_hash
+        if self.session.get("inventory_hash") != inventory_hash:
+            register_msg["inventory"] = inventory
+        
+        # Delta heartbeats and binary frames stay off until the server accepts them
+        self.heartbeat_encoder = None
+        self.wire_format = "json"
+        await self.send_message(websocket, register_msg)
         print(f"Registered as {self.hostname} ({self.platform}) - Agent v{version}")
     
     async def heartbeat(self, websocket):
+        # Fixed-rate cadence: each beat is due one interval after the previous one was
+        # due, however long building and sending took; a late beat goes out at once
+        loop = asyncio.get_running_loop()
+        next_beat = loop.time()
         while True:
             try:
-                system_metrics = self.get_system_metrics()
                 heartbeat_msg = {
                     "type": "heartbeat",
                     "hostname": self.hostname,
-                    "metrics": system_metrics
+                    "metrics": self.get_system_metrics()
                 }
-                await websocket.send(json.dumps(heartbeat_msg))
-                await asyncio.sleep(15)  # Send heartbeat every 15 seconds
+                
+                # Self-telemetry rides along every few heartbeats when the server asks for it
+                self.heartbeat_count += 1
+                if self.stats_every and self.heartbeat_count % self.stats_every == 0:
+                    heartbeat_msg["agent_stats"] = self.telemetry.heartbeat_block()
+                
+                # Not awaited: a newer heartbeat replaces one still stuck behind other traffic
+                if self.outbound is None or self.outbound.websocket is not websocket:
+                    raise ConnectionError("Not connected")
+                self.outbound.put(heartbeat_msg, coalesce_key="heartbeat", prepare=self.encode_heartbeat)
+                next_beat = max(next_beat + self.heartbeat_interval, loop.time())
+                await asyncio.sleep(next_beat - loop.time())
             except Exception as e:
                 print(f"Heartbeat failed: {e}")
                 break
     
+    def encode_heartbeat(self, message):
+        """Delta-encode a heartbeat as it is written, so only heartbeats actually sent move the base"""
+        if self.heartbeat_encoder:
+            message.update(self.heartbeat_encoder.encode(message.pop("metrics")))
+        return message
+    
     async def handle_message(self, websocket, message):
         if message["type"] == "registered":
             self.client_id = message["id"]
             print(f"Assigned client ID: {self.client_id}")
+            self.connected = True
+            self.backoff.reset()
+            self.session = {
+                "resume_token": message.get("resume_token"),
+                "info_hash": message.get("info_hash"),
+                "inventory_hash": message.get("inventory_hash"),
+                "release_push": message.get("release_push", False)
+            }
+            self.rollout = RolloutPolicy(message.get("rollout"))
+            self.stats_every = (message.get("agent_stats") or {}).get("every", 0)
+            self.announce_release(message.get("latest_release"))
             
-        elif message["type"] == "command":
-            command_id = message["id"]
-            command = message["command"]
-            print(f"Executing command: {command}")
+            if self.updater.pending_health() and (self.health_task is None or self.health_task.done()):
+                self.health_task = asyncio.create_task(self.report_update_health())
             
-            try:
-                # Execute command with bash
-                result = subprocess.run(
-                    ["/bin/bash", "-c", command],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
+            if message.get("wire_format") == wire_codec.WIRE_FORMAT:
+                self.wire_format = wire_codec.WIRE_FORMAT
+                print(f"Using {wire_codec.WIRE_FORMAT} wire format")
+            
+            channel_config = message.get("channels")
+            if channel_config:
+                self.channels = ChannelMux(
+                    lambda msg: self.send_message(websocket, msg),
+                    binary=self.wire_format == wire_codec.WIRE_FORMAT,
+                    window=channel_config.get("window", 256 * 1024),
+                    chunk_size=channel_config.get("chunk", 32 * 1024)
                 )
-                
-                output = {
-                    "stdout": result.stdout,
-                    "stderr": result.stderr,
-                    "returncode": result.returncode
-                }
-                
-            except subprocess.TimeoutExpired:
-                output = {"error": "Command timed out"}
-            except Exception as e:
-                output = {"error": str(e)}
+                self.file_transfer.register(self.channels)
             
-            # Send result back
-            response = {
-                "type": "command_result",
-                "id": command_id,
-                "hostname": self.hostname,
-                "result": output
-            }
-            await websocket.send(json.dumps(response))
+            delta_config = message.get("heartbeat_delta")
+            if delta_config and delta_config.get("enabled"):
+                self.heartbeat_encoder = HeartbeatDeltaEncoder(
+                    keyframe_interval=delta_config.get("keyframe_interval", 20),
+                    epsilons=delta_config.get("epsilons")
+                )
+                print("Delta heartbeats enabled")
+            
+            if message.get("resend_info"):
+                system_info = self.get_system_info()
+                inventory, inventory_hash = self.inventory.get()
+                await self.send_message(websocket, {
+                    "type": "system_info",
+                    "hostname": self.hostname,
+                    "system_info": system_info,
+                    "system_info_hash": self.system_info_hash(system_info),
+                    "inventory": inventory,
+                    "inventory_hash": inventory_hash
+                })
+            
+            if message.get("spool_replay") and self.spool.has_pending():
+                self.replay_task = asyncio.create_task(self.replay_spool(websocket))
+            
+        elif message["type"] == "retry_after":
+            # Server is shedding load; it will close the connection after this
+            self.backoff.set_retry_after(message.get("seconds", 10), message.get("window", 0))
+            print(f"Server asked to retry after {message.get('seconds', 10)} seconds")
+            
+        elif message["type"] == "release_available":
+            self.announce_release(message.get("version"))
+            
+        elif message["type"] == "rollout_policy":
+            self.rollout = RolloutPolicy(message.get("rollout"))
+            print(f"Rollout policy updated: {message.get('rollout')}")
+            self.rollout_changed.set()
+            # A lifted hold or wider cohort may now admit a release this agent skipped
+            self.release_announced.set()
+            
+        elif message["type"] in ("channel_open", "channel_data", "channel_window", "channel_close"):
+            if self.channels:
+                self.channels.handle(message)
+            
+        elif message["type"] == "keyframe_request":
+            if self.heartbeat_encoder:
+                self.heartbeat_encoder.request_keyframe()
+            
+        elif message["type"] == "command":
+            # Run in the background so heartbeats and other messages keep flowing
+            task = asyncio.create_task(self.execute_command(websocket, message))
+            self.command_tasks.add(task)
+            task.add_done_callback(self.command_tasks.discard)
+            
+        elif message["type"] == "python_exec":
+            task = asyncio.create_task(self.execute_python(websocket, message))
+            self.command_tasks.add(task)
+            task.add_done_callback(self.command_tasks.discard)
+            
+        elif message["type"] == "query":
+            task = asyncio.create_task(self.answer_query(websocket, message))
+            self.command_tasks.add(task)
+            task.add_done_callback(self.command_tasks.discard)
+            
+        elif message["type"] == "command_cancel":
+            if self.command_runner.cancel(message["id"]):
+                print(f"Cancelled command: {message['id']}")
+            else:
+                print(f"Cancel requested for unknown command: {message['id']}")
+            
+        elif message["type"] == "shell_session_close":
+            if await self.shell_pool.close_session(message.get("session")):
+                print(f"Closed shell session: {message.get('session')}")
             
         elif message["type"] == "update_request":
             print("Update request received")
-            try:
-                await websocket.send(json.dumps({
-                    "type": "update_status",
-                    "hostname": self.hostname,
-                    "status": "checking"
-                }))
-                
-                update_info = self.updater.check_for_updates()
-                if update_info.get("has_update"):
-                    # Download installer and schedule login prompt
-                    if self.schedule_user_update(update_info):
-                        await websocket.send(json.dumps({
-                            "type": "update_status",
-                            "hostname": self.hostname,
-                            "status": "user_prompted",
-                            "version": update_info['latest_version'],
-                            "currentVersion": update_info['current_version']
-                        }))
-                        
-                        await websocket.send(json.dumps({
-                            "type": "agent_log",
-                            "hostname": self.hostname,
-                            "message": f"Update ready - user will be prompted on next login"
-                        }))
-                    else:
-                        await websocket.send(json.dumps({
-                            "type": "update_status",
-                            "hostname": self.hostname,
-                            "status": "error",
-                            "error": "Failed to download update"
-                        }))
-                else:
-                    await websocket.send(json.dumps({
-                        "type": "update_status",
-                        "hostname": self.hostname,
-                        "status": "up_to_date"
-                    }))
-            except Exception as e:
-                await websocket.send(json.dumps({
-                    "type": "update_status",
-                    "hostname": self.hostname,
-                    "status": "error",
-                    "error": str(e)
-                }))
-                print(f"Update request failed: {e}")
+            # The check and install can take minutes; keep reading messages meanwhile
+            task = asyncio.create_task(self.handle_update_request(message))
+            self.command_tasks.add(task)
+            task.add_done_callback(self.command_tasks.discard)
                 
         elif message["type"] == "uninstall_request":
             print("Uninstall request received")
             try:
-                await websocket.send(json.dumps({
+                await self.send_message(websocket, {
                     "type": "agent_log",
                     "hostname": self.hostname,
                     "message": "Starting agent uninstall..."
-                }))
+                })
                 
                 # Uninstall commands for Linux
                 uninstall_commands = [
@@ -236,21 +567,21 @@ class LinuxAgent:
                     if result.returncode != 0 and "userdel" not in cmd:
                         print(f"Warning: {cmd} failed: {result.stderr}")
                 
-                await websocket.send(json.dumps({
+                await self.send_message(websocket, {
                     "type": "agent_log",
                     "hostname": self.hostname,
                     "message": "Agent uninstalled successfully. Goodbye!"
-                }))
+                })
                 
                 print("Agent uninstalled. Exiting...")
                 sys.exit(0)
                 
             except Exception as e:
-                await websocket.send(json.dumps({
+                await self.send_message(websocket, {
                     "type": "agent_log",
                     "hostname": self.hostname,
                     "message": f"Uninstall failed: {str(e)}"
-                }))
+                })
                 print(f"Uninstall failed: {e}")
                 
         elif message["type"] == "config_update":
@@ -261,23 +592,209 @@ class LinuxAgent:
                     await self.apply_config(key, value)
                     
                     # Acknowledge configuration applied
-                    await websocket.send(json.dumps({
+                    await self.send_message(websocket, {
                         "type": "config_applied",
                         "hostname": self.hostname,
                         "configKey": key
-                    }))
+                    })
             except Exception as e:
                 print(f"Config update failed: {e}")
     
+    async def send_message(self, websocket, message):
+        """Queue a message on the connection's writer and wait until it has been sent"""
+        outbound = self.outbound
+        if outbound is None or outbound.websocket is not websocket:
+            raise ConnectionError("Not connected")
+        await outbound.send(message)
+    
+    async def write_message(self, websocket, message):
+        """Send a message in the wire format negotiated at registration"""
+        started = time.perf_counter()
+        if self.wire_format == wire_codec.WIRE_FORMAT:
+            frame = wire_codec.encode(message)
+        else:
+            frame = json.dumps(message)  # ASCII-only, so len() is the byte count
+        await websocket.send(frame)
+        
+        self.telemetry.observe("send_ms", (time.perf_counter() - started) * 1000)
+        self.telemetry.incr("messages_sent")
+        self.telemetry.incr("bytes_sent", len(frame))
+        if message.get("type") == "heartbeat":
+            self.telemetry.observe("heartbeat_bytes", len(frame))
+    
+    def decode_message(self, frame):
+        """Binary frames are tagged MessagePack, text frames are JSON"""
+        self.telemetry.incr("messages_received")
+        self.telemetry.incr("bytes_received", len(frame))
+        if isinstance(frame, bytes):
+            return wire_codec.decode(frame)
+        return json.loads(frame)
+    
+    async def handle_update_request(self, message):
+        """Check for and install an update requested from the dashboard"""
+        try:
+            await self.send_update_status("checking")
+            update_info = await self.updater.check_for_updates_async()
+            if not update_info.get("has_update"):
+                await self.send_update_status("up_to_date")
+                return
+            
+            # Manual requests from the dashboard go through the same rollout gate, delay included, unless forced
+            if message.get("force") or await self.rollout_gate(update_info):
+                await self.apply_update(update_info)
+        except Exception as e:
+            await self.send_update_status("error", error=str(e))
+            print(f"Update request failed: {e}")
+    
+    async def answer_query(self, websocket, message):
+        """Answer a server query from in-process state without spawning a shell"""
+        response = {
+            "type": "query_result",
+            "id": message["id"],
+            "hostname": self.hostname,
+            "query": message.get("query")
+        }
+        try:
+            response["result"] = await self.queries.answer(message.get("query"), message.get("params"))
+        except Exception as e:
+            response["error"] = str(e)
+        try:
+            if "result" in response and self.channels:
+                payload = json.dumps(response["result"]).encode("utf-8")
+                if len(payload) > CHANNEL_RESULT_THRESHOLD:
+                    # Stream big results (profiles, process lists) so control traffic isn't stuck behind them
+                    channel = await self.channels.open("query_result", {"id": message["id"], "query": message.get("query")})
+                    await channel.write(payload)
+                    await channel.close()
+                    return
+            await self.send_message(websocket, response)
+        except Exception as e:
+            print(f"Failed to send query result: {e}")
+    
+    async def execute_python(self, websocket, message):
+        """Run a Python script in a warm worker and send back its structured result"""
+        print(f"Executing Python script: {message.get('hash') or 'inline'}")
+        result = await self.python_workers.run(
+            code=message.get("code"),
+            digest=message.get("hash"),
+            args=message.get("args"),
+            timeout=message.get("timeout", 30),
+            memory_mb=message.get("memory_mb")
+        )
+        response = {
+            "type": "python_exec_result",
+            "id": message["id"],
+            "hostname": self.hostname,
+            "result": result
+        }
+        try:
+            await self.send_message(websocket, response)
+        except Exception as e:
+            print(f"Failed to send Python result, spooling for replay: {e}")
+            await self.spool.append_async({"kind": "message", "message": response})
+    
+    async def execute_command(self, websocket, message):
+        command_id = message["id"]
+        command = message["command"]
+        print(f"Executing command: {command}")
+        
+        async def send_output(chunk):
+            await self.send_message(websocket, {
+                "type": "command_output",
+                "id": command_id,
+                "hostname": self.hostname,
+                **chunk
+            })
+        
+        # Execute command with bash, streaming output if the server asked for it
+        on_output = send_output if message.get("stream") else None
+        if message.get("session") or message.get("warm", self.warm_shells):
+            # Warm shell: no bash startup, and named sessions keep env/cwd between commands
+            output = await self.command_runner.run_pooled(
+                command_id,
+                self.shell_pool,
+                command,
+                session=message.get("session"),
+                timeout=message.get("timeout", 30),
+                on_output=on_output,
+                max_output=message.get("max_output"),
+                env=message.get("env"),
+                cwd=message.get("cwd")
+            )
+        else:
+            output = await self.command_runner.run(
+                command_id,
+                ["/bin/bash", "-c", command],
+                timeout=message.get("timeout", 30),
+                on_output=on_output,
+                max_output=message.get("max_output")
+            )
+        
+        # Send result back
+        response = {
+            "type": "command_result",
+            "id": command_id,
+            "hostname": self.hostname,
+            "result": output
+        }
+        try:
+            await self.send_message(websocket, response)
+        except Exception as e:
+            print(f"Failed to send command result, spooling for replay: {e}")
+            await self.spool.append_async({"kind": "message", "message": response})
+    
     async def apply_config(self, key, value):
         """Apply configuration setting"""
         try:
             if key == "heartbeat_interval":
-                # Update heartbeat interval (would need to restart heartbeat task)
+                # Picked up by the running heartbeat loop at its next beat
+                self.heartbeat_interval = max(1.0, float(value))
                 print(f"Heartbeat interval updated to {value} seconds")
+            elif key == "collector_intervals":
+                # {"cpu": 1, "disk": 60, ...} - seconds between collections per collector
+                for name, interval in value.items():
+                    self.sampler.set_interval(name, interval)
+                print(f"Collector intervals updated to {value}")
             elif key == "server_url":
                 # Update server URL (would need reconnection)
                 print(f"Server URL updated to {value}")
+            elif key == "command_output_limit":
+                # Cap on captured/streamed output per command, in bytes
+                self.command_runner.max_output = int(value)
+                print(f"Command output limit updated to {value} bytes")
+            elif key == "warm_shells":
+                # Run every command in a pooled shell, not just ones that ask for it
+                self.warm_shells = bool(value)
+                print(f"Warm shells {'enabled' if self.warm_shells else 'disabled'}")
+            elif key == "python_workers":
+                # {"size": 1, "max_jobs": 50, "memory_mb": 256}
+                for name in ("size", "max_jobs", "memory_mb"):
+                    if name in value:
+                        setattr(self.python_workers, name, int(value[name]))
+                self.python_workers.start()
+                print(f"Python workers updated to {value}")
+            elif key == "shell_pool":
+                # {"size": 2, "max_commands": 100, "idle_timeout": 300}
+                for name in ("size", "max_commands", "idle_timeout"):
+                    if name in value:
+                        setattr(self.shell_pool, name, int(value[name]))
+                print(f"Shell pool updated to {value}")
+            elif key == "reconnect_max_delay":
+                self.backoff.cap = float(value)
+                print(f"Reconnect max delay updated to {value} seconds")
+            elif key == "reconnect_window":
+                # Window over which the first connection attempt is spread
+                self.backoff.initial_window = float(value)
+                print(f"Reconnect window updated to {value} seconds")
+            elif key == "metrics_exporter_port":
+                # 0 turns the exporter off
+                self.set_metrics_exporter(int(value))
+                print(f"Metrics exporter port updated to {value}")
+            elif key == "update_mirrors":
+                # Extra HTTP mirrors tried, in order, before the server and GitHub
+                mirrors = value if isinstance(value, list) else [m.strip() for m in str(value).split(",")]
+                self.updater.set_mirrors(mirrors + [server_mirror_url(self.server_url)])
+                print(f"Update mirrors updated to {mirrors}")
             elif key == "log_level":
                 # Update logging level
                 print(f"Log level updated to {value}")
@@ -286,6 +803,19 @@ class LinuxAgent:
         except Exception as e:
             print(f"Failed to apply config {key}: {e}")
     
+    def set_metrics_exporter(self, port):
+        """Start, move or stop the localhost metrics exporter"""
+        if self.exporter:
+            self.exporter.stop()
+            self.exporter = None
+        if port:
+            try:
+                self.exporter = MetricsExporter(self.sampler, self.telemetry, self.hostname, port)
+                self.exporter.start()
+            except OSError as e:
+                self.exporter = None
+                print(f"Could not start metrics exporter on port {port}: {e}")
+    
     def get_system_info(self):
         """Get static system information"""
         try:
@@ -301,38 +831,27 @@ class LinuxAgent:
         except Exception as e:
             return {"error": str(e)}
     
+    def system_info_hash(self, system_info):
+        """Fingerprint of static system info; the fluctuating current CPU clock is left out"""
+        static_info = {k: v for k, v in system_info.items() if k != "cpu_freq"}
+        return hashlib.sha256(json.dumps(static_info, sort_keys=True).encode("utf-8")).hexdigest()
+    
     def get_system_metrics(self):
-        """Get real-time system metrics with improved accuracy"""
+        """Get the latest real-time system metrics from the background sampler"""
         try:
-            # Take multiple CPU samples for better accuracy
-            cpu_samples = []
-            for _ in range(3):
-                cpu_samples.append(psutil.cpu_percent(interval=0.5))
-            
-            # Use median to avoid spikes
-            cpu_percent = sorted(cpu_samples)[1]
-            
-            # Get memory and disk info
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            
-            # Force refresh memory stats
-            memory = psutil.virtual_memory()
-            
-            return {
-                "cpu_percent": round(cpu_percent, 1),
-                "memory_percent": round(memory.percent, 1),
-                "memory_used": memory.used,
-                "disk_percent": round((disk.used / disk.total) * 100, 1),
-                "disk_used": disk.used,
-                "process_count": len(psutil.pids()),
-                "network_io": dict(psutil.net_io_counters()._asdict()) if psutil.net_io_counters() else {},
-                "timestamp": time.time()
-            }
+            return self.sampler.latest()
         except Exception as e:
             return {"error": str(e)}
 
 if __name__ == "__main__":
+    # Python workers re-run this binary when frozen
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] == "--self-check":
+        # Run by the updater against a freshly installed binary before committing to it
+        agent = LinuxAgent()
+        print(f"self-check ok {agent.updater.current_version}")
+        sys.exit(0)
+    
     server_url = sys.argv[1] if len(sys.argv) > 1 else "ws://localhost:3000"
     agent = LinuxAgent(server_url)
     
@@ -341,73 +860,3 @@ if __name__ == "__main__":
     print("Auto-update enabled - agent will update automatically")
     
     asyncio.run(agent.connect())
-    
-    def schedule_user_update(self, update_info):
-        """Download installer and schedule login prompt"""
-        try:
-            import urllib.request
-            
-            # Download installer to temp folder
-            temp_dir = '/tmp'
-            installer_path = os.path.join(temp_dir, f"syswatch-agent-installer-linux-{update_info['latest_version']}")
-            
-            print(f"Downloading update to {installer_path}")
-            urllib.request.urlretrieve(update_info['download_url'], installer_path)
-            os.chmod(installer_path, 0o755)
-            
-            # Create update prompt script
-            prompt_script = os.path.join(temp_dir, "syswatch-update-prompt.sh")
-            with open(prompt_script, 'w') as f:
-                f.write(f'''#!/bin/bash
-echo "SysWatch Update Available"
-echo "Version: {update_info['latest_version']}"
-echo ""
-
-# Try GUI first, fallback to terminal
-if command -v zenity >/dev/null 2>&1; then
-    if zenity --question --title="SysWatch Update" --text="SysWatch update v{update_info['latest_version']} is available.\\n\\nInstall now?"; then
-        gnome-terminal -- bash -c "sudo {installer_path}; read -p 'Press Enter to close...'"
-    fi
-elif command -v kdialog >/dev/null 2>&1; then
-    if kdialog --yesno "SysWatch update v{update_info['latest_version']} is available.\\n\\nInstall now?"; then
-        konsole -e bash -c "sudo {installer_path}; read -p 'Press Enter to close...'"
-    fi
-else
-    # Terminal fallback
-    echo "Install SysWatch update v{update_info['latest_version']} now? (y/N)"
-    read -r response
-    if [[ "$response" =~ ^[Yy]$ ]]; then
-        sudo {installer_path}
-    fi
-fi
-
-# Cleanup
-rm -f ~/.config/autostart/syswatch-update.desktop
-rm -f {prompt_script}
-''')
-            os.chmod(prompt_script, 0o755)
-            
-            # Create autostart directory if it doesn't exist
-            autostart_dir = os.path.expanduser("~/.config/autostart")
-            os.makedirs(autostart_dir, exist_ok=True)
-            
-            # Create desktop entry for autostart
-            desktop_file = os.path.join(autostart_dir, "syswatch-update.desktop")
-            with open(desktop_file, 'w') as f:
-                f.write(f'''[Desktop Entry]
-Type=Application
-Name=SysWatch Update
-Comment=SysWatch Agent Update Prompt
-Exec={prompt_script}
-Hidden=false
-NoDisplay=false
-X-GNOME-Autostart-enabled=true
-StartupNotify=false
-''')
-            
-            print("Update scheduled for next user login")
-            return True
-            
-        except Exception as e:
-            print(f"Failed to schedule update: {e}")
-            return False
\ No newline at end of file
@@ -0,0 +1,137 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from agent_telemetry import BUCKET_BOUNDS
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (sample key, metric name, type, help)
+SYSTEM_METRICS = [
+    ("cpu_percent", "syswatch_cpu_percent", "gauge", "CPU utilisation in percent"),
+    ("memory_percent", "syswatch_memory_percent", "gauge", "Memory utilisation in percent"),
+    ("memory_used", "syswatch_memory_used_bytes", "gauge", "Memory in use"),
+    ("disk_percent", "syswatch_disk_percent", "gauge", "Disk utilisation in percent"),
+    ("disk_used", "syswatch_disk_used_bytes", "gauge", "Disk space in use"),
+    ("process_count", "syswatch_processes", "gauge", "Number of processes"),
+    ("timestamp", "syswatch_sample_timestamp_seconds", "gauge", "When the served sample was taken"),
+]
+
+NETWORK_COUNTERS = [
+    ("bytes_sent", "syswatch_network_sent_bytes"),
+    ("bytes_recv", "syswatch_network_received_bytes"),
+    ("packets_sent", "syswatch_network_sent_packets"),
+    ("packets_recv", "syswatch_network_received_packets"),
+    ("errin", "syswatch_network_receive_errors"),
+    ("errout", "syswatch_network_transmit_errors"),
+    ("dropin", "syswatch_network_receive_drops"),
+    ("dropout", "syswatch_network_transmit_drops"),
+]
+
+def metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class MetricsExporter:
+    """Serve the sampler's latest metrics and agent self-stats for Prometheus scrapes
+
+    Scrapes read the sampler cache; they never trigger a collection of their own.
+    """
+
+    def __init__(self, sampler, telemetry, hostname, port, host="127.0.0.1"):
+        self.sampler = sampler
+        self.telemetry = telemetry
+        self.hostname = hostname
+        self.host = host
+        self.port = port
+        self.server = None
+        self._thread = None
+
+    def start(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = exporter.render(openmetrics).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        print(f"Metrics exporter listening on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def render(self, openmetrics=False):
+        labels = f'host="{escape_label(self.hostname)}"'
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def counter(name, value, help_text):
+            # OpenMetrics names the family without _total; the 0.0.4 text format names the sample
+            family(name if openmetrics else f"{name}_total", "counter", help_text)
+            lines.append(f"{name}_total{{{labels}}} {value}")
+
+        samples = self.sampler.history()
+        sample = samples[-1] if samples else None
+        if sample:
+            for key, name, kind, help_text in SYSTEM_METRICS:
+                if key in sample:
+                    family(name, kind, help_text)
+                    lines.append(f"{name}{{{labels}}} {sample[key]}")
+            network = sample.get("network_io") or {}
+            for key, name in NETWORK_COUNTERS:
+                if key in network:
+                    counter(name, network[key], f"Network {key} since boot")
+
+        process = self.telemetry.process_stats()
+        family("syswatch_agent_rss_bytes", "gauge", "Agent resident memory")
+        lines.append(f"syswatch_agent_rss_bytes{{{labels}}} {process['rss']}")
+        family("syswatch_agent_cpu_percent", "gauge", "Agent CPU usage in percent")
+        lines.append(f"syswatch_agent_cpu_percent{{{labels}}} {process['cpu_percent']}")
+
+        for name, value in sorted(self.telemetry.read_gauges().items()):
+            if isinstance(value, (int, float)):
+                family(f"syswatch_agent_{metric_name(name)}", "gauge", f"Agent gauge {name}")
+                lines.append(f"syswatch_agent_{metric_name(name)}{{{labels}}} {value}")
+
+        counters, histograms = self.telemetry.export()
+        for name, value in sorted(counters.items()):
+            counter(f"syswatch_agent_{metric_name(name)}", value, f"Agent counter {name}")
+
+        for name, (buckets, count, total) in sorted(histograms.items()):
+            full_name = f"syswatch_agent_{metric_name(name)}"
+            family(full_name, "histogram", f"Agent histogram {name}")
+            cumulative = 0
+            for bound, n in zip(BUCKET_BOUNDS, buckets):
+                cumulative += n
+                lines.append(f'{full_name}_bucket{{{labels},le="{float(bound)}"}} {cumulative}')
+            lines.append(f'{full_name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{full_name}_count{{{labels}}} {count}")
+            lines.append(f"{full_name}_sum{{{labels}}} {round(total, 6)}")
+
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+
+# Built-in collectors: name -> (interval in seconds, cost class).
+# "fast" collectors run inline on the scheduler thread; "slow" ones run on a
+# separate worker so a stalled disk or event log can never delay the fast ones.
+DEFAULT_COLLECTORS = {
+    "cpu": (1, "fast"),
+    "memory": (5, "fast"),
+    "network": (5, "fast"),
+    "processes": (15, "fast"),
+    "disk": (60, "slow")
+}
+
+MIN_INTERVAL = 0.5
+
+class Collector:
+    """One scheduled collection with its last result"""
+
+    def __init__(self, name, collect, interval, cost, first_due):
+        self.name = name
+        self.collect = collect
+        self.interval = max(MIN_INTERVAL, float(interval))
+        self.cost = cost
+        self.next_due = first_due
+        self.running = False
+        self.value = None
+        self.collected_at = None
+
+class MetricsSampler:
+    """Collect system metrics on a background thread so callers never block
+
+    Each collector runs on its own fixed-rate schedule against the monotonic
+    clock, and results are cached with the time they were taken. Samples are
+    assembled from the cache, so reading one never triggers a collection.
+    """
+
+    def __init__(self, disk_path='/', interval=1.0, history_size=120, telemetry=None):
+        self.disk_path = disk_path
+        self.telemetry = telemetry
+        self.interval = interval
+        self.samples = deque(maxlen=history_size)
+        self.cpu_window = deque(maxlen=3)
+        self.collectors = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._slow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-collector")
+
+        for name, (collector_interval, cost) in DEFAULT_COLLECTORS.items():
+            self.add_collector(name, getattr(self, f"collect_{name}"), collector_interval, cost)
+
+        # Prime psutil so the first non-blocking CPU reading is meaningful
+        psutil.cpu_percent(interval=None)
+
+    def add_collector(self, name, collect, interval, cost="fast", delay=0):
+        """Schedule `collect` every `interval` seconds, first after `delay`"""
+        with self._lock:
+            self.collectors[name] = Collector(name, collect, interval, cost, time.monotonic() + delay)
+        self._wake.set()
+
+    def set_interval(self, name, interval):
+        with self._lock:
+            collector = self.collectors[name]
+            collector.interval = max(MIN_INTERVAL, float(interval))
+            collector.next_due = min(collector.next_due, time.monotonic() + collector.interval)
+        self._wake.set()
+
+    def start(self):
+        """Start the sampler thread (no-op if already running)"""
+        if self._thread and self._thread.is_alive():
+            return
+        # Fill the cache first so no sample goes out missing a slow collector's fields
+        with self._lock:
+            primed = bool(self.samples)
+        if not primed:
+            self.latest()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sampler thread"""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval * 2)
+            self._thread = None
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = [c for c in self.collectors.values() if c.next_due <= now]
+                for collector in due:
+                    collector.next_due = self.next_tick(collector.next_due, collector.interval, now)
+
+            started = time.perf_counter()
+            for collector in due:
+                if collector.cost == "slow":
+                    if not collector.running:
+                        collector.running = True
+                        self._slow_executor.submit(self.run_collector, collector)
+                else:
+                    self.run_collector(collector)
+            if due and self.telemetry:
+                self.telemetry.observe("collect_metrics_ms", (time.perf_counter() - started) * 1000)
+
+            if next_sample <= now:
+                sample = self.assemble()
+                with self._lock:
+                    self.samples.append(sample)
+                next_sample = self.next_tick(next_sample, self.interval, now)
+
+            with self._lock:
+                wake_at = min([next_sample] + [c.next_due for c in self.collectors.values()])
+            self._wake.wait(max(0.0, wake_at - time.monotonic()))
+            self._wake.clear()
+
+    def next_tick(self, due, interval, now):
+        """Fixed-rate schedule: stay on the original grid and skip ticks that were missed"""
+        missed = int((now - due) // interval)
+        if missed and self.telemetry:
+            self.telemetry.incr("collector_ticks_skipped", missed)
+        return due + (missed + 1) * interval
+
+    def run_collector(self, collector):
+        started = time.perf_counter()
+        try:
+            value = collector.collect()
+            with self._lock:
+                collector.value = value
+                collector.collected_at = time.time()
+        except Exception as e:
+            print(f"Collector {collector.name} failed: {e}")
+        finally:
+            collector.running = False
+            if self.telemetry:
+                self.telemetry.observe(f"collect_{collector.name}_ms", (time.perf_counter() - started) * 1000)
+
+    def collect_cpu(self):
+        # CPU is measured over the time since the previous reading; the median
+        # of the last few readings avoids reporting single spikes
+        self.cpu_window.append(psutil.cpu_percent(interval=None))
+        return sorted(self.cpu_window)[len(self.cpu_window) // 2]
+
+    def collect_memory(self):
+        return psutil.virtual_memory()
+
+    def collect_network(self):
+        net_io = psutil.net_io_counters()
+        return dict(net_io._asdict()) if net_io else {}
+
+    def collect_processes(self):
+        return len(psutil.pids())
+
+    def collect_disk(self):
+        return psutil.disk_usage(self.disk_path)
+
+    def value(self, name, default=None):
+        """Cached result of a collector, or `default` if it hasn't run yet"""
+        with self._lock:
+            collector = self.collectors.get(name)
+            return collector.value if collector and collector.value is not None else default
+
+    def ages(self):
+        """Seconds since each collector last produced a value"""
+        now = time.time()
+        with self._lock:
+            return {
+                name: round(now - c.collected_at, 1) if c.collected_at else None
+                for name, c in self.collectors.items()
+            }
+
+    def assemble(self):
+        """Build a sample from the cached collector results"""
+        cpu = self.value("cpu")
+        memory = self.value("memory")
+        disk = self.value("disk")
+        sample = {}
+        if cpu is not None:
+            sample["cpu_percent"] = round(cpu, 1)
+        if memory is not None:
+            sample["memory_percent"] = round(memory.percent, 1)
+            sample["memory_used"] = memory.used
+        if disk is not None:
+            sample["disk_percent"] = round((disk.used / disk.total) * 100, 1)
+            sample["disk_used"] = disk.used
+        processes = self.value("processes")
+        if processes is not None:
+            sample["process_count"] = processes
+        sample["network_io"] = self.value("network", {})
+        sample["timestamp"] = time.time()
+        return sample
+
+    def collect(self):
+        """Run every built-in collector now and return the resulting sample"""
+        now = time.monotonic()
+        for name in DEFAULT_COLLECTORS:
+            collector = self.collectors[name]
+            self.run_collector(collector)
+            with self._lock:
+                collector.next_due = now + collector.interval
+        return self.assemble()
+
+    def latest(self):
+        """Return a copy of the most recent sample, collecting one if none exists yet"""
+        with self._lock:
+            if self.samples:
+                return dict(self.samples[-1])
+        sample = self.collect()
+        with self._lock:
+            self.samples.append(sample)
+        return dict(sample)
+
+    def history(self, since=None):
+        """Return buffered samples, optionally only those newer than a timestamp"""
+        with self._lock:
+            samples = list(self.samples)
+        if since is not None:
+            samples = [s for s in samples if s["timestamp"] > since]
+        return samples
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+class OfflineSpool:
+    """Bounded append-only on-disk spool for data produced while disconnected
+
+    Records are JSON lines in numbered segment files. Every append is fsynced,
+    and a torn last line from a crash is skipped when the segment is read back.
+    When the spool exceeds max_total_bytes the oldest segments are dropped.
+    Replay records how many records of a segment have been sent in a
+    `.ack` file next to it, so an interrupted replay resumes where it stopped.
+    Async callers use append_async(), which does the write and fsync on a
+    single background thread so records stay in order and the event loop
+    never waits on the disk.
+    """
+
+    def __init__(self, directory, max_segment_bytes=1024 * 1024, max_total_bytes=32 * 1024 * 1024):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_total_bytes = max_total_bytes
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="offline-spool")
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self.segments()
+        self.next_segment = self.segment_number(segments[-1]) + 1 if segments else 1
+        self.current = None
+
+    def segment_number(self, path):
+        return int(os.path.basename(path)[len("segment-"):-len(".jsonl")])
+
+    def segments(self):
+        """Segment file paths, oldest first"""
+        names = [n for n in os.listdir(self.directory) if n.startswith("segment-") and n.endswith(".jsonl")]
+        paths = [os.path.join(self.directory, n) for n in names]
+        return sorted(paths, key=self.segment_number)
+
+    def append(self, record):
+        """Durably append one JSON-serializable record"""
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self.current is None or os.path.getsize(self.current) + len(line) > self.max_segment_bytes:
+                self.current = os.path.join(self.directory, f"segment-{self.next_segment:08d}.jsonl")
+                self.next_segment += 1
+            with open(self.current, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.enforce_limit()
+
+    async def append_async(self, record):
+        """append() off the event loop"""
+        await asyncio.get_running_loop().run_in_executor(self._writer, self.append, record)
+
+    def enforce_limit(self):
+        segments = self.segments()
+        total = sum(os.path.getsize(p) for p in segments)
+        while segments and total > self.max_total_bytes:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            self.remove_ack(oldest)
+            if oldest == self.current:
+                self.current = None
+            print(f"Offline spool full, dropped {os.path.basename(oldest)}")
+
+    def seal(self):
+        """Close the current segment so replay can consume it; returns sealed segments"""
+        with self._lock:
+            self.current = None
+            return self.segments()
+
+    def read_segment(self, path):
+        """Read all intact records from a segment"""
+        records = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Torn write from a crash; everything before it is still valid
+                    break
+        return records
+
+    def remove_segment(self, path):
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(path)
+            self.remove_ack(path)
+
+    def read_ack(self, path):
+        """Number of records of a segment already sent by an earlier replay"""
+        try:
+            with open(path + ".ack") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def save_ack(self, path, count):
+        # Replace atomically so a crash leaves either the old or the new offset
+        temp = path + ".ack.tmp"
+        with open(temp, "w") as f:
+            f.write(str(count))
+        os.replace(temp, path + ".ack")
+
+    def remove_ack(self, path):
+        for name in (path + ".ack", path + ".ack.tmp"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def has_pending(self):
+        return bool(self.segments())
+
+    async def replay(self, send_batch, batch_size=200, batches_per_second=2):
+        """Send sealed segments as zlib-compressed JSON batches, deleting each once sent"""
+        loop = asyncio.get_running_loop()
+        replayed = 0
+        for path in self.seal():
+            records = self.read_segment(path)
+            for i in range(self.read_ack(path), len(records), batch_size):
+                batch = records[i:i + batch_size]
+                await send_batch(zlib.compress(json.dumps(batch).encode("utf-8")), len(batch))
+                replayed += len(batch)
+                await loop.run_in_executor(self._writer, self.save_ack, path, i + len(batch))
+                await asyncio.sleep(1 / batches_per_second)
+            self.remove_segment(path)
+        return replayed
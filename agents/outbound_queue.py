@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import deque
+
+CONTROL, RESULTS, HEARTBEAT, BULK = range(4)
+LANE_NAMES = ["control", "results", "heartbeat", "bulk"]
+
+# Lane for each outgoing message type; anything not listed is treated as control
+MESSAGE_PRIORITIES = {
+    "command_output": RESULTS,
+    "command_result": RESULTS,
+    "query_result": RESULTS,
+    "python_exec_result": RESULTS,
+    "agent_log": RESULTS,
+    "heartbeat": HEARTBEAT,
+    "channel_data": BULK,
+    "spool_batch": BULK
+}
+
+class OutboundEntry:
+    def __init__(self, message, prepare, future, key):
+        self.message = message
+        self.prepare = prepare
+        self.future = future
+        self.key = key
+        self.queued_at = time.perf_counter()
+
+class OutboundQueue:
+    """The only writer for a connection: messages go out one at a time, most urgent lane first
+
+    A slow link therefore delays bulk traffic rather than control replies or
+    heartbeats. While a coalescable message (a heartbeat) is still waiting, a
+    newer one replaces it instead of queueing behind it. A heartbeat that has
+    waited `heartbeat_max_wait` seconds goes out next even while results keep
+    arriving, so a busy agent is never marked offline.
+    """
+
+    def __init__(self, websocket, write, telemetry=None, heartbeat_max_wait=5):
+        self.websocket = websocket
+        self.write = write
+        self.telemetry = telemetry
+        self.heartbeat_max_wait = heartbeat_max_wait
+        self.lanes = [deque() for _ in LANE_NAMES]
+        self.waiting = {}  # coalesce key -> queued entry
+        self.ready = asyncio.Event()
+        self.error = None
+
+    def put(self, message, priority=None, coalesce_key=None, prepare=None):
+        """Queue a message and return a future that resolves once it is written
+
+        `prepare` runs in the writer right before sending, so state such as the
+        heartbeat delta base only advances for messages that actually go out.
+        """
+        if self.error:
+            raise self.error
+        if coalesce_key is not None and coalesce_key in self.waiting:
+            entry = self.waiting[coalesce_key]
+            # Keep fields only the older message carried, e.g. a periodic stats block
+            entry.message = {**entry.message, **message}
+            if self.telemetry:
+                self.telemetry.incr("messages_coalesced")
+            return entry.future
+
+        if priority is None:
+            priority = MESSAGE_PRIORITIES.get(message.get("type"), CONTROL)
+        entry = OutboundEntry(message, prepare, asyncio.get_running_loop().create_future(), coalesce_key)
+        self.lanes[priority].append(entry)
+        if coalesce_key is not None:
+            self.waiting[coalesce_key] = entry
+        self.ready.set()
+        return entry.future
+
+    async def send(self, message, **options):
+        await self.put(message, **options)
+
+    def depth(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def depths(self):
+        return {name: len(lane) for name, lane in zip(LANE_NAMES, self.lanes)}
+
+    def next_entry(self):
+        heartbeats = self.lanes[HEARTBEAT]
+        if heartbeats and time.perf_counter() - heartbeats[0].queued_at >= self.heartbeat_max_wait:
+            lanes = [heartbeats] + self.lanes
+            if self.telemetry:
+                self.telemetry.incr("heartbeats_aged")
+        else:
+            lanes = self.lanes
+        for lane in lanes:
+            if lane:
+                entry = lane.popleft()
+                if entry.key is not None:
+                    self.waiting.pop(entry.key, None)
+                return entry
+        return None
+
+    async def run(self):
+        """Writer loop; ends when a write fails, failing everything still queued"""
+        try:
+            while True:
+                entry = self.next_entry()
+                if entry is None:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                if self.telemetry:
+                    self.telemetry.observe("queue_wait_ms", (time.perf_counter() - entry.queued_at) * 1000)
+                try:
+                    message = entry.prepare(entry.message) if entry.prepare else entry.message
+                    await self.write(self.websocket, message)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+                    entry.future.exception()  # Mark retrieved for fire-and-forget senders
+                    self.close(e)
+                    return
+                if not entry.future.done():
+                    entry.future.set_result(True)
+        finally:
+            self.close(ConnectionError("Connection closed"))
+
+    def close(self, error):
+        """Fail queued messages so their senders can spool or give up"""
+        if self.error is None:
+            self.error = error
+        for lane in self.lanes:
+            while lane:
+                future = lane.popleft().future
+                if not future.done():
+                    future.set_exception(self.error)
+                    future.exception()
+        self.waiting.clear()
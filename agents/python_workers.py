@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import multiprocessing
+import time
+import traceback
+from collections import OrderedDict
+
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows: only the RSS watchdog applies
+    resource = None
+
+# Imported once per worker (and by the fork server), then handed to every script
+PRELOAD = ["json", "os", "sys", "re", "time", "datetime", "platform", "socket", "subprocess", "shutil", "psutil"]
+
+def script_hash(code):
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+def jsonable(value):
+    """Scripts may leave anything in `result`; send back what JSON can carry"""
+    try:
+        return json.loads(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return repr(value)
+
+def worker_main(conn):
+    """Worker process: run jobs from the pipe until the agent closes it"""
+    modules = {}
+    for name in PRELOAD:
+        try:
+            modules[name] = importlib.import_module(name)
+        except ImportError:
+            pass
+    compiled = {}
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        conn.send(run_job(job, modules, compiled))
+
+def run_job(job, modules, compiled):
+    started = time.perf_counter()
+    stdout, stderr = io.StringIO(), io.StringIO()
+    reply = {"ok": True}
+    try:
+        if resource and job.get("memory_limit"):
+            # A clean MemoryError beats being killed by the watchdog
+            _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+            resource.setrlimit(resource.RLIMIT_DATA, (job["memory_limit"], hard))
+        code = compiled.get(job["hash"])
+        if code is None:
+            code = compile(job["code"], f"<python_exec {job['hash'][:12]}>", "exec")
+            compiled[job["hash"]] = code
+        namespace = {**modules, "__name__": "__python_exec__", "args": job.get("args") or {}}
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(code, namespace)
+        reply["result"] = jsonable(namespace.get("result"))
+    except SystemExit as e:
+        reply["ok"] = e.code in (None, 0)
+        reply["exit_code"] = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException as e:
+        reply["ok"] = False
+        reply["error"] = {"type": type(e).__name__, "message": str(e) or repr(e), "traceback": traceback.format_exc()}
+    finally:
+        if resource and job.get("memory_limit"):
+            _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+            resource.setrlimit(resource.RLIMIT_DATA, (hard, hard))
+
+    max_output = job.get("max_output") or 0
+    for name, buffer in (("stdout", stdout), ("stderr", stderr)):
+        text = buffer.getvalue()
+        if max_output and len(text) > max_output:
+            text = text[:max_output]
+            reply["truncated"] = True
+        reply[name] = text
+    reply["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return reply
+
+class PythonWorker:
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.jobs = 0
+        self.over_memory = False
+
+    def call(self, job):
+        self.conn.send(job)
+        return self.conn.recv()
+
+    def rss(self):
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss
+        except psutil.NoSuchProcess:
+            return 0
+
+    def kill(self):
+        """Kill the worker and anything its scripts spawned"""
+        try:
+            children = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            children = []
+        for child in children:
+            try:
+                child.kill()
+            except psutil.NoSuchProcess:
+                pass
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+class PythonWorkerPool:
+    """Warm worker processes for python_exec jobs
+
+    Workers start with common modules already imported (on Linux they fork
+    from a server that imported them once) and run jobs in a fresh namespace
+    with `args` set; a script reports back by assigning `result`. Scripts are
+    cached by SHA-256 so repeat runs can send just the hash. A worker is
+    replaced after `max_jobs`, on timeout, or when it passes its memory limit.
+    At most `max_workers` jobs run at once; further jobs queue for a worker.
+    """
+
+    def __init__(self, size=1, max_workers=2, max_jobs=50, memory_mb=256, max_scripts=64, max_output=1024 * 1024):
+        self.size = size
+        self.max_workers = max_workers
+        self.semaphore = asyncio.Semaphore(max_workers)
+        self.max_jobs = max_jobs
+        self.memory_mb = memory_mb
+        self.max_scripts = max_scripts
+        self.max_output = max_output
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            self.context.set_forkserver_preload([__name__] + PRELOAD)
+        self.idle = []
+        self.starting = 0
+        self.busy = 0
+        self.warmer = None
+        self.scripts = OrderedDict()
+
+    def remember(self, digest, code):
+        self.scripts[digest] = code
+        self.scripts.move_to_end(digest)
+        while len(self.scripts) > self.max_scripts:
+            self.scripts.popitem(last=False)
+
+    async def spawn(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, PythonWorker, self.context)
+
+    def start(self):
+        """Pre-fork idle workers in the background so the first script doesn't pay for startup"""
+        if self.warmer is None or self.warmer.done():
+            self.warmer = asyncio.create_task(self.warm())
+
+    async def warm(self):
+        """Top the idle workers back up to `size`, never going past `max_workers` processes"""
+        while (len(self.idle) + self.starting < self.size
+               and len(self.idle) + self.starting + self.busy < self.max_workers):
+            self.starting += 1
+            try:
+                self.idle.append(await self.spawn())
+            except Exception as e:
+                print(f"Failed to start Python worker: {e}")
+                return
+            finally:
+                self.starting -= 1
+
+    async def acquire(self):
+        while self.idle:
+            worker = self.idle.pop()
+            if worker.process.is_alive():
+                return worker
+        return await self.spawn()
+
+    async def release(self, worker, healthy):
+        if healthy and worker.jobs < self.max_jobs and len(self.idle) < self.size and worker.process.is_alive():
+            self.idle.append(worker)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, worker.kill)
+
+    async def watch_memory(self, worker, limit):
+        while True:
+            await asyncio.sleep(0.1)
+            if worker.rss() > limit:
+                worker.over_memory = True
+                await asyncio.get_running_loop().run_in_executor(None, worker.kill)
+                return
+
+    async def run(self, code=None, digest=None, args=None, timeout=30, memory_mb=None):
+        """Run a script (by source, or by the hash of a cached one); returns a structured result"""
+        if code is not None:
+            digest = script_hash(code)
+            self.remember(digest, code)
+        elif digest in self.scripts:
+            code = self.scripts[digest]
+            self.scripts.move_to_end(digest)
+        else:
+            # The server resends the source when it sees this
+            return {"ok": False, "missing_script": True, "hash": digest,
+                    "error": {"type": "LookupError", "message": f"Unknown script hash: {digest}"}}
+
+        limit = int(memory_mb or self.memory_mb) * 1024 * 1024
+        job = {"hash": digest, "code": code, "args": args or {}, "memory_limit": limit, "max_output": self.max_output}
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            worker = await self.acquire()
+            worker.jobs += 1
+            self.busy += 1
+            watchdog = asyncio.create_task(self.watch_memory(worker, limit))
+            healthy = False
+            try:
+                reply = await asyncio.wait_for(loop.run_in_executor(None, worker.call, job), timeout=timeout)
+                healthy = True
+            except asyncio.TimeoutError:
+                reply = {"ok": False, "error": {"type": "TimeoutError", "message": f"Script timed out after {timeout}s"}}
+            except (EOFError, OSError) as e:
+                if worker.over_memory:
+                    reply = {"ok": False, "error": {"type": "MemoryError", "message": f"Worker exceeded {limit // (1024 * 1024)} MB"}}
+                else:
+                    reply = {"ok": False, "error": {"type": "WorkerError", "message": f"Worker died: {e!r}"}}
+            finally:
+                watchdog.cancel()
+                self.busy -= 1
+                await self.release(worker, healthy and not worker.over_memory)
+                self.start()
+        reply["hash"] = digest
+        return reply
+
+    def stats(self):
+        return {"idle": len(self.idle), "scripts": len(self.scripts), "start_method": self.context.get_start_method()}
@@ -0,0 +1,33 @@
+import random
+
+class ReconnectBackoff:
+    """Decorrelated-jitter exponential backoff so a fleet never reconnects in lockstep"""
+
+    def __init__(self, base=1.0, cap=300.0, initial_window=10.0):
+        self.base = base
+        self.cap = cap
+        self.initial_window = initial_window
+        self.delay = base
+        self.retry_after = None
+
+    def initial_delay(self):
+        """Random delay before the very first connection attempt"""
+        return random.uniform(0, self.initial_window)
+
+    def set_retry_after(self, seconds, window=0):
+        """Honor a server hint: wait at least `seconds`, spread over `window` more"""
+        self.retry_after = (seconds, window)
+
+    def reset(self):
+        """Call once a connection has been established successfully"""
+        self.delay = self.base
+
+    def next_delay(self):
+        if self.retry_after:
+            seconds, window = self.retry_after
+            self.retry_after = None
+            self.delay = min(self.cap, max(self.delay, seconds))
+            return seconds + random.uniform(0, window)
+
+        self.delay = min(self.cap, random.uniform(self.base, self.delay * 3))
+        return self.delay
@@ -0,0 +1,65 @@
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+class RolloutPolicy:
+    """Server-controlled limits on when this agent may install an update
+
+    percent    -- share of the fleet (by hostname hash) allowed to update
+    window     -- {"start": "HH:MM", "end": "HH:MM"} local maintenance window
+    max_delay  -- random delay in seconds before installing, to spread restarts
+    hold       -- pause the rollout entirely
+    """
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.percent = float(settings.get("percent", 100))
+        self.window = settings.get("window") or None
+        self.max_delay = float(settings.get("max_delay", 0))
+        self.hold = bool(settings.get("hold", False))
+        self.hold_reason = settings.get("hold_reason")
+
+    def cohort_position(self, hostname):
+        """Stable position of a host in [0, 100); hosts below `percent` are in the cohort"""
+        digest = hashlib.sha256(hostname.lower().encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 0x100000000 * 100
+
+    def in_cohort(self, hostname):
+        return self.cohort_position(hostname) < self.percent
+
+    def seconds_until_window(self, now=None):
+        """0 when inside the maintenance window (or none is set), else seconds until it opens"""
+        if not self.window:
+            return 0
+        now = now or datetime.now()
+        start = self.parse_time(self.window["start"], now)
+        end = self.parse_time(self.window["end"], now)
+
+        if start <= end:
+            inside = start <= now < end
+        else:
+            # Window crosses midnight, e.g. 22:00-04:00
+            inside = now >= start or now < end
+        if inside:
+            return 0
+        if start <= now:
+            start += timedelta(days=1)
+        return (start - now).total_seconds()
+
+    def parse_time(self, value, now):
+        hour, minute = (int(part) for part in value.split(":"))
+        return now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    def check(self, hostname, now=None):
+        """Return (allowed, reason, wait); wait is None when waiting won't help"""
+        if self.hold:
+            return False, "held", None
+        if not self.in_cohort(hostname):
+            return False, "not_in_cohort", None
+        wait = self.seconds_until_window(now)
+        if wait > 0:
+            return False, "outside_window", wait
+        return True, None, 0
+
+    def start_delay(self):
+        return random.uniform(0, self.max_delay) if self.max_delay > 0 else 0
@@ -0,0 +1,216 @@
+import asyncio
+import base64
+import os
+import secrets
+import shlex
+import time
+
+from command_runner import kill_process_tree
+
+BASH_ARGV = ["/bin/bash", "--noprofile", "--norc"]
+POWERSHELL_ARGV = ["powershell.exe", "-NoLogo", "-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass", "-Command", "-"]
+
+class ShellSession:
+    """A long-lived shell that runs one command at a time, framed by random sentinels
+
+    After each command the shell prints a sentinel line (with the exit code)
+    on stdout and another on stderr, so output can be read from the same
+    pipes command after command without restarting the shell.
+    """
+
+    def __init__(self, argv, dialect, name=None, env=None, cwd=None):
+        self.argv = argv
+        self.dialect = dialect
+        self.name = name
+        self.env = env
+        self.cwd = cwd
+        self.process = None
+        self.commands = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.dead = False
+
+    async def start(self):
+        env = dict(os.environ, **self.env) if self.env else None
+        self.process = await asyncio.create_subprocess_exec(
+            *self.argv,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            cwd=self.cwd
+        )
+
+    @property
+    def alive(self):
+        return not self.dead and self.process is not None and self.process.returncode is None
+
+    def script(self, command, marker, isolated):
+        """Shell source that runs `command` and then prints the sentinels"""
+        if self.dialect == "powershell":
+            encoded = base64.b64encode(command.encode("utf-16-le")).decode("ascii")
+            body = f"Invoke-Expression ([Text.Encoding]::Unicode.GetString([Convert]::FromBase64String('{encoded}')))"
+            # Anonymous commands get their own scope and location; named sessions dot-source so state persists
+            block = f"& {{ Push-Location; try {{ {body} }} finally {{ Pop-Location }} }}" if isolated else f". {{ {body} }}"
+            return (
+                "$global:LASTEXITCODE = 0; $__ok = $true; "
+                f"try {{ {block} 2>&1 | ForEach-Object {{ "
+                "if ($_ -is [System.Management.Automation.ErrorRecord]) { [Console]::Error.WriteLine($_) } "
+                "else { $_ | Out-String -Stream | ForEach-Object { [Console]::Out.WriteLine($_) } } } } "
+                "catch { $__ok = $false; [Console]::Error.WriteLine($_) }; "
+                "$__rc = if (-not $__ok) { 1 } elseif ($LASTEXITCODE) { $LASTEXITCODE } else { 0 }; "
+                f"[Console]::Out.WriteLine(); [Console]::Out.WriteLine('{marker} ' + $__rc); [Console]::Out.Flush(); "
+                f"[Console]::Error.WriteLine(); [Console]::Error.WriteLine('{marker}'); [Console]::Error.Flush()\n"
+            )
+        # eval keeps syntax errors inside the command instead of desyncing the shell;
+        # anonymous commands run in a subshell so cd/export don't leak to the next one
+        run = f"( eval {shlex.quote(command)} )" if isolated else f"eval {shlex.quote(command)}"
+        return (
+            f"{run} </dev/null; "
+            f"printf '\\n%s %d\\n' '{marker}' \"$?\"; "
+            f"printf '\\n%s\\n' '{marker}' >&2\n"
+        )
+
+    async def execute(self, command, output, isolated=True):
+        """Run a command, feeding its output into a CommandOutput; returns the exit code"""
+        marker = f"__SYSWATCH_{secrets.token_hex(8)}__"
+        self.commands += 1
+        self.last_used = time.monotonic()
+        self.process.stdin.write(self.script(command, marker, isolated).encode("utf-8"))
+        await self.process.stdin.drain()
+
+        status, _ = await asyncio.gather(
+            self.pump_until(self.process.stdout, "stdout", marker.encode("ascii"), output),
+            self.pump_until(self.process.stderr, "stderr", marker.encode("ascii"), output)
+        )
+        self.last_used = time.monotonic()
+        if status is None:
+            # The command exited the shell itself (e.g. `exit 3` in a named session)
+            self.dead = True
+            return await self.process.wait()
+        return int(status or 0)
+
+    async def pump_until(self, stream, name, marker, output):
+        """Copy a pipe into `output` up to the sentinel; returns what follows it on its line, or None at EOF"""
+        pending = b""
+        # Hold back enough bytes to catch a sentinel (and the newline before it) split across reads
+        keep = len(marker) + 2
+        while True:
+            data = await stream.read(4096)
+            if not data:
+                if pending:
+                    await output.write(name, pending)
+                return None
+            pending += data
+            index = pending.find(marker)
+            if index >= 0:
+                head = pending[:index]
+                # Drop the newline printed ahead of the sentinel
+                if head.endswith(b"\r\n"):
+                    head = head[:-2]
+                elif head.endswith(b"\n"):
+                    head = head[:-1]
+                if head:
+                    await output.write(name, head)
+                rest = pending[index + len(marker):]
+                while b"\n" not in rest:
+                    more = await stream.read(4096)
+                    if not more:
+                        return None
+                    rest += more
+                return rest.split(b"\n", 1)[0].decode("ascii", errors="replace").strip()
+            if len(pending) > keep:
+                await output.write(name, pending[:-keep])
+                pending = pending[-keep:]
+
+    async def close(self):
+        self.dead = True
+        await kill_process_tree(self.process)
+
+class ShellPool:
+    """Warm shells for small commands, so they skip interpreter startup
+
+    Anonymous commands borrow any idle shell and run isolated from each other.
+    Named sessions keep their own shell, so environment and working directory
+    carry over between commands. Shells are recycled after `max_commands`, when
+    a command times out or is cancelled, and after `idle_timeout` unused.
+    """
+
+    def __init__(self, argv, dialect, size=2, max_commands=100, idle_timeout=300):
+        self.argv = argv
+        self.dialect = dialect
+        self.size = size
+        self.max_commands = max_commands
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.sessions = {}
+        self.creating = {}  # session name -> lock held while its shell starts
+        self.reaper = None
+
+    async def acquire(self, session=None, env=None, cwd=None):
+        """Return a started shell, locked for the caller"""
+        if self.reaper is None or self.reaper.done():
+            self.reaper = asyncio.create_task(self.reap_idle())
+
+        if session is not None:
+            # Concurrent first commands for a session must share one shell, not each start their own
+            async with self.creating.setdefault(session, asyncio.Lock()):
+                shell = self.sessions.get(session)
+                if shell is None or not shell.alive:
+                    shell = ShellSession(self.argv, self.dialect, session, env, cwd)
+                    await shell.start()
+                    self.sessions[session] = shell
+            await shell.lock.acquire()
+            if not shell.alive:
+                shell.lock.release()
+                return await self.acquire(session, env, cwd)
+            return shell
+
+        while self.idle:
+            shell = self.idle.pop()
+            if shell.alive:
+                await shell.lock.acquire()
+                return shell
+        shell = ShellSession(self.argv, self.dialect)
+        await shell.start()
+        await shell.lock.acquire()
+        return shell
+
+    async def release(self, shell, healthy=True):
+        """Return a shell after a command; unhealthy or worn-out shells are replaced"""
+        shell.lock.release()
+        if not healthy or not shell.alive or shell.commands >= self.max_commands:
+            await self.retire(shell)
+        elif shell.name is None:
+            if len(self.idle) < self.size:
+                self.idle.append(shell)
+            else:
+                await shell.close()
+
+    async def retire(self, shell):
+        if shell.name is not None and self.sessions.get(shell.name) is shell:
+            del self.sessions[shell.name]
+            creating = self.creating.get(shell.name)
+            if creating is not None and not creating.locked():
+                del self.creating[shell.name]
+        if shell in self.idle:
+            self.idle.remove(shell)
+        await shell.close()
+
+    async def close_session(self, name):
+        shell = self.sessions.get(name)
+        if shell is None:
+            return False
+        await self.retire(shell)
+        return True
+
+    async def reap_idle(self):
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            cutoff = time.monotonic() - self.idle_timeout
+            for shell in list(self.idle) + list(self.sessions.values()):
+                if shell.last_used < cutoff and not shell.lock.locked():
+                    await self.retire(shell)
+
+    def stats(self):
+        return {"idle": len(self.idle), "sessions": sorted(self.sessions)}
@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+MAX_DURATION = 60
+# tracemalloc slows every allocation while it runs, so memory profiles are kept shorter
+MAX_MEMORY_DURATION = 15
+MIN_INTERVAL = 0.005
+MAX_DEPTH = 64
+# Share of one core the sampler may spend on itself before it slows down
+MAX_OVERHEAD = 0.02
+MAX_STACKS = 500
+MAX_ALLOCATION_SITES = 50
+
+class StackProfiler:
+    """Statistical profiler: periodically snapshots every thread's Python stack
+
+    Nothing is instrumented, so the agent runs at full speed between samples.
+    The sampler measures its own cost and stretches the interval to stay under
+    MAX_OVERHEAD, and only one profile may run at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def run(self, seconds=10, interval=0.01, memory=False, limit=MAX_STACKS):
+        """Sample for `seconds` and return collapsed stacks (and allocation sites if `memory`)"""
+        seconds = max(0.1, min(float(seconds), MAX_MEMORY_DURATION if memory else MAX_DURATION))
+        interval = max(MIN_INTERVAL, float(interval))
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            started_tracing = False
+            if memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            try:
+                result = self.sample(seconds, interval, int(limit))
+                if memory:
+                    result["memory"] = self.allocation_sites(MAX_ALLOCATION_SITES)
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+            return result
+        finally:
+            self._lock.release()
+
+    def sample(self, seconds, interval, limit):
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        sampler_time = 0.0
+        started = time.perf_counter()
+        deadline = started + seconds
+
+        while True:
+            tick = time.perf_counter()
+            if tick >= deadline:
+                break
+            self.take_sample(stacks, own_ident)
+            samples += 1
+
+            cost = time.perf_counter() - tick
+            sampler_time += cost
+            # Sleep long enough that cost / (cost + sleep) stays under the budget
+            delay = max(interval, cost / MAX_OVERHEAD - cost)
+            time.sleep(min(delay, max(0.0, deadline - time.perf_counter())))
+
+        elapsed = time.perf_counter() - started
+        top = stacks.most_common(limit)
+        return {
+            "duration": round(elapsed, 3),
+            "samples": samples,
+            "interval_ms": round(interval * 1000, 2),
+            "effective_interval_ms": round(elapsed / samples * 1000, 2) if samples else None,
+            "overhead_percent": round(sampler_time / elapsed * 100, 3) if elapsed else 0,
+            "collapsed": [f"{stack} {count}" for stack, count in top],
+            "truncated_stacks": len(stacks) - len(top)
+        }
+
+    def take_sample(self, stacks, own_ident):
+        # Kept in its own call so no frame references outlive the sample
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own_ident:
+                stacks[self.collapse(names.get(ident, str(ident)), frame)] += 1
+
+    def collapse(self, thread_name, frame):
+        """One stack in the folded format flame graph tools read: root;...;leaf"""
+        frames = []
+        while frame is not None and len(frames) < MAX_DEPTH:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        frames.append(f"thread:{thread_name}")
+        return ";".join(reversed(frames))
+
+    def allocation_sites(self, limit):
+        """Largest live allocations made while the profile ran, grouped by line"""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        sites = []
+        for stat in snapshot.statistics("lineno")[:limit]:
+            frame = stat.traceback[0]
+            sites.append({
+                "site": f"{frame.filename}:{frame.lineno}",
+                "size": stat.size,
+                "count": stat.count
+            })
+        return {"traced_current": current, "traced_peak": peak, "top_sites": sites}
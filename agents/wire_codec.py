@@ -0,0 +1,265 @@
+import json
+import struct
+
+WIRE_FORMAT = "msgpack-tagged"
+
+# Frequent map keys are sent as small integer tags instead of strings.
+# This list is shared with server/wire.js -- only ever append to it.
+FIELD_TAGS = [
+    "type", "hostname", "id", "metrics", "cpu_percent", "memory_percent",
+    "memory_used", "disk_percent", "disk_used", "process_count", "network_io",
+    "bytes_sent", "bytes_recv", "packets_sent", "packets_recv", "errin",
+    "errout", "dropin", "dropout", "timestamp", "seq", "keyframe", "delta",
+    "removed", "result", "stdout", "stderr", "returncode", "error", "command",
+    "stream", "data", "status", "message", "platform", "system_info",
+    "agentVersion", "capabilities", "eventLogs", "version", "currentVersion",
+    "channel", "credit"
+]
+TAG_BY_NAME = {name: tag for tag, name in enumerate(FIELD_TAGS)}
+
+class WireCodecError(Exception):
+    pass
+
+def encode(message):
+    """Encode a message dict as tagged MessagePack bytes"""
+    out = bytearray()
+    _pack(message, out)
+    return bytes(out)
+
+def decode(data):
+    """Decode tagged MessagePack bytes back into a message dict"""
+    value, offset = _unpack(memoryview(data), 0)
+    if offset != len(data):
+        raise WireCodecError("Trailing bytes after message")
+    return value
+
+def _pack(value, out):
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out.append(0xcb)
+        out += struct.pack(">d", value)
+    elif isinstance(value, str):
+        raw = value.encode("utf-8")
+        n = len(raw)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out += bytes((0xd9, n))
+        elif n < 0x10000:
+            out.append(0xda)
+            out += struct.pack(">H", n)
+        else:
+            out.append(0xdb)
+            out += struct.pack(">I", n)
+        out += raw
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        n = len(value)
+        if n < 0x100:
+            out += bytes((0xc4, n))
+        elif n < 0x10000:
+            out.append(0xc5)
+            out += struct.pack(">H", n)
+        else:
+            out.append(0xc6)
+            out += struct.pack(">I", n)
+        out += value
+    elif isinstance(value, (list, tuple)):
+        n = len(value)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out.append(0xdc)
+            out += struct.pack(">H", n)
+        else:
+            out.append(0xdd)
+            out += struct.pack(">I", n)
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        n = len(value)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out.append(0xde)
+            out += struct.pack(">H", n)
+        else:
+            out.append(0xdf)
+            out += struct.pack(">I", n)
+        for key, item in value.items():
+            key = str(key)
+            tag = TAG_BY_NAME.get(key)
+            _pack(tag if tag is not None else key, out)
+            _pack(item, out)
+    else:
+        raise WireCodecError(f"Cannot encode {type(value).__name__}")
+
+def _pack_int(value, out):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    elif 0 <= value < 0x100:
+        out += bytes((0xcc, value))
+    elif 0 <= value < 0x10000:
+        out.append(0xcd)
+        out += struct.pack(">H", value)
+    elif 0 <= value < 0x100000000:
+        out.append(0xce)
+        out += struct.pack(">I", value)
+    elif 0 <= value < 0x10000000000000000:
+        out.append(0xcf)
+        out += struct.pack(">Q", value)
+    elif -0x80 <= value:
+        out.append(0xd0)
+        out += struct.pack(">b", value)
+    elif -0x8000 <= value:
+        out.append(0xd1)
+        out += struct.pack(">h", value)
+    elif -0x80000000 <= value:
+        out.append(0xd2)
+        out += struct.pack(">i", value)
+    elif -0x8000000000000000 <= value:
+        out.append(0xd3)
+        out += struct.pack(">q", value)
+    else:
+        raise WireCodecError("Integer out of range")
+
+_FIXED = {
+    0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+    0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q",
+    0xca: ">f", 0xcb: ">d"
+}
+
+def _unpack(data, offset):
+    try:
+        code = data[offset]
+    except IndexError:
+        raise WireCodecError("Truncated message")
+    offset += 1
+
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0xa0 <= code <= 0xbf:
+        return _unpack_str(data, offset, code & 0x1f)
+    if 0x90 <= code <= 0x9f:
+        return _unpack_array(data, offset, code & 0x0f)
+    if 0x80 <= code <= 0x8f:
+        return _unpack_map(data, offset, code & 0x0f)
+    if code == 0xc0:
+        return None, offset
+    if code == 0xc2:
+        return False, offset
+    if code == 0xc3:
+        return True, offset
+    if code in _FIXED:
+        fmt = _FIXED[code]
+        size = struct.calcsize(fmt)
+        return struct.unpack_from(fmt, data, offset)[0], offset + size
+    if code in (0xd9, 0xda, 0xdb, 0xc4, 0xc5, 0xc6, 0xdc, 0xdd, 0xde, 0xdf):
+        size_fmt = {0xd9: ">B", 0xc4: ">B", 0xda: ">H", 0xc5: ">H", 0xdc: ">H", 0xde: ">H"}.get(code, ">I")
+        n = struct.unpack_from(size_fmt, data, offset)[0]
+        offset += struct.calcsize(size_fmt)
+        if code in (0xd9, 0xda, 0xdb):
+            return _unpack_str(data, offset, n)
+        if code in (0xc4, 0xc5, 0xc6):
+            if offset + n > len(data):
+                raise WireCodecError("Truncated message")
+            return bytes(data[offset:offset + n]), offset + n
+        if code in (0xdc, 0xdd):
+            return _unpack_array(data, offset, n)
+        return _unpack_map(data, offset, n)
+    raise WireCodecError(f"Unsupported type code 0x{code:02x}")
+
+def _unpack_str(data, offset, n):
+    if offset + n > len(data):
+        raise WireCodecError("Truncated message")
+    return str(data[offset:offset + n], "utf-8"), offset + n
+
+def _unpack_array(data, offset, n):
+    items = []
+    for _ in range(n):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+def _unpack_map(data, offset, n):
+    result = {}
+    for _ in range(n):
+        key, offset = _unpack(data, offset)
+        if isinstance(key, int):
+            if key >= len(FIELD_TAGS):
+                raise WireCodecError(f"Unknown field tag {key}")
+            key = FIELD_TAGS[key]
+        value, offset = _unpack(data, offset)
+        result[key] = value
+    return result, offset
+
+def benchmark(iterations=2000):
+    """Compare bytes-on-wire and encode/decode CPU against the JSON path"""
+    import time
+    import zlib
+
+    samples = {
+        "heartbeat": {
+            "type": "heartbeat",
+            "hostname": "branch-office-ws-042",
+            "metrics": {
+                "cpu_percent": 12.5, "memory_percent": 63.2, "memory_used": 10845343744,
+                "disk_percent": 71.4, "disk_used": 341234515968, "process_count": 312,
+                "network_io": {
+                    "bytes_sent": 1845623412, "bytes_recv": 9823412345, "packets_sent": 8234123,
+                    "packets_recv": 12345123, "errin": 0, "errout": 0, "dropin": 12, "dropout": 0
+                },
+                "timestamp": 1760000000.123456
+            }
+        },
+        "heartbeat_delta": {
+            "type": "heartbeat",
+            "hostname": "branch-office-ws-042",
+            "seq": 1234,
+            "delta": {"cpu_percent": 14.1, "network_io.bytes_sent": 1845723412, "network_io.bytes_recv": 9823512345}
+        },
+        "command_result": {
+            "type": "command_result",
+            "id": "9b2f6f8e-3c1d-4c55-9a52-0d8a3b1e7f10",
+            "hostname": "branch-office-ws-042",
+            "result": {"stdout": "Filesystem Size Used Avail Use% Mounted on\n" * 40, "stderr": "", "returncode": 0}
+        }
+    }
+
+    print(f"{'message':<16}{'format':<18}{'bytes':>8}{'deflated':>10}{'encode us':>11}{'decode us':>11}")
+    for name, message in samples.items():
+        codecs = [
+            ("json", lambda m: json.dumps(m).encode("utf-8"), lambda b: json.loads(b)),
+            (WIRE_FORMAT, encode, decode)
+        ]
+        for label, enc, dec in codecs:
+            payload = enc(message)
+            assert dec(payload) == message
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                enc(message)
+            encode_us = (time.perf_counter() - start) / iterations * 1e6
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                dec(payload)
+            decode_us = (time.perf_counter() - start) / iterations * 1e6
+
+            # Raw deflate approximates what permessage-deflate puts on the wire
+            compressor = zlib.compressobj(wbits=-15)
+            deflated = len(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH))
+            print(f"{name:<16}{label:<18}{len(payload):>8}{deflated:>10}{encode_us:>11.1f}{decode_us:>11.1f}")
+
+if __name__ == "__main__":
+    benchmark()
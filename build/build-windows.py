@@ -36,6 +36,24 @@ def build_windows_agent():
         '--name=syswatch-service',
         f'--add-data=../agents/version.py{separator}.',
         f'--add-data=../agents/agent_updater.py{separator}.',
+        f'--add-data=../agents/agent_queries.py{separator}.',
+        f'--add-data=../agents/agent_telemetry.py{separator}.',
+        f'--add-data=../agents/binary_delta.py{separator}.',
+        f'--add-data=../agents/channels.py{separator}.',
+        f'--add-data=../agents/metrics_exporter.py{separator}.',
+        f'--add-data=../agents/metrics_sampler.py{separator}.',
+        f'--add-data=../agents/offline_spool.py{separator}.',
+        f'--add-data=../agents/outbound_queue.py{separator}.',
+        f'--add-data=../agents/reconnect_backoff.py{separator}.',
+        f'--add-data=../agents/rollout.py{separator}.',
+        f'--add-data=../agents/stack_profiler.py{separator}.',
+        f'--add-data=../agents/command_runner.py{separator}.',
+        f'--add-data=../agents/file_transfer.py{separator}.',
+        f'--add-data=../agents/shell_pool.py{separator}.',
+        f'--add-data=../agents/python_workers.py{separator}.',
+        f'--add-data=../agents/heartbeat_delta.py{separator}.',
+        f'--add-data=../agents/inventory.py{separator}.',
+        f'--add-data=../agents/wire_codec.py{separator}.',
         f'--add-data=../agents/windows_agent.py{separator}.',
         '--hidden-import=win32timezone',
         '--hidden-import=win32serviceutil',
@@ -53,6 +71,24 @@ def build_windows_agent():
         '--name=syswatch-agent-windows',
         f'--add-data=../agents/version.py{separator}.',
         f'--add-data=../agents/agent_updater.py{separator}.',
+        f'--add-data=../agents/agent_queries.py{separator}.',
+        f'--add-data=../agents/agent_telemetry.py{separator}.',
+        f'--add-data=../agents/binary_delta.py{separator}.',
+        f'--add-data=../agents/channels.py{separator}.',
+        f'--add-data=../agents/metrics_exporter.py{separator}.',
+        f'--add-data=../agents/metrics_sampler.py{separator}.',
+        f'--add-data=../agents/offline_spool.py{separator}.',
+        f'--add-data=../agents/outbound_queue.py{separator}.',
+        f'--add-data=../agents/reconnect_backoff.py{separator}.',
+        f'--add-data=../agents/rollout.py{separator}.',
+        f'--add-data=../agents/stack_profiler.py{separator}.',
+        f'--add-data=../agents/command_runner.py{separator}.',
+        f'--add-data=../agents/file_transfer.py{separator}.',
+        f'--add-data=../agents/shell_pool.py{separator}.',
+        f'--add-data=../agents/python_workers.py{separator}.',
+        f'--add-data=../agents/heartbeat_delta.py{separator}.',
+        f'--add-data=../agents/inventory.py{separator}.',
+        f'--add-data=../agents/wire_codec.py{separator}.',
         '--hidden-import=win32timezone',
         '../agents/windows_agent.py'
     ])
@@ -0,0 +1,276 @@
+const https = require('https');
+const http = require('http');
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { createPatchFile } = require('./delta');
+
+// Release assets the agents pull during an update
+const ARTIFACT_PATTERN = /^syswatch-/;
+const KEEP_VERSIONS = 2;
+const MAX_REDIRECTS = 5;
+const MANIFEST_TTL = 30 * 60 * 1000; // Matches the release poll, which refreshes it early on a new release
+const MANIFEST_RETRY = 60 * 1000; // After a failed or partial build, try again this soon
+
+// Downloads each agent release artifact from GitHub once and serves it to the
+// fleet with a SHA-256 manifest, so a rollout costs one WAN download instead of N.
+class ArtifactCache {
+  constructor(updater, directory = path.join(__dirname, 'update-cache')) {
+    this.updater = updater;
+    this.directory = directory;
+    this.inflight = new Map(); // "version/name" -> Promise<{ size, sha256 }>
+    this.manifest = null;
+    this.manifestExpires = 0;
+    this.manifestPromise = null;
+  }
+
+  // Agents are answered from memory: GitHub is asked at most once per TTL,
+  // and agents arriving while a build is running share it
+  getManifest({ refresh = false } = {}) {
+    if (!refresh && this.manifest && Date.now() < this.manifestExpires) {
+      return Promise.resolve(this.manifest);
+    }
+    if (!this.manifestPromise) {
+      this.manifestPromise = this.buildManifest()
+        .then(({ manifest, complete }) => {
+          this.manifest = manifest;
+          this.manifestExpires = Date.now() + (complete ? MANIFEST_TTL : MANIFEST_RETRY);
+          return manifest;
+        })
+        .catch(error => {
+          if (!this.manifest) throw error;
+          // Keep serving the last good manifest while GitHub is unreachable
+          console.error('Manifest refresh failed, serving cached copy:', error.message);
+          this.manifestExpires = Date.now() + MANIFEST_RETRY;
+          return this.manifest;
+        })
+        .finally(() => {
+          this.manifestPromise = null;
+        });
+    }
+    return this.manifestPromise;
+  }
+
+  async buildManifest() {
+    const release = await this.updater.fetchLatestRelease();
+    if (!release.tag_name) {
+      throw new Error('No releases found');
+    }
+    const version = release.tag_name.replace('v', '');
+    const assets = (release.assets || []).filter(asset => ARTIFACT_PATTERN.test(asset.name));
+
+    const artifacts = {};
+    let complete = true;
+    await Promise.all(assets.map(async (asset) => {
+      try {
+        const entry = await this.ensureArtifact(version, asset);
+        artifacts[asset.name] = {
+          url: `artifacts/${version}/${asset.name}`,
+          size: entry.size,
+          sha256: entry.sha256,
+          deltas: await this.availableDeltas(version, asset.name)
+        };
+      } catch (error) {
+        console.error(`Failed to cache ${asset.name} ${version}:`, error.message);
+        complete = false;
+      }
+    }));
+
+    return { manifest: { version, release_notes: release.body || '', artifacts }, complete };
+  }
+
+  // Called when the release poll sees a new version
+  prefetch() {
+    this.getManifest({ refresh: true })
+      .then(async (manifest) => {
+        this.prune(manifest.version);
+        await this.buildDeltas(manifest);
+        // Rebuild so the cached manifest lists the new deltas
+        await this.getManifest({ refresh: true });
+      })
+      .catch(error => console.error('Artifact prefetch failed:', error.message));
+  }
+
+  deltaName(name, fromVersion) {
+    return `${name}.from-${fromVersion}.delta`;
+  }
+
+  previousVersions(version) {
+    try {
+      return fs.readdirSync(this.directory).filter(v => v !== version);
+    } catch (error) {
+      return [];
+    }
+  }
+
+  // Patches from each older cached build to this one, keyed by the agent's installed version
+  async availableDeltas(version, name) {
+    const deltas = {};
+    for (const fromVersion of this.previousVersions(version)) {
+      const entry = await this.readEntry(version, this.deltaName(name, fromVersion));
+      if (entry) {
+        deltas[fromVersion] = {
+          url: `artifacts/${version}/${this.deltaName(name, fromVersion)}`,
+          size: entry.size,
+          sha256: entry.sha256
+        };
+      }
+    }
+    return deltas;
+  }
+
+  async buildDeltas(manifest) {
+    for (const name of Object.keys(manifest.artifacts)) {
+      const target = this.artifactPath(manifest.version, name);
+      for (const fromVersion of this.previousVersions(manifest.version)) {
+        const base = this.artifactPath(fromVersion, name);
+        const patch = this.artifactPath(manifest.version, this.deltaName(name, fromVersion));
+        if (!fs.existsSync(`${base}.sha256`) || fs.existsSync(`${patch}.sha256`)) continue;
+        try {
+          const { size, sha256 } = await createPatchFile(base, target, patch);
+          fs.writeFileSync(`${patch}.sha256`, sha256);
+          console.log(`Built delta ${name} ${fromVersion} -> ${manifest.version} (${size} bytes)`);
+        } catch (error) {
+          console.error(`Failed to build delta for ${name} from ${fromVersion}:`, error.message);
+        }
+      }
+    }
+  }
+
+  artifactPath(version, name) {
+    return path.join(this.directory, path.basename(version), path.basename(name));
+  }
+
+  ensureArtifact(version, asset) {
+    const key = `${version}/${asset.name}`;
+    if (this.inflight.has(key)) {
+      return this.inflight.get(key);
+    }
+
+    const promise = this.readEntry(version, asset.name).then(entry => {
+      if (entry) return entry;
+      console.log(`Caching update artifact ${asset.name} ${version}`);
+      return this.download(asset.browser_download_url, this.artifactPath(version, asset.name), this.expectedDigest(asset));
+    });
+    this.inflight.set(key, promise);
+    // Drop failures so the next manifest request retries
+    promise.catch(() => this.inflight.delete(key));
+    return promise;
+  }
+
+  async readEntry(version, name) {
+    const file = this.artifactPath(version, name);
+    try {
+      const [sha256, stat] = await Promise.all([
+        fs.promises.readFile(`${file}.sha256`, 'utf8'),
+        fs.promises.stat(file)
+      ]);
+      return { size: stat.size, sha256: sha256.trim() };
+    } catch (error) {
+      return null;
+    }
+  }
+
+  // What GitHub says the asset should be; `digest` ("sha256:<hex>") is only set on newer releases
+  expectedDigest(asset) {
+    const expected = { size: asset.size };
+    if (typeof asset.digest === 'string' && asset.digest.startsWith('sha256:')) {
+      expected.sha256 = asset.digest.slice('sha256:'.length).toLowerCase();
+    }
+    return expected;
+  }
+
+  // Resolves once the file is on disk and matches `expected`; a truncated or
+  // corrupted transfer is deleted instead of being served to the fleet
+  download(url, destination, expected = {}, redirects = 0) {
+    return new Promise((resolve, reject) => {
+      const client = url.startsWith('https:') ? https : http;
+      client.get(url, { headers: { 'User-Agent': 'nxtclone-updater' } }, (res) => {
+        if (res.statusCode >= 300 && res.statusCode < 400 && res.headers.location) {
+          res.resume();
+          if (redirects >= MAX_REDIRECTS) {
+            reject(new Error('Too many redirects'));
+            return;
+          }
+          const next = new URL(res.headers.location, url).toString();
+          this.download(next, destination, expected, redirects + 1).then(resolve, reject);
+          return;
+        }
+        if (res.statusCode !== 200) {
+          res.resume();
+          reject(new Error(`HTTP ${res.statusCode} for ${url}`));
+          return;
+        }
+
+        fs.mkdirSync(path.dirname(destination), { recursive: true });
+        const partial = `${destination}.part`;
+        const out = fs.createWriteStream(partial);
+        const hash = crypto.createHash('sha256');
+        let size = 0;
+        const fail = (error) => {
+          out.destroy();
+          fs.rm(partial, { force: true }, () => reject(error));
+        };
+
+        res.on('data', chunk => {
+          hash.update(chunk);
+          size += chunk.length;
+        });
+        res.on('aborted', () => fail(new Error(`Download of ${url} was interrupted`)));
+        res.on('error', fail);
+        out.on('error', fail);
+        out.on('finish', () => {
+          try {
+            const sha256 = hash.digest('hex');
+            if (expected.size !== undefined && size !== expected.size) {
+              fail(new Error(`Size mismatch for ${url}: expected ${expected.size}, got ${size}`));
+              return;
+            }
+            if (expected.sha256 && sha256 !== expected.sha256) {
+              fail(new Error(`Checksum mismatch for ${url}: expected ${expected.sha256}, got ${sha256}`));
+              return;
+            }
+            // The checksum file is written last and marks the artifact complete
+            fs.renameSync(partial, destination);
+            fs.writeFileSync(`${destination}.sha256`, sha256);
+            resolve({ size, sha256 });
+          } catch (error) {
+            reject(error);
+          }
+        });
+        res.pipe(out);
+      }).on('error', reject);
+    });
+  }
+
+  prune(currentVersion) {
+    let versions;
+    try {
+      versions = fs.readdirSync(this.directory);
+    } catch (error) {
+      return;
+    }
+    const stale = versions
+      .filter(version => version !== currentVersion)
+      .sort((a, b) => this.updater.compareVersions(b, a))
+      .slice(KEEP_VERSIONS - 1);
+    for (const version of stale) {
+      fs.rmSync(path.join(this.directory, version), { recursive: true, force: true });
+      for (const key of this.inflight.keys()) {
+        if (key.startsWith(`${version}/`)) this.inflight.delete(key);
+      }
+    }
+  }
+
+  serveArtifact(req, res) {
+    const file = this.artifactPath(req.params.version, req.params.name);
+    if (!fs.existsSync(`${file}.sha256`)) {
+      res.status(404).json({ error: 'Artifact not cached' });
+      return;
+    }
+    // sendFile handles Range requests and conditional GETs
+    res.sendFile(file, { maxAge: '7d', immutable: true });
+  }
+}
+
+module.exports = ArtifactCache;
@@ -0,0 +1,171 @@
+const { EventEmitter } = require('events');
+
+const CHANNEL_WINDOW = 256 * 1024;
+const CHANNEL_CHUNK = 32 * 1024;
+
+// One logical stream over an agent connection. Credit-based flow control: a
+// sender keeps at most `credit` bytes in flight and the receiver hands credit
+// back as it consumes. Closing is per direction; the channel is forgotten once
+// both sides have closed. Emits 'data' (chunk, message), 'end' (the peer's
+// channel_close, which may carry result fields) and 'error'.
+class Channel extends EventEmitter {
+  constructor(mux, id, kind, meta) {
+    super();
+    this.mux = mux;
+    this.id = id;
+    this.kind = kind;
+    this.meta = meta || {};
+    this.credit = mux.window;
+    this.creditWaiters = [];
+    this.unacknowledged = 0;
+    this.closed = false;
+    this.remoteClosed = false;
+    this.error = null;
+  }
+
+  // `fields` ride along on every chunk message
+  async write(buffer, fields = {}) {
+    for (let start = 0; start < buffer.length; start += this.mux.chunkSize) {
+      const chunk = buffer.subarray(start, start + this.mux.chunkSize);
+      while (this.credit < chunk.length) {
+        if (this.error) throw this.error;
+        await new Promise(resolve => this.creditWaiters.push(resolve));
+      }
+      if (this.error) throw this.error;
+      this.credit -= chunk.length;
+      this.mux.send({ ...fields, type: 'channel_data', channel: this.id, data: this.mux.pack(chunk) });
+    }
+  }
+
+  close(error, fields = {}) {
+    if (this.closed) return;
+    this.closed = true;
+    if (this.remoteClosed || error) this.mux.channels.delete(this.id);
+    const message = { ...fields, type: 'channel_close', channel: this.id };
+    if (error) message.error = error.message || String(error);
+    this.mux.send(message);
+  }
+
+  // Called once a received chunk has been processed, returning its credit to the sender
+  consumed(length) {
+    this.unacknowledged += length;
+    if (this.unacknowledged >= this.mux.window / 4) {
+      this.mux.send({ type: 'channel_window', channel: this.id, credit: this.unacknowledged });
+      this.unacknowledged = 0;
+    }
+  }
+
+  addCredit(credit) {
+    this.credit += credit;
+    this.wake();
+  }
+
+  wake() {
+    const waiters = this.creditWaiters;
+    this.creditWaiters = [];
+    waiters.forEach(resolve => resolve());
+  }
+
+  end(message) {
+    this.remoteClosed = true;
+    // The peer won't read any more either, so stop our writers
+    this.error = new Error('Channel closed by peer');
+    this.wake();
+    this.emit('end', message);
+  }
+
+  fail(error) {
+    this.closed = true;
+    this.remoteClosed = true;
+    this.error = error;
+    this.wake();
+    if (this.listenerCount('error')) this.emit('error', error);
+  }
+}
+
+// Multiplexes channels over one agent connection. Agent-opened channels have
+// odd ids and server-opened ones even ids; on(kind) handles agent-opened ones.
+class ChannelMux {
+  constructor(send, binary, { window = CHANNEL_WINDOW, chunkSize = CHANNEL_CHUNK } = {}) {
+    this.send = send;
+    this.binary = binary;
+    this.window = window;
+    this.chunkSize = Math.min(chunkSize, window);
+    this.channels = new Map();
+    this.handlers = new Map();
+    this.nextId = 2;
+  }
+
+  on(kind, handler) {
+    this.handlers.set(kind, handler);
+  }
+
+  // Binary frames carry raw bytes, JSON frames carry base64
+  pack(chunk) {
+    return this.binary() ? chunk : chunk.toString('base64');
+  }
+
+  unpack(data) {
+    return Buffer.isBuffer(data) ? data : Buffer.from(data, 'base64');
+  }
+
+  open(kind, meta) {
+    const channel = new Channel(this, this.nextId, kind, meta);
+    this.nextId += 2;
+    this.channels.set(channel.id, channel);
+    this.send({ type: 'channel_open', channel: channel.id, kind, meta: channel.meta });
+    return channel;
+  }
+
+  handle(message) {
+    if (message.type === 'channel_open') {
+      this.accept(message);
+      return;
+    }
+    const channel = this.channels.get(message.channel);
+    if (!channel) return;
+
+    switch (message.type) {
+      case 'channel_data': {
+        const chunk = this.unpack(message.data);
+        channel.emit('data', chunk, message);
+        // Listeners that apply backpressure call consumed() themselves
+        if (!channel.manualCredit) channel.consumed(chunk.length);
+        break;
+      }
+      case 'channel_window':
+        channel.addCredit(Number(message.credit) || 0);
+        break;
+      case 'channel_close':
+        if (message.error) {
+          // An abort ends both directions
+          this.channels.delete(channel.id);
+          channel.fail(new Error(message.error));
+        } else {
+          if (channel.closed) this.channels.delete(channel.id);
+          channel.end(message);
+        }
+        break;
+    }
+  }
+
+  accept(message) {
+    const channel = new Channel(this, message.channel, message.kind, message.meta);
+    const handler = this.handlers.get(channel.kind);
+    if (!handler) {
+      this.send({ type: 'channel_close', channel: channel.id, error: `Unknown channel kind: ${channel.kind}` });
+      return;
+    }
+    this.channels.set(channel.id, channel);
+    handler(channel);
+  }
+
+  closeAll(error) {
+    for (const channel of this.channels.values()) {
+      channel.fail(error);
+    }
+    this.channels.clear();
+  }
+}
+
+module.exports = { ChannelMux, CHANNEL_WINDOW, CHANNEL_CHUNK };
@@ -199,7 +199,7 @@ class Database {
     });
   }
   
-  storeMetrics(machineId, metrics) {
+  storeMetrics(machineId, metrics, timestamp = Date.now()) {
     const stmt = this.db.prepare(`
       INSERT INTO metrics (machine_id, cpu_percent, memory_percent, disk_percent, process_count, timestamp)
       VALUES (?, ?, ?, ?, ?, ?)
@@ -210,7 +210,7 @@ class Database {
       metrics.memory_percent || 0, 
       metrics.disk_percent || 0, 
       metrics.process_count || 0, 
-      Date.now()
+      timestamp
     );
     stmt.finalize();
   }
@@ -0,0 +1,148 @@
+// Binary delta between two agent builds, applied by agents/binary_delta.py.
+//
+// Format: 'SWDELTA1', old size, new size (uint64 BE), sha256(old), sha256(new),
+// then a deflated stream of ops:
+//   0x01 COPY   uint64 offset, uint32 length  -- bytes from the old file
+//   0x02 INSERT uint32 length, bytes          -- literal bytes
+// Matching is rsync-style: old blocks are indexed by a rolling checksum and the
+// new file is scanned byte by byte, so content that moved still becomes a COPY.
+const crypto = require('crypto');
+const fs = require('fs');
+const zlib = require('zlib');
+const { Worker, isMainThread, parentPort, workerData } = require('worker_threads');
+
+const MAGIC = Buffer.from('SWDELTA1');
+const OP_COPY = 0x01;
+const OP_INSERT = 0x02;
+const BLOCK_SIZE = 2048;
+const MAX_CANDIDATES = 8; // Per weak checksum, bounds work on repetitive data
+
+function weakChecksum(buf, start, end) {
+  let a = 0;
+  let b = 0;
+  for (let i = start; i < end; i++) {
+    a = (a + buf[i]) & 0xffff;
+    b = (b + a) & 0xffff;
+  }
+  return { a, b };
+}
+
+function indexBlocks(old) {
+  const index = new Map();
+  for (let offset = 0; offset + BLOCK_SIZE <= old.length; offset += BLOCK_SIZE) {
+    const { a, b } = weakChecksum(old, offset, offset + BLOCK_SIZE);
+    const key = (b << 16) | a;
+    const candidates = index.get(key);
+    if (!candidates) index.set(key, [offset]);
+    else if (candidates.length < MAX_CANDIDATES) candidates.push(offset);
+  }
+  return index;
+}
+
+class OpWriter {
+  constructor() {
+    this.chunks = [];
+  }
+
+  copy(offset, length) {
+    const op = Buffer.alloc(13);
+    op[0] = OP_COPY;
+    op.writeBigUInt64BE(BigInt(offset), 1);
+    op.writeUInt32BE(length, 9);
+    this.chunks.push(op);
+  }
+
+  insert(data) {
+    if (data.length === 0) return;
+    const op = Buffer.alloc(5);
+    op[0] = OP_INSERT;
+    op.writeUInt32BE(data.length, 1);
+    this.chunks.push(op, data);
+  }
+}
+
+function createPatch(old, next) {
+  const index = indexBlocks(old);
+  const ops = new OpWriter();
+  let literalStart = 0;
+  let pos = 0;
+  let a = 0;
+  let b = 0;
+  let rolling = false;
+
+  while (pos + BLOCK_SIZE <= next.length) {
+    if (!rolling) {
+      ({ a, b } = weakChecksum(next, pos, pos + BLOCK_SIZE));
+      rolling = true;
+    }
+
+    let matched = -1;
+    const candidates = index.get((b << 16) | a);
+    if (candidates) {
+      for (const offset of candidates) {
+        if (old.compare(next, pos, pos + BLOCK_SIZE, offset, offset + BLOCK_SIZE) === 0) {
+          matched = offset;
+          break;
+        }
+      }
+    }
+
+    if (matched >= 0) {
+      // Extend the match past the block boundary as far as the bytes agree
+      let length = BLOCK_SIZE;
+      while (pos + length < next.length && matched + length < old.length &&
+             next[pos + length] === old[matched + length]) {
+        length++;
+      }
+      ops.insert(next.subarray(literalStart, pos));
+      ops.copy(matched, length);
+      pos += length;
+      literalStart = pos;
+      rolling = false;
+      continue;
+    }
+
+    // Roll the checksum forward one byte
+    const out = next[pos];
+    const incoming = pos + BLOCK_SIZE < next.length ? next[pos + BLOCK_SIZE] : null;
+    pos++;
+    if (incoming === null) break;
+    a = (a - out + incoming) & 0xffff;
+    b = (b - BLOCK_SIZE * out + a) & 0xffff;
+  }
+  ops.insert(next.subarray(literalStart));
+
+  const header = Buffer.alloc(MAGIC.length + 16);
+  MAGIC.copy(header, 0);
+  header.writeBigUInt64BE(BigInt(old.length), MAGIC.length);
+  header.writeBigUInt64BE(BigInt(next.length), MAGIC.length + 8);
+  const oldHash = crypto.createHash('sha256').update(old).digest();
+  const newHash = crypto.createHash('sha256').update(next).digest();
+  const body = zlib.deflateSync(Buffer.concat(ops.chunks), { level: 9 });
+  return Buffer.concat([header, oldHash, newHash, body]);
+}
+
+// Build a patch file on a worker thread so the server's event loop keeps running
+function createPatchFile(oldPath, newPath, patchPath) {
+  return new Promise((resolve, reject) => {
+    const worker = new Worker(__filename, { workerData: { oldPath, newPath, patchPath } });
+    worker.once('message', resolve);
+    worker.once('error', reject);
+    worker.once('exit', code => {
+      if (code !== 0) reject(new Error(`Delta worker exited with code ${code}`));
+    });
+  });
+}
+
+if (!isMainThread && workerData) {
+  const { oldPath, newPath, patchPath } = workerData;
+  const patch = createPatch(fs.readFileSync(oldPath), fs.readFileSync(newPath));
+  fs.writeFileSync(`${patchPath}.part`, patch);
+  fs.renameSync(`${patchPath}.part`, patchPath);
+  parentPort.postMessage({
+    size: patch.length,
+    sha256: crypto.createHash('sha256').update(patch).digest('hex')
+  });
+}
+
+module.exports = { createPatch, createPatchFile };
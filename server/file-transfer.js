@@ -0,0 +1,195 @@
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const zlib = require('zlib');
+
+// Per-chunk CRC-32, matching Python's zlib.crc32; zlib.crc32 needs Node 20.15+
+const CRC_TABLE = Array.from({ length: 256 }, (_, n) => {
+  let c = n;
+  for (let k = 0; k < 8; k++) c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+  return c >>> 0;
+});
+const crc32 = zlib.crc32 || (buffer => {
+  let crc = 0xffffffff;
+  for (const byte of buffer) crc = CRC_TABLE[(crc ^ byte) & 0xff] ^ (crc >>> 8);
+  return (crc ^ 0xffffffff) >>> 0;
+});
+
+function hashFile(file) {
+  return new Promise((resolve, reject) => {
+    const hash = crypto.createHash('sha256');
+    fs.createReadStream(file)
+      .on('data', chunk => hash.update(chunk))
+      .on('error', reject)
+      .on('end', () => resolve(hash.digest('hex')));
+  });
+}
+
+// Agent paths may be Windows or POSIX; keep only the final component
+function remoteBasename(remotePath) {
+  return path.basename(remotePath.split(/[\\/]/).pop() || 'file');
+}
+
+// Streams files to and from agents over logical channels. Chunks carry their
+// offset and CRC-32, transfers end with a whole-file SHA-256 check, and an
+// interrupted transfer resumes from the .part file left on the receiving side.
+class FileTransfers {
+  constructor(queryAgent, directory = path.join(__dirname, 'file-transfers')) {
+    this.queryAgent = queryAgent;
+    this.directory = directory;
+    this.uploads = path.join(directory, '_uploads');
+  }
+
+  channels(client) {
+    if (!client.ws.channels) {
+      throw new Error('Agent does not support file transfer');
+    }
+    return client.ws.channels;
+  }
+
+  machineDirectory(hostname) {
+    return path.join(this.directory, path.basename(hostname));
+  }
+
+  // Pull a file from an agent into server storage
+  async getFile(client, remotePath) {
+    const mux = this.channels(client);
+    const directory = this.machineDirectory(client.hostname);
+    await fs.promises.mkdir(directory, { recursive: true });
+    const target = path.join(directory, remoteBasename(remotePath));
+    const partial = `${target}.part`;
+
+    let offset = 0;
+    try {
+      offset = (await fs.promises.stat(partial)).size;
+    } catch (error) {
+      // Nothing to resume
+    }
+    const handle = await fs.promises.open(partial, offset ? 'r+' : 'w');
+    await handle.truncate(offset);
+
+    return new Promise((resolve, reject) => {
+      const channel = mux.open('file_get', { path: remotePath, offset });
+      channel.manualCredit = true;
+      let position = offset;
+      let failed = null;
+      let writing = Promise.resolve();
+
+      // Whatever reached disk stays in the .part file for the next attempt
+      const fail = error => {
+        if (failed) return;
+        failed = error;
+        channel.close(error);
+        writing.then(() => handle.close()).catch(() => {});
+        reject(error);
+      };
+
+      channel.on('data', (chunk, message) => {
+        // Credit is only returned once the chunk is on disk, so a slow disk slows the sender
+        writing = writing.then(async () => {
+          if (failed) return;
+          if (message.offset !== position) {
+            return fail(new Error(`Expected data at offset ${position}, got ${message.offset}`));
+          }
+          if (crc32(chunk) !== message.crc) {
+            return fail(new Error(`Checksum mismatch in chunk at offset ${position}`));
+          }
+          await handle.write(chunk, 0, chunk.length, position);
+          position += chunk.length;
+          channel.consumed(chunk.length);
+        });
+      });
+
+      channel.on('end', async (message) => {
+        channel.close();
+        try {
+          await writing;
+          if (failed) return;
+          await handle.close();
+          const sha256 = await hashFile(partial);
+          if (position !== message.size || sha256 !== message.sha256) {
+            await fs.promises.rm(partial, { force: true });
+            throw new Error(`File hash mismatch after transfer (${position} bytes, sha256 ${sha256})`);
+          }
+          await fs.promises.rename(partial, target);
+          resolve({ file: path.basename(target), size: position, sha256, resumedFrom: offset });
+        } catch (error) {
+          reject(error);
+        }
+      });
+
+      channel.on('error', fail);
+    });
+  }
+
+  // Push a server-side file to an agent, resuming a partial push if the agent kept one
+  async putFile(client, localFile, remotePath, options = {}) {
+    const mux = this.channels(client);
+    const { size } = await fs.promises.stat(localFile);
+    const sha256 = await hashFile(localFile);
+
+    const stat = await this.queryAgent(client, 'file_stat', { path: remotePath });
+    const offset = stat.partial_size > 0 && stat.partial_size <= size ? stat.partial_size : 0;
+
+    const channel = mux.open('file_put', { path: remotePath, size, sha256, offset, executable: Boolean(options.executable) });
+    const reply = new Promise((resolve, reject) => {
+      channel.on('end', resolve);
+      channel.on('error', reject);
+    });
+    reply.catch(() => {});
+
+    const handle = await fs.promises.open(localFile, 'r');
+    const buffer = Buffer.allocUnsafe(mux.chunkSize);
+    try {
+      let position = offset;
+      while (position < size) {
+        const { bytesRead } = await handle.read(buffer, 0, buffer.length, position);
+        if (!bytesRead) break;
+        const chunk = buffer.subarray(0, bytesRead);
+        // The chunk is encoded into its frame before write() returns, so the buffer is reused
+        await channel.write(chunk, { offset: position, crc: crc32(chunk) });
+        position += bytesRead;
+      }
+      channel.close();
+    } catch (error) {
+      channel.close(error);
+      throw channel.error && channel.error !== error ? channel.error : error;
+    } finally {
+      await handle.close();
+    }
+
+    const result = await reply;
+    return { size: result.size, sha256: result.sha256, resumedFrom: offset };
+  }
+
+  // Store an uploaded file (streamed, never buffered) so it can be pushed to agents
+  saveUpload(req, name) {
+    const target = path.join(this.uploads, path.basename(name));
+    return new Promise((resolve, reject) => {
+      fs.mkdirSync(this.uploads, { recursive: true });
+      const out = fs.createWriteStream(`${target}.part`);
+      req.pipe(out);
+      req.on('error', reject);
+      out.on('error', reject);
+      out.on('finish', async () => {
+        try {
+          await fs.promises.rename(`${target}.part`, target);
+          const { size } = await fs.promises.stat(target);
+          resolve({ name: path.basename(target), size, sha256: await hashFile(target) });
+        } catch (error) {
+          reject(error);
+        }
+      });
+    });
+  }
+
+  uploadPath(name) {
+    return path.join(this.uploads, path.basename(name));
+  }
+
+  downloadPath(hostname, name) {
+    return path.join(this.machineDirectory(hostname), path.basename(name));
+  }
+}
+
+module.exports = FileTransfers;
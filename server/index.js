@@ -1,25 +1,66 @@
 const WebSocket = require('ws');
 const express = require('express');
 const http = require('http');
+const fs = require('fs');
 const path = require('path');
+const crypto = require('crypto');
+const zlib = require('zlib');
 const { v4: uuidv4 } = require('uuid');
 const Database = require('./database');
 const Updater = require('./updater');
+const ArtifactCache = require('./artifact-cache');
+const RolloutManager = require('./rollout');
+const FileTransfers = require('./file-transfer');
 const AuthManager = require('./auth');
 const DiscordNotifier = require('./discord');
 const cookieParser = require('cookie-parser');
+const wire = require('./wire');
+const { ChannelMux, CHANNEL_WINDOW, CHANNEL_CHUNK } = require('./channels');
+
+const COMMAND_OUTPUT_GRACE = 30 * 1000; // Keep finished streamed output this long for live pollers
+const COMMAND_RESULT_TTL = 10 * 60 * 1000; // Drop unfetched results and never-finished output after this
+
+// Agents send a full metrics keyframe every N heartbeats when delta mode is on
+const HEARTBEAT_KEYFRAME_INTERVAL = 20;
+const AGENT_STATS_EVERY = 4; // Heartbeats between agent self-telemetry blocks (~1 minute)
+
+// Registrations accepted per second before agents are told to back off
+const MAX_REGISTRATIONS_PER_SECOND = 50;
+const RETRY_AFTER_SECONDS = 5;
+const RETRY_AFTER_WINDOW = 60; // Spread deferred agents over this many seconds
+
+// Parameters each agent query accepts over /api/query, with the type the agent expects
+const QUERY_PARAMS = {
+  version: {},
+  system_info: {},
+  metrics: {},
+  uptime: {},
+  agent_stats: {},
+  processes: { limit: 'number', sort: 'string' },
+  profile: { seconds: 'number', interval_ms: 'number', memory: 'boolean', limit: 'number' },
+  file_stat: { path: 'string' }
+};
 
 class RMMServer {
   constructor() {
     this.app = express();
     this.server = http.createServer(this.app);
-    this.wss = new WebSocket.Server({ server: this.server });
+    this.wss = new WebSocket.Server({
+      server: this.server,
+      perMessageDeflate: { threshold: 1024 } // Only compress frames worth compressing
+    });
     this.clients = new Map();
     this.db = new Database();
-    this.updater = new Updater();
+    this.updater = new Updater('wslabn', 'nxtclone');
+    this.artifactCache = new ArtifactCache(this.updater);
+    this.rollout = new RolloutManager();
+    this.fileTransfers = new FileTransfers((client, query, params) => this.queryAgent(client, query, params));
     this.auth = new AuthManager();
     this.discord = new DiscordNotifier();
     this.groups = new Map(); // Store groups from web clients
+    this.registrationTimes = [];
+    this.pendingQueries = new Map(); // Query id -> { resolve, reject, timer }
+    this.pythonScripts = new Map(); // Script sha256 -> source, so scripts can be rerun by hash
     
     // Initialize log storage
     global.serverLogs = global.serverLogs || [];
@@ -73,6 +114,19 @@ class RMMServer {
       res.sendFile(path.join(__dirname, '../web/login.html'));
     });
     
+    // Update mirror for agents: cached release artifacts with SHA-256 checksums
+    this.app.get('/agent-updates/manifest.json', async (req, res) => {
+      try {
+        res.json(await this.artifactCache.getManifest());
+      } catch (error) {
+        res.status(503).json({ error: error.message });
+      }
+    });
+    
+    this.app.get('/agent-updates/artifacts/:version/:name', (req, res) => {
+      this.artifactCache.serveArtifact(req, res);
+    });
+    
     this.app.post('/api/login', (req, res) => {
       const { username, password } = req.body;
       const sessionId = this.auth.authenticate(username, password);
@@ -279,7 +333,7 @@ class RMMServer {
           return res.json({ success: false, error: 'Machine not connected' });
         }
         
-        client.ws.send(JSON.stringify({ type: 'uninstall_request' }));
+        this.send(client.ws, { type: 'uninstall_request' });
         res.json({ success: true });
       } catch (error) {
         res.json({ success: false, error: error.message });
@@ -309,7 +363,7 @@ class RMMServer {
     });
 
     this.app.post('/api/command', (req, res) => {
-      const { machineId, command } = req.body;
+      const { machineId, command, session, warm, env, cwd } = req.body;
       const client = this.clients.get(machineId);
       
       if (!client || client.ws.readyState !== WebSocket.OPEN) {
@@ -317,15 +371,190 @@ class RMMServer {
       }
 
       const commandId = uuidv4();
-      client.ws.send(JSON.stringify({
+      const message = {
         type: 'command',
         id: commandId,
-        command: command
-      }));
+        command: command,
+        stream: true
+      };
+      // Warm shells: `session` keeps env/cwd between commands, `warm` borrows any pooled shell
+      if (session && client.capabilities.shell_sessions) {
+        Object.assign(message, { session, env, cwd });
+      } else if (warm && client.capabilities.shell_sessions) {
+        message.warm = true;
+      }
+      this.send(client.ws, message);
+
+      res.json({ success: true, commandId });
+    });
+
+    this.app.post('/api/command/cancel', (req, res) => {
+      const { machineId, commandId } = req.body;
+      const client = this.clients.get(machineId);
+
+      if (!client || client.ws.readyState !== WebSocket.OPEN) {
+        return res.json({ success: false, error: 'Machine offline' });
+      }
+
+      this.send(client.ws, {
+        type: 'command_cancel',
+        id: commandId
+      });
 
       res.json({ success: true, commandId });
     });
 
+    this.app.post('/api/command/session/close', (req, res) => {
+      const { machineId, session } = req.body;
+      const client = this.clients.get(machineId);
+
+      if (!client || client.ws.readyState !== WebSocket.OPEN) {
+        return res.json({ success: false, error: 'Machine offline' });
+      }
+
+      this.send(client.ws, {
+        type: 'shell_session_close',
+        session
+      });
+
+      res.json({ success: true, session });
+    });
+
+    this.app.get('/api/query/:machineId/:query', async (req, res) => {
+      const { machineId, query } = req.params;
+      const client = this.clients.get(machineId);
+
+      if (!client || client.ws.readyState !== WebSocket.OPEN) {
+        return res.json({ success: false, error: 'Machine offline' });
+      }
+
+      try {
+        const result = await this.queryAgent(client, query, this.parseQueryParams(query, req.query));
+        res.json({ success: true, result });
+      } catch (error) {
+        res.json({ success: false, error: error.message });
+      }
+    });
+
+    // Agent self-telemetry: the block from the last heartbeat, or ?fresh=1 for the full snapshot
+    this.app.get('/api/agent-stats/:machineId', async (req, res) => {
+      const client = this.clients.get(req.params.machineId);
+      if (!client) {
+        return res.json({ success: false, error: 'Machine not found' });
+      }
+      if (!req.query.fresh) {
+        return res.json({ success: true, stats: client.agentStats || null, receivedAt: client.agentStatsAt || null });
+      }
+      if (client.ws.readyState !== WebSocket.OPEN) {
+        return res.json({ success: false, error: 'Machine offline' });
+      }
+      try {
+        res.json({ success: true, stats: await this.queryAgent(client, 'agent_stats', {}) });
+      } catch (error) {
+        res.json({ success: false, error: error.message });
+      }
+    });
+
+    // Sampling profile of the agent process: collapsed stacks plus optional allocation sites
+    this.app.post('/api/profile/:machineId', async (req, res) => {
+      const client = this.clients.get(req.params.machineId);
+      if (!client || client.ws.readyState !== WebSocket.OPEN) {
+        return res.json({ success: false, error: 'Machine offline' });
+      }
+      const { seconds = 10, interval_ms = 10, memory = false, limit = 500 } = req.body || {};
+      const params = {
+        seconds: Math.min(Math.max(Number(seconds) || 10, 0.1), 60),
+        interval_ms: Number(interval_ms) || 10,
+        memory: Boolean(memory),
+        limit: Number(limit) || 500
+      };
+      try {
+        // The agent answers once sampling finishes, so allow for the whole run
+        const profile = await this.queryAgent(client, 'profile', params, (params.seconds + 15) * 1000);
+        res.json({ success: true, profile });
+      } catch (error) {
+        res.json({ success: false, error: error.message });
+      }
+    });
+
+    // Run a Python script in the agent's warm worker pool; send `code`, or the `hash` of a script sent before
+    this.app.post('/api/python/:machineId', async (req, res) => {
+      const client = this.clients.get(req.params.machineId);
+      if (!client || client.ws.readyState !== WebSocket.OPEN) {
+        return res.json({ success: false, error: 'Machine offline' });
+      }
+      const { code, hash, args = {}, timeout = 30, memory_mb } = req.body || {};
+      if (!code && !hash) {
+        return res.json({ success: false, error: 'code or hash is required' });
+      }
+      try {
+        const result = await this.execPython(client, {
+          code,
+          hash,
+          args,
+          timeout: Math.min(Math.max(Number(timeout) || 30, 1), 600),
+          memoryMb: Number(memory_mb) || undefined
+        });
+        if (result.missing_script) {
+          return res.json({ success: false, error: result.error.message });
+        }
+        res.json({ success: true, result });
+      } catch (error) {
+        res.json({ success: false, error: error.message });
+      }
+    });
+
+    // File transfer: pull files from agents, or upload once and push to many agents
+    this.app.post('/api/files/get', async (req, res) => {
+      const { machineId, path: remotePath } = req.body;
+      const client = this.clients.get(machineId);
+      if (!client || client.ws.readyState !== WebSocket.OPEN) {
+        return res.json({ success: false, error: 'Machine offline' });
+      }
+      try {
+        res.json({ success: true, ...(await this.fileTransfers.getFile(client, remotePath)) });
+      } catch (error) {
+        res.json({ success: false, error: error.message });
+      }
+    });
+
+    this.app.get('/api/files/download/:machineId/:name', (req, res) => {
+      const file = this.fileTransfers.downloadPath(req.params.machineId, req.params.name);
+      if (!fs.existsSync(file)) {
+        return res.status(404).json({ error: 'File not found' });
+      }
+      res.download(file);
+    });
+
+    // Raw request body, e.g. curl --data-binary @installer.exe /api/files/upload/installer.exe
+    this.app.post('/api/files/upload/:name', async (req, res) => {
+      try {
+        res.json({ success: true, ...(await this.fileTransfers.saveUpload(req, req.params.name)) });
+      } catch (error) {
+        res.json({ success: false, error: error.message });
+      }
+    });
+
+    this.app.post('/api/files/put', async (req, res) => {
+      const { machineIds = [], name, path: remotePath, executable } = req.body;
+      const localFile = this.fileTransfers.uploadPath(name || '');
+      if (!name || !fs.existsSync(localFile)) {
+        return res.json({ success: false, error: 'Upload the file first' });
+      }
+      const results = await Promise.all(machineIds.map(async (machineId) => {
+        const client = this.clients.get(machineId);
+        if (!client || client.ws.readyState !== WebSocket.OPEN) {
+          return { machineId, success: false, error: 'Machine offline' };
+        }
+        try {
+          return { machineId, success: true, ...(await this.fileTransfers.putFile(client, localFile, remotePath, { executable })) };
+        } catch (error) {
+          return { machineId, success: false, error: error.message };
+        }
+      }));
+      res.json({ success: results.every(result => result.success), results });
+    });
+
     this.app.get('/api/update-check', async (req, res) => {
       try {
         const updateInfo = await this.updater.checkForUpdates();
@@ -342,11 +571,29 @@ class RMMServer {
       if (result) {
         res.json({ success: true, result });
         global.commandResults.delete(commandId); // Clean up after retrieval
+        global.commandOutputs?.delete(commandId);
       } else {
         res.json({ success: false, error: 'Result not found or expired' });
       }
     });
 
+    this.app.get('/api/command-output/:id', (req, res) => {
+      // Live output of a streamed command; pass ?after=<seq> to get only new chunks
+      const commandId = req.params.id;
+      const after = parseInt(req.query.after) || 0;
+      const output = global.commandOutputs?.get(commandId);
+
+      if (output) {
+        res.json({
+          success: true,
+          chunks: output.chunks.filter(chunk => chunk.seq > after),
+          done: output.done
+        });
+      } else {
+        res.json({ success: false, error: 'Output not found or expired' });
+      }
+    });
+
     this.app.get('/api/update-status', (req, res) => {
       const statuses = Array.from(global.updateStatuses?.entries() || []).map(([hostname, status]) => ({
         hostname,
@@ -363,12 +610,27 @@ class RMMServer {
         return res.json({ success: false, error: 'Machine not connected' });
       }
       
-      const updateCommand = { type: 'update_request' };
-      client.ws.send(JSON.stringify(updateCommand));
+      // Targeted manual updates bypass the fleet rollout policy
+      const updateCommand = { type: 'update_request', force: true };
+      this.send(client.ws, updateCommand);
       
       res.json({ success: true, machineId });
     });
 
+    this.app.get('/api/rollout', this.auth.requireAuth.bind(this.auth), (req, res) => {
+      res.json(this.rollout.summary());
+    });
+
+    this.app.post('/api/rollout', this.auth.requireAuth.bind(this.auth), (req, res) => {
+      try {
+        const policy = this.rollout.setPolicy(req.body || {});
+        this.broadcastRolloutPolicy();
+        res.json({ success: true, policy });
+      } catch (error) {
+        res.status(400).json({ success: false, error: error.message });
+      }
+    });
+
     this.app.post('/api/update-agents', (req, res) => {
       // Clear previous update statuses
       global.updateStatuses = new Map();
@@ -381,7 +643,7 @@ class RMMServer {
       let updated = 0;
       for (const client of this.clients.values()) {
         if (client.ws.readyState === WebSocket.OPEN) {
-          client.ws.send(JSON.stringify(updateCommand));
+          this.send(client.ws, updateCommand);
           updated++;
         }
       }
@@ -467,10 +729,10 @@ class RMMServer {
         // Send config update to agent if connected
         const client = this.clients.get(machineId);
         if (client && client.ws.readyState === WebSocket.OPEN) {
-          client.ws.send(JSON.stringify({
+          this.send(client.ws, {
             type: 'config_update',
             config: { [configKey]: configValue }
-          }));
+          });
         }
         
         res.json({ success: true });
@@ -514,11 +776,12 @@ class RMMServer {
           const client = this.clients.get(member.id);
           if (client && client.ws.readyState === WebSocket.OPEN) {
             const commandId = uuidv4();
-            client.ws.send(JSON.stringify({
+            this.send(client.ws, {
               type: 'command',
               id: commandId,
-              command: command
-            }));
+              command: command,
+              stream: true
+            });
             results.push({ machineId: member.id, commandId, status: 'sent' });
           } else {
             results.push({ machineId: member.id, status: 'offline' });
@@ -544,10 +807,10 @@ class RMMServer {
           // Send config update to agent if connected
           const client = this.clients.get(member.id);
           if (client && client.ws.readyState === WebSocket.OPEN) {
-            client.ws.send(JSON.stringify({
+            this.send(client.ws, {
               type: 'config_update',
               config: { [configKey]: configValue }
-            }));
+            });
           }
         }
         
@@ -558,13 +821,22 @@ class RMMServer {
     });
   }
 
+  send(ws, message) {
+    // Encode in whatever wire format was negotiated with this agent
+    if (ws.wireFormat === wire.WIRE_FORMAT) {
+      ws.send(wire.encode(message));
+    } else {
+      ws.send(JSON.stringify(message));
+    }
+  }
+
   setupWebSocket() {
     this.wss.on('connection', (ws) => {
       console.log('New connection');
 
-      ws.on('message', (data) => {
+      ws.on('message', (data, isBinary) => {
         try {
-          const message = JSON.parse(data);
+          const message = isBinary ? wire.decode(data) : JSON.parse(data);
           this.handleMessage(ws, message);
         } catch (error) {
           console.error('Invalid message:', error);
@@ -572,6 +844,7 @@ class RMMServer {
       });
 
       ws.on('close', () => {
+        if (ws.channels) ws.channels.closeAll(new Error('Connection closed'));
         // Find and remove client
         for (const [id, client] of this.clients.entries()) {
           if (client.ws === ws) {
@@ -592,38 +865,145 @@ class RMMServer {
   handleMessage(ws, message) {
     switch (message.type) {
       case 'register':
+        // Shed reconnect storms before doing any per-agent work
+        if (this.isRegistrationStorm()) {
+          this.send(ws, {
+            type: 'retry_after',
+            seconds: RETRY_AFTER_SECONDS,
+            window: RETRY_AFTER_WINDOW
+          });
+          ws.close(1013, 'Try again later');
+          break;
+        }
+        
         // Use hostname as static ID
         const clientId = message.hostname;
+        
+        // A valid resume token lets the agent skip resending unchanged static info
+        const previous = this.clients.get(clientId);
+        const resumed = !!(message.resume_token && previous && previous.resumeToken === message.resume_token);
+        let systemInfo = { ...(message.system_info || {}), ...(message.inventory || {}) };
+        if (resumed) {
+          systemInfo = { ...previous.systemInfo, ...systemInfo };
+        }
+        
         const client = {
           id: clientId,
           ws: ws,
           hostname: message.hostname,
           platform: message.platform,
-          systemInfo: message.system_info || {},
+          systemInfo: systemInfo,
+          systemInfoHash: message.system_info_hash || null,
+          inventoryHash: message.inventory ? message.inventory_hash : (resumed ? previous.inventoryHash : null),
+          detailsCollected: (resumed && previous.detailsCollected) || !!message.inventory,
+          resumeToken: uuidv4(),
           agentVersion: message.agentVersion || 'Unknown',
+          capabilities: message.capabilities || {},
           metrics: {},
+          heartbeatSeq: 0,
           lastSeen: Date.now(),
           status: 'online'
         };
         
         this.clients.set(clientId, client);
-        console.log(`Machine registered: ${message.hostname} (${message.platform}) - Agent v${message.agentVersion || 'Unknown'}`);
+        console.log(`Machine ${resumed ? 'resumed' : 'registered'}: ${message.hostname} (${message.platform}) - Agent v${message.agentVersion || 'Unknown'}`);
         
         // Store in database with agent version
-        this.db.updateMachine(clientId, message.hostname, message.platform, 'online', message.system_info, message.agentVersion);
+        this.db.updateMachine(clientId, message.hostname, message.platform, 'online', client.systemInfo, message.agentVersion);
         
         // If no version provided, try to get it via command
         if (!message.agentVersion || message.agentVersion === 'Unknown') {
           this.getAgentVersion(client);
         }
         
-        // Automatically collect detailed system information
-        this.getSystemDetails(client);
+        // Agents without a native inventory collector get the shell-based probe (once per session)
+        if (!client.detailsCollected && !client.capabilities.inventory) {
+          this.getSystemDetails(client);
+        }
         
-        ws.send(JSON.stringify({
+        const registeredMsg = {
           type: 'registered',
-          id: clientId
-        }));
+          id: clientId,
+          resume_token: client.resumeToken,
+          info_hash: client.systemInfoHash,
+          inventory_hash: client.inventoryHash
+        };
+        
+        // The agent left out its static info expecting a resume we can't honor
+        const missingInventory = client.capabilities.inventory && !message.inventory;
+        if ((!message.system_info || missingInventory) && !resumed) {
+          registeredMsg.resend_info = true;
+        }
+        
+        // Accept delta-encoded heartbeats from agents that support them
+        if (client.capabilities.heartbeat_delta) {
+          registeredMsg.heartbeat_delta = {
+            enabled: true,
+            keyframe_interval: HEARTBEAT_KEYFRAME_INTERVAL
+          };
+        }
+        
+        // Ask the agent to replay anything it spooled while disconnected
+        if (client.capabilities.offline_spool) {
+          registeredMsg.spool_replay = true;
+        }
+        
+        // The server watches releases for the fleet; agents only poll as a safety net
+        if (client.capabilities.release_push) {
+          registeredMsg.release_push = true;
+          const latestRelease = this.updater.getLatestVersion();
+          if (latestRelease) {
+            registeredMsg.latest_release = latestRelease;
+          }
+        }
+        
+        // Staged rollout limits the agent applies before installing an update
+        registeredMsg.rollout = this.rollout.policy;
+        
+        // Ask for a compact self-telemetry block every few heartbeats
+        if (client.capabilities.agent_stats) {
+          registeredMsg.agent_stats = { every: AGENT_STATS_EVERY };
+        }
+        
+        // Switch to the compact binary format if the agent supports it
+        if ((client.capabilities.wire_formats || []).includes(wire.WIRE_FORMAT)) {
+          registeredMsg.wire_format = wire.WIRE_FORMAT;
+        }
+        
+        // Logical channels let big transfers stream without blocking heartbeats
+        if (client.capabilities.channels) {
+          registeredMsg.channels = { window: CHANNEL_WINDOW, chunk: CHANNEL_CHUNK };
+        }
+        
+        this.send(ws, registeredMsg);
+        ws.wireFormat = registeredMsg.wire_format || 'json';
+        if (registeredMsg.channels) {
+          ws.channels = new ChannelMux(msg => this.send(ws, msg), () => ws.wireFormat === wire.WIRE_FORMAT);
+          ws.channels.on('query_result', channel => this.receiveQueryResult(channel));
+        }
+        break;
+      
+      case 'channel_open':
+      case 'channel_data':
+      case 'channel_window':
+      case 'channel_close':
+        if (ws.channels) ws.channels.handle(message);
+        break;
+
+      case 'system_info':
+        // Static info resent after a resume attempt the server couldn't honor
+        for (const client of this.clients.values()) {
+          if (client.ws === ws) {
+            client.systemInfo = { ...client.systemInfo, ...(message.system_info || {}), ...(message.inventory || {}) };
+            client.systemInfoHash = message.system_info_hash || null;
+            if (message.inventory) {
+              client.inventoryHash = message.inventory_hash;
+              client.detailsCollected = true;
+            }
+            this.db.updateMachine(client.id, client.hostname, client.platform, client.status, client.systemInfo, client.agentVersion);
+            break;
+          }
+        }
         break;
 
       case 'heartbeat':
@@ -632,7 +1012,14 @@ class RMMServer {
           if (client.ws === ws) {
             client.lastSeen = Date.now();
             client.status = 'online';
-            const metrics = message.metrics || {};
+            const metrics = message.delta ?
+              this.applyMetricsDelta(client, message) :
+              (message.metrics || {});
+            client.heartbeatSeq = message.seq || 0;
+            if (message.agent_stats) {
+              client.agentStats = message.agent_stats;
+              client.agentStatsAt = Date.now();
+            }
             
             // Check for high resource usage alerts based on per-machine settings
             const group = this.getMachineGroup(client.hostname);
@@ -680,9 +1067,29 @@ class RMMServer {
           this.db.updateMachine(machineClient.id, machineClient.hostname, machineClient.platform, machineClient.status, machineClient.systemInfo, machineClient.agentVersion);
           console.log(`Updated system details for ${message.hostname}`);
           
+          machineClient.detailsCollected = true;
           delete machineClient.systemDetailsCommandId;
         }
         
+        // Reassemble streamed output so web clients see a complete result. If streaming broke
+        // off (agent disconnected), the result carries the rest after the chunks we did get.
+        if (message.result.streamed || message.result.chunks_sent) {
+          const output = global.commandOutputs?.get(message.id);
+          const chunks = output ? output.chunks : [];
+          const joined = stream => chunks.filter(c => c.stream === stream).map(c => c.data).join('');
+          message.result.stdout = joined('stdout') + (message.result.stdout || '');
+          message.result.stderr = joined('stderr') + (message.result.stderr || '');
+          const received = new Set(chunks.map(c => c.seq)).size;
+          if (message.result.chunks_sent && received < message.result.chunks_sent) {
+            message.result.missing_chunks = message.result.chunks_sent - received;
+          }
+          if (output) {
+            // The result now holds the full text; live pollers get a short grace period to see `done`
+            output.done = true;
+            output.doneAt = Date.now();
+          }
+        }
+        
         // Store result for web client retrieval
         global.commandResults = global.commandResults || new Map();
         global.commandResults.set(message.id, {
@@ -692,8 +1099,51 @@ class RMMServer {
         });
         break;
         
+      case 'spool_batch':
+        this.handleSpoolBatch(ws, message);
+        break;
+        
+      case 'query_result':
+      case 'python_exec_result': {
+        const pending = this.pendingQueries.get(message.id);
+        if (pending) {
+          clearTimeout(pending.timer);
+          this.pendingQueries.delete(message.id);
+          if (message.error) {
+            pending.reject(new Error(message.error));
+          } else {
+            pending.resolve(message.result);
+          }
+        }
+        break;
+      }
+        
+      case 'command_output': {
+        // Incremental output chunk from a streamed command
+        global.commandOutputs = global.commandOutputs || new Map();
+        if (!global.commandOutputs.has(message.id)) {
+          global.commandOutputs.set(message.id, {
+            hostname: message.hostname,
+            chunks: [],
+            done: false,
+            timestamp: Date.now()
+          });
+        }
+        const output = global.commandOutputs.get(message.id);
+        output.chunks.push({
+          seq: message.seq,
+          stream: message.stream,
+          data: message.data
+        });
+        // Long-running commands stay alive as long as they keep producing output
+        output.timestamp = Date.now();
+        break;
+      }
+        
       case 'update_status':
-        console.log(`Update status from ${message.hostname}: ${message.status}`);
+        if (message.status !== 'downloading') {
+          console.log(`Update status from ${message.hostname}: ${message.status}`);
+        }
         // Store update status
         global.updateStatuses = global.updateStatuses || new Map();
         global.updateStatuses.set(message.hostname, {
@@ -701,8 +1151,25 @@ class RMMServer {
           version: message.version,
           currentVersion: message.currentVersion,
           error: message.error,
+          downloaded: message.downloaded,
+          total: message.total,
+          reason: message.reason,
           timestamp: Date.now()
         });
+        if (message.status === 'installing') {
+          this.rollout.recordInstalling(message.hostname, message.version);
+        } else if (message.status === 'downloading') {
+          this.rollout.recordInstallProgress(message.hostname);
+        } else if (message.status === 'error') {
+          this.rollout.recordInstallError(message.hostname, message.version);
+        }
+        break;
+        
+      case 'update_health':
+        console.log(`Update health from ${message.hostname}: ${message.status} (${message.previous_version} -> ${message.version})`);
+        if (this.rollout.recordHealth(message.hostname, message.version, message.status)) {
+          this.onRolloutHeld();
+        }
         break;
         
       case 'agent_log':
@@ -734,6 +1201,63 @@ class RMMServer {
     }
   }
 
+  isRegistrationStorm() {
+    const now = Date.now();
+    this.registrationTimes = this.registrationTimes.filter(time => now - time < 1000);
+    if (this.registrationTimes.length >= MAX_REGISTRATIONS_PER_SECOND) {
+      return true;
+    }
+    this.registrationTimes.push(now);
+    return false;
+  }
+
+  handleSpoolBatch(ws, message) {
+    const client = Array.from(this.clients.values()).find(c => c.ws === ws);
+    if (!client) return;
+    
+    // Binary frames carry raw bytes, JSON frames carry base64
+    const compressed = Buffer.isBuffer(message.data) ? message.data : Buffer.from(message.data, 'base64');
+    const records = JSON.parse(zlib.inflateSync(compressed).toString('utf8'));
+    
+    for (const record of records) {
+      if (record.kind === 'metrics' && !record.metrics.error) {
+        // Keep the original sample time so history has no gap
+        this.db.storeMetrics(client.id, record.metrics, Math.round(record.metrics.timestamp * 1000));
+      } else if (record.kind === 'message') {
+        this.handleMessage(ws, record.message);
+      }
+    }
+    console.log(`Replayed ${records.length} spooled records from ${client.hostname}`);
+  }
+
+  applyMetricsDelta(client, message) {
+    // A gap in sequence numbers means we missed a frame; ask for a full keyframe
+    if (message.seq !== client.heartbeatSeq + 1 && client.ws.readyState === WebSocket.OPEN) {
+      this.send(client.ws, { type: 'keyframe_request' });
+    }
+    
+    const metrics = JSON.parse(JSON.stringify(client.metrics || {}));
+    const setPath = (key, value) => {
+      const parts = key.split('.');
+      let target = metrics;
+      for (const part of parts.slice(0, -1)) {
+        target[part] = target[part] || {};
+        target = target[part];
+      }
+      if (value === undefined) {
+        delete target[parts[parts.length - 1]];
+      } else {
+        target[parts[parts.length - 1]] = value;
+      }
+    };
+    
+    Object.entries(message.delta).forEach(([key, value]) => setPath(key, value));
+    (message.removed || []).forEach(key => setPath(key, undefined));
+    metrics.timestamp = Date.now() / 1000;
+    
+    return metrics;
+  }
+
   startHeartbeatCheck() {
     setInterval(() => {
       const now = Date.now();
@@ -749,9 +1273,47 @@ class RMMServer {
           this.discord.machineOffline(client.hostname, group);
         }
       }
+      
+      if (this.rollout.expireInstalls(now)) {
+        this.onRolloutHeld();
+      }
+
+      this.sweepCommandOutputs(now);
     }, 10000); // Check every 10 seconds
   }
 
+  // Streamed output and results that nobody fetched (group commands, abandoned polls) expire here
+  sweepCommandOutputs(now) {
+    for (const [commandId, output] of global.commandOutputs || []) {
+      const expired = output.done
+        ? now - output.doneAt > COMMAND_OUTPUT_GRACE
+        : now - output.timestamp > COMMAND_RESULT_TTL;
+      if (expired) {
+        global.commandOutputs.delete(commandId);
+      }
+    }
+    for (const [commandId, result] of global.commandResults || []) {
+      if (now - result.timestamp > COMMAND_RESULT_TTL) {
+        global.commandResults.delete(commandId);
+      }
+    }
+  }
+  
+  broadcastRolloutPolicy() {
+    const message = { type: 'rollout_policy', rollout: this.rollout.policy };
+    for (const client of this.clients.values()) {
+      if (client.ws.readyState === WebSocket.OPEN) {
+        this.send(client.ws, message);
+      }
+    }
+  }
+  
+  onRolloutHeld() {
+    console.log(`ALERT: Rollout held - ${this.rollout.policy.hold_reason}`);
+    this.discord.sendProactiveAlert(`⏸️ **Rollout Held**: ${this.rollout.policy.hold_reason}`);
+    this.broadcastRolloutPolicy();
+  }
+
   startUpdateCheck() {
     // Check for updates every 30 minutes and auto-notify agents
     this.updater.startAutoUpdateCheck(30);
@@ -760,6 +1322,27 @@ class RMMServer {
     this.updater.onUpdateAvailable = () => {
       this.notifyAllAgentsToUpdate();
     };
+    
+    // Push new releases to agents so they don't each poll GitHub
+    this.updater.onReleaseAvailable = (version) => {
+      // Warm the artifact cache so agents reacting to the push hit the local copy
+      this.artifactCache.prefetch();
+      this.notifyAgentsOfRelease(version);
+    };
+  }
+  
+  notifyAgentsOfRelease(version) {
+    let notified = 0;
+    for (const client of this.clients.values()) {
+      if (!client.capabilities?.release_push || client.ws.readyState !== WebSocket.OPEN) continue;
+      const known = client.agentVersion && client.agentVersion !== 'Unknown';
+      if (known && this.updater.compareVersions(version, client.agentVersion) <= 0) continue;
+      this.send(client.ws, { type: 'release_available', version });
+      notified++;
+    }
+    if (notified > 0) {
+      console.log(`Announced release ${version} to ${notified} agents`);
+    }
   }
   
   notifyAllAgentsToUpdate() {
@@ -768,7 +1351,7 @@ class RMMServer {
     
     for (const client of this.clients.values()) {
       if (client.ws.readyState === WebSocket.OPEN) {
-        client.ws.send(JSON.stringify(updateCommand));
+        this.send(client.ws, updateCommand);
       }
     }
   }
@@ -811,20 +1394,153 @@ class RMMServer {
     }
   }
   
+  // Query strings only carry text: convert each parameter to the type its query expects
+  parseQueryParams(query, raw) {
+    const schema = QUERY_PARAMS[query];
+    if (!schema) {
+      throw new Error(`Unknown query: ${query}`);
+    }
+    const params = {};
+    for (const [name, value] of Object.entries(raw || {})) {
+      const type = schema[name];
+      if (!type) {
+        throw new Error(`Unknown parameter for ${query}: ${name}`);
+      }
+      if (typeof value !== 'string') {
+        throw new Error(`Parameter ${name} must be given once`);
+      }
+      if (type === 'number') {
+        const number = Number(value);
+        if (value.trim() === '' || !Number.isFinite(number)) {
+          throw new Error(`Parameter ${name} must be a number`);
+        }
+        params[name] = number;
+      } else if (type === 'boolean') {
+        if (!['true', '1', 'false', '0'].includes(value)) {
+          throw new Error(`Parameter ${name} must be true or false`);
+        }
+        params[name] = value === 'true' || value === '1';
+      } else {
+        params[name] = value;
+      }
+    }
+    return params;
+  }
+
+  queryAgent(client, query, params = {}, timeoutMs = 10000) {
+    // Typed in-process query answered from the agent's cached state
+    return new Promise((resolve, reject) => {
+      if (!(client.capabilities.queries || []).includes(query)) {
+        return reject(new Error(`Agent does not support query: ${query}`));
+      }
+      
+      const queryId = uuidv4();
+      const timer = setTimeout(() => {
+        this.pendingQueries.delete(queryId);
+        reject(new Error('Query timed out'));
+      }, timeoutMs);
+      
+      this.pendingQueries.set(queryId, { resolve, reject, timer });
+      this.send(client.ws, {
+        type: 'query',
+        id: queryId,
+        query: query,
+        params: params
+      });
+    });
+  }
+
+  // Agents cache scripts by hash, so one an agent has already run is sent as just its hash
+  async execPython(client, { code, hash, args = {}, timeout = 30, memoryMb }) {
+    if (!client.capabilities.python_exec) {
+      throw new Error('Agent does not support python_exec');
+    }
+    if (code) {
+      hash = crypto.createHash('sha256').update(code, 'utf8').digest('hex');
+      this.pythonScripts.delete(hash);
+      this.pythonScripts.set(hash, code);
+      if (this.pythonScripts.size > 256) {
+        this.pythonScripts.delete(this.pythonScripts.keys().next().value);
+      }
+    } else {
+      code = this.pythonScripts.get(hash);
+    }
+    client.pythonScripts = client.pythonScripts || new Set();
+
+    const send = includeCode => new Promise((resolve, reject) => {
+      const execId = uuidv4();
+      // The agent enforces the script timeout; this only catches a lost reply
+      const timer = setTimeout(() => {
+        this.pendingQueries.delete(execId);
+        reject(new Error('Python execution timed out'));
+      }, (timeout + 15) * 1000);
+      this.pendingQueries.set(execId, { resolve, reject, timer });
+      const message = { type: 'python_exec', id: execId, hash, args, timeout };
+      if (memoryMb) message.memory_mb = memoryMb;
+      if (includeCode) message.code = code;
+      this.send(client.ws, message);
+    });
+
+    let result = await send(Boolean(code) && !client.pythonScripts.has(hash));
+    if (result.missing_script && code) {
+      // The agent restarted or evicted the script since we last sent it
+      result = await send(true);
+    }
+    if (!result.missing_script) {
+      client.pythonScripts.add(hash);
+    }
+    return result;
+  }
+
+  // Large query results arrive as a channel stream instead of a single query_result
+  receiveQueryResult(channel) {
+    const chunks = [];
+    const settle = (error, result) => {
+      const pending = this.pendingQueries.get(channel.meta.id);
+      if (!pending) return;
+      clearTimeout(pending.timer);
+      this.pendingQueries.delete(channel.meta.id);
+      if (error) pending.reject(error);
+      else pending.resolve(result);
+    };
+    channel.on('data', chunk => chunks.push(chunk));
+    channel.on('end', () => {
+      channel.close();
+      try {
+        settle(null, JSON.parse(Buffer.concat(chunks).toString('utf8')));
+      } catch (error) {
+        settle(error);
+      }
+    });
+    channel.on('error', error => settle(error));
+  }
+
   getAgentVersion(client) {
     if (client.ws.readyState !== WebSocket.OPEN) return;
     
+    // Newer agents answer from memory instead of forking an interpreter
+    if ((client.capabilities.queries || []).includes('version')) {
+      this.queryAgent(client, 'version')
+        .then(result => {
+          client.agentVersion = result.version;
+          this.db.updateMachine(client.id, client.hostname, client.platform, client.status, client.systemInfo, result.version);
+          console.log(`Updated agent version for ${client.hostname}: ${result.version}`);
+        })
+        .catch(error => console.error(`Version query failed for ${client.hostname}:`, error.message));
+      return;
+    }
+    
     const isWindows = client.platform.includes('Windows');
     const versionCommand = isWindows ? 
       'powershell "try { python -c \"from version import VERSION; print(VERSION)\" } catch { echo Unknown }"' :
       'python3 -c "try:\n    from version import VERSION\n    print(VERSION)\nexcept:\n    print(\"Unknown\")" 2>/dev/null || echo Unknown';
     
     const commandId = uuidv4();
-    client.ws.send(JSON.stringify({
+    this.send(client.ws, {
       type: 'command',
       id: commandId,
       command: versionCommand
-    }));
+    });
     
     // Store command ID to identify version response
     client.versionCommandId = commandId;
@@ -839,11 +1555,11 @@ class RMMServer {
       'echo COMPUTER: && dmidecode -t system 2>/dev/null | grep -E "Manufacturer|Product Name" && echo CPU: && dmidecode -t processor 2>/dev/null | grep "Version" | head -1 && echo BIOS: && dmidecode -t bios 2>/dev/null | grep "Version" | head -1 && echo MEMORY: && dmidecode -t memory 2>/dev/null | grep -E "Type|Speed" | head -2 && echo DISK: && lsblk -d -o NAME,ROTA,SIZE,MODEL 2>/dev/null';
     
     const commandId = uuidv4();
-    client.ws.send(JSON.stringify({
+    this.send(client.ws, {
       type: 'command',
       id: commandId,
       command: systemCommand
-    }));
+    });
     
     // Store command ID to identify system details response
     client.systemDetailsCommandId = commandId;
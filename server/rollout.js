@@ -0,0 +1,148 @@
+const fs = require('fs');
+const path = require('path');
+
+const DEFAULT_POLICY = {
+  percent: 100,      // Share of the fleet (by hostname hash) allowed to update
+  window: null,      // { start: 'HH:MM', end: 'HH:MM' } in each agent's local time
+  max_delay: 0,      // Seconds of random delay before an agent installs
+  hold: false,
+  hold_reason: null
+};
+
+// Auto-hold once this many installs of a version fail and they are this share of reports
+const FAILURE_MIN_COUNT = 2;
+const FAILURE_RATIO = 0.2;
+// An agent that started installing but hasn't reported health (or download progress) by now counts as failed
+const HEALTH_REPORT_TIMEOUT = 15 * 60 * 1000;
+
+class RolloutManager {
+  constructor() {
+    this.configFile = path.join(__dirname, 'rollout-config.json');
+    this.health = new Map(); // version -> { healthy: Set, failed: Set }
+    this.installing = new Map(); // hostname -> { version, deadline }
+    this.installErrors = new Map(); // version -> Set of hostnames whose install failed before the swap
+    this.loadConfig();
+  }
+
+  loadConfig() {
+    try {
+      this.policy = { ...DEFAULT_POLICY, ...JSON.parse(fs.readFileSync(this.configFile, 'utf8')) };
+    } catch {
+      this.policy = { ...DEFAULT_POLICY };
+    }
+  }
+
+  setPolicy(changes) {
+    const policy = { ...this.policy };
+    if (changes.percent !== undefined) {
+      policy.percent = Math.max(0, Math.min(100, Number(changes.percent)));
+    }
+    if (changes.window !== undefined) {
+      const valid = time => /^([01]\d|2[0-3]):[0-5]\d$/.test(time);
+      if (changes.window && !(valid(changes.window.start) && valid(changes.window.end))) {
+        throw new Error('window needs start and end as HH:MM');
+      }
+      policy.window = changes.window ? { start: changes.window.start, end: changes.window.end } : null;
+    }
+    if (changes.max_delay !== undefined) {
+      policy.max_delay = Math.max(0, Number(changes.max_delay));
+    }
+    if (changes.hold !== undefined) {
+      policy.hold = Boolean(changes.hold);
+      policy.hold_reason = policy.hold ? (changes.hold_reason || 'Held by administrator') : null;
+    }
+    this.policy = policy;
+    fs.writeFileSync(this.configFile, JSON.stringify(policy, null, 2));
+    return policy;
+  }
+
+  recordInstalling(hostname, version) {
+    this.installing.set(hostname, { version, deadline: Date.now() + HEALTH_REPORT_TIMEOUT });
+  }
+
+  // A slow download is still alive as long as it reports progress
+  recordInstallProgress(hostname) {
+    const pending = this.installing.get(hostname);
+    if (pending) {
+      pending.deadline = Date.now() + HEALTH_REPORT_TIMEOUT;
+    }
+  }
+
+  // The install never replaced the running agent (e.g. the download failed), so the
+  // release's health is unknown: tracked separately and never counted toward a hold
+  recordInstallError(hostname, version) {
+    const pending = this.installing.get(hostname);
+    this.installing.delete(hostname);
+    version = version || (pending && pending.version);
+    if (!version) {
+      return;
+    }
+    if (!this.installErrors.has(version)) {
+      this.installErrors.set(version, new Set());
+    }
+    this.installErrors.get(version).add(hostname);
+  }
+
+  // Returns true if this report put the rollout on hold
+  recordHealth(hostname, version, status) {
+    this.installing.delete(hostname);
+    if (this.installErrors.has(version)) {
+      this.installErrors.get(version).delete(hostname);
+    }
+    if (!this.health.has(version)) {
+      this.health.set(version, { healthy: new Set(), failed: new Set() });
+    }
+    const counts = this.health.get(version);
+    if (status === 'healthy') {
+      counts.healthy.add(hostname);
+      counts.failed.delete(hostname);
+    } else {
+      counts.failed.add(hostname);
+      counts.healthy.delete(hostname);
+    }
+
+    const total = counts.healthy.size + counts.failed.size;
+    if (!this.policy.hold && counts.failed.size >= FAILURE_MIN_COUNT && counts.failed.size / total >= FAILURE_RATIO) {
+      this.setPolicy({ hold: true, hold_reason: `Auto-hold: ${counts.failed.size}/${total} agents failed on ${version}` });
+      return true;
+    }
+    return false;
+  }
+
+  // Agents that went quiet after starting an install; returns true if that triggered a hold
+  expireInstalls(now = Date.now()) {
+    let held = false;
+    for (const [hostname, pending] of this.installing.entries()) {
+      if (pending.deadline <= now) {
+        console.log(`No health report from ${hostname} after updating to ${pending.version}`);
+        held = this.recordHealth(hostname, pending.version, 'no_report') || held;
+      }
+    }
+    return held;
+  }
+
+  summary() {
+    const versions = {};
+    for (const [version, counts] of this.health.entries()) {
+      versions[version] = {
+        healthy: counts.healthy.size,
+        failed: counts.failed.size,
+        failedHosts: Array.from(counts.failed)
+      };
+    }
+    for (const [version, hosts] of this.installErrors.entries()) {
+      if (hosts.size) {
+        versions[version] = versions[version] || { healthy: 0, failed: 0, failedHosts: [] };
+        versions[version].installErrors = hosts.size;
+        versions[version].installErrorHosts = Array.from(hosts);
+      }
+    }
+    return {
+      policy: this.policy,
+      versions,
+      installing: Array.from(this.installing.entries()).map(([hostname, pending]) => ({ hostname, ...pending }))
+    };
+  }
+}
+
+module.exports = RolloutManager;
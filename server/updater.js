@@ -8,6 +8,11 @@ class Updater {
     this.repoOwner = repoOwner;
     this.repoName = repoName;
     this.currentVersion = this.getCurrentVersion();
+    // Cached release and validators so repeat polls are conditional requests
+    this.latestRelease = null;
+    this.etag = null;
+    this.lastModified = null;
+    this.announcedVersion = null;
   }
 
   getCurrentVersion() {
@@ -19,15 +24,25 @@ class Updater {
     }
   }
 
-  async checkForUpdates() {
+  fetchLatestRelease() {
     return new Promise((resolve, reject) => {
+      const headers = { 'User-Agent': 'nxtclone-updater' };
+      if (this.latestRelease) {
+        if (this.etag) headers['If-None-Match'] = this.etag;
+        if (this.lastModified) headers['If-Modified-Since'] = this.lastModified;
+      }
       const options = {
         hostname: 'api.github.com',
         path: `/repos/${this.repoOwner}/${this.repoName}/releases/latest`,
-        headers: { 'User-Agent': 'nxtclone-updater' }
+        headers
       };
 
       https.get(options, (res) => {
+        if (res.statusCode === 304 && this.latestRelease) {
+          res.resume();
+          resolve(this.latestRelease);
+          return;
+        }
         let data = '';
         res.on('data', chunk => data += chunk);
         res.on('end', () => {
@@ -36,37 +51,17 @@ class Updater {
               reject(new Error('No data received from GitHub API'));
               return;
             }
-            
             const release = JSON.parse(data);
-            if (!release.tag_name) {
-              // No releases found, return current version as latest
-              resolve({
-                hasUpdate: false,
-                currentVersion: this.currentVersion,
-                latestVersion: this.currentVersion,
-                downloadUrl: null,
-                releaseNotes: 'No releases found'
-              });
+            if (res.statusCode === 200) {
+              this.latestRelease = release;
+              this.etag = res.headers.etag || null;
+              this.lastModified = res.headers['last-modified'] || null;
+            } else if (this.latestRelease) {
+              // Rate limited or failing; keep serving the last good release
+              resolve(this.latestRelease);
               return;
             }
-            
-            const latestVersion = release.tag_name.replace('v', '');
-            
-            const updateInfo = {
-              hasUpdate: this.compareVersions(latestVersion, this.currentVersion) > 0,
-              currentVersion: this.currentVersion,
-              latestVersion: latestVersion,
-              downloadUrl: release.zipball_url,
-              releaseNotes: release.body
-            };
-            
-            // Auto-update if new version available
-            if (updateInfo.hasUpdate) {
-              console.log(`Auto-updating server: ${updateInfo.currentVersion} -> ${updateInfo.latestVersion}`);
-              this.downloadAndUpdate(updateInfo.downloadUrl);
-            }
-            
-            resolve(updateInfo);
+            resolve(release);
           } catch (error) {
             reject(error);
           }
@@ -75,6 +70,48 @@ class Updater {
     });
   }
 
+  getLatestVersion() {
+    return this.latestRelease?.tag_name ? this.latestRelease.tag_name.replace('v', '') : null;
+  }
+
+  async checkForUpdates() {
+    const release = await this.fetchLatestRelease();
+    if (!release.tag_name) {
+      // No releases found, return current version as latest
+      return {
+        hasUpdate: false,
+        currentVersion: this.currentVersion,
+        latestVersion: this.currentVersion,
+        downloadUrl: null,
+        releaseNotes: 'No releases found'
+      };
+    }
+
+    const latestVersion = release.tag_name.replace('v', '');
+
+    // Tell connected agents once per new release so they don't have to poll
+    if (latestVersion !== this.announcedVersion) {
+      this.announcedVersion = latestVersion;
+      if (this.onReleaseAvailable) this.onReleaseAvailable(latestVersion);
+    }
+
+    const updateInfo = {
+      hasUpdate: this.compareVersions(latestVersion, this.currentVersion) > 0,
+      currentVersion: this.currentVersion,
+      latestVersion: latestVersion,
+      downloadUrl: release.zipball_url,
+      releaseNotes: release.body
+    };
+
+    // Auto-update if new version available
+    if (updateInfo.hasUpdate) {
+      console.log(`Auto-updating server: ${updateInfo.currentVersion} -> ${updateInfo.latestVersion}`);
+      this.downloadAndUpdate(updateInfo.downloadUrl);
+    }
+
+    return updateInfo;
+  }
+
   compareVersions(a, b) {
     const aParts = a.split('.').map(Number);
     const bParts = b.split('.').map(Number);
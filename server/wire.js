@@ -0,0 +1,220 @@
+// Tagged MessagePack wire format negotiated with agents at register.
+// FIELD_TAGS must match agents/wire_codec.py -- only ever append to it.
+const WIRE_FORMAT = 'msgpack-tagged';
+
+const FIELD_TAGS = [
+  'type', 'hostname', 'id', 'metrics', 'cpu_percent', 'memory_percent',
+  'memory_used', 'disk_percent', 'disk_used', 'process_count', 'network_io',
+  'bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv', 'errin',
+  'errout', 'dropin', 'dropout', 'timestamp', 'seq', 'keyframe', 'delta',
+  'removed', 'result', 'stdout', 'stderr', 'returncode', 'error', 'command',
+  'stream', 'data', 'status', 'message', 'platform', 'system_info',
+  'agentVersion', 'capabilities', 'eventLogs', 'version', 'currentVersion',
+  'channel', 'credit'
+];
+const TAG_BY_NAME = new Map(FIELD_TAGS.map((name, tag) => [name, tag]));
+
+class Writer {
+  constructor() {
+    this.buffer = Buffer.allocUnsafe(256);
+    this.length = 0;
+  }
+
+  ensure(size) {
+    if (this.length + size <= this.buffer.length) return;
+    let capacity = this.buffer.length * 2;
+    while (capacity < this.length + size) capacity *= 2;
+    const grown = Buffer.allocUnsafe(capacity);
+    this.buffer.copy(grown, 0, 0, this.length);
+    this.buffer = grown;
+  }
+
+  byte(value) {
+    this.ensure(1);
+    this.buffer[this.length++] = value;
+  }
+
+  uint(value, size) {
+    this.ensure(size);
+    if (size === 1) this.buffer.writeUInt8(value, this.length);
+    else if (size === 2) this.buffer.writeUInt16BE(value, this.length);
+    else if (size === 4) this.buffer.writeUInt32BE(value, this.length);
+    else this.buffer.writeBigUInt64BE(BigInt(value), this.length);
+    this.length += size;
+  }
+
+  bytes(buf) {
+    this.ensure(buf.length);
+    buf.copy(this.buffer, this.length);
+    this.length += buf.length;
+  }
+}
+
+function pack(value, w) {
+  if (value === null || value === undefined) {
+    w.byte(0xc0);
+  } else if (value === true) {
+    w.byte(0xc3);
+  } else if (value === false) {
+    w.byte(0xc2);
+  } else if (typeof value === 'number') {
+    if (Number.isSafeInteger(value)) {
+      packInt(value, w);
+    } else {
+      w.byte(0xcb);
+      w.ensure(8);
+      w.buffer.writeDoubleBE(value, w.length);
+      w.length += 8;
+    }
+  } else if (typeof value === 'string') {
+    const raw = Buffer.from(value, 'utf8');
+    const n = raw.length;
+    if (n < 32) w.byte(0xa0 | n);
+    else if (n < 0x100) { w.byte(0xd9); w.uint(n, 1); }
+    else if (n < 0x10000) { w.byte(0xda); w.uint(n, 2); }
+    else { w.byte(0xdb); w.uint(n, 4); }
+    w.bytes(raw);
+  } else if (Buffer.isBuffer(value)) {
+    const n = value.length;
+    if (n < 0x100) { w.byte(0xc4); w.uint(n, 1); }
+    else if (n < 0x10000) { w.byte(0xc5); w.uint(n, 2); }
+    else { w.byte(0xc6); w.uint(n, 4); }
+    w.bytes(value);
+  } else if (Array.isArray(value)) {
+    const n = value.length;
+    if (n < 16) w.byte(0x90 | n);
+    else if (n < 0x10000) { w.byte(0xdc); w.uint(n, 2); }
+    else { w.byte(0xdd); w.uint(n, 4); }
+    value.forEach(item => pack(item, w));
+  } else if (typeof value === 'object') {
+    const entries = Object.entries(value).filter(([, item]) => item !== undefined);
+    const n = entries.length;
+    if (n < 16) w.byte(0x80 | n);
+    else if (n < 0x10000) { w.byte(0xde); w.uint(n, 2); }
+    else { w.byte(0xdf); w.uint(n, 4); }
+    entries.forEach(([key, item]) => {
+      const tag = TAG_BY_NAME.get(key);
+      pack(tag !== undefined ? tag : key, w);
+      pack(item, w);
+    });
+  } else {
+    throw new Error(`Cannot encode ${typeof value}`);
+  }
+}
+
+function packInt(value, w) {
+  if (value >= 0) {
+    if (value < 0x80) w.byte(value);
+    else if (value < 0x100) { w.byte(0xcc); w.uint(value, 1); }
+    else if (value < 0x10000) { w.byte(0xcd); w.uint(value, 2); }
+    else if (value < 0x100000000) { w.byte(0xce); w.uint(value, 4); }
+    else { w.byte(0xcf); w.uint(value, 8); }
+    return;
+  }
+  if (value >= -32) {
+    w.byte(value & 0xff);
+    return;
+  }
+  w.byte(0xd3);
+  w.ensure(8);
+  w.buffer.writeBigInt64BE(BigInt(value), w.length);
+  w.length += 8;
+}
+
+function encode(message) {
+  const w = new Writer();
+  pack(message, w);
+  return w.buffer.subarray(0, w.length);
+}
+
+function decode(buf) {
+  let offset = 0;
+
+  const need = (size) => {
+    if (offset + size > buf.length) throw new Error('Truncated message');
+  };
+
+  const str = (n) => {
+    need(n);
+    const value = buf.toString('utf8', offset, offset + n);
+    offset += n;
+    return value;
+  };
+
+  const array = (n) => {
+    const items = [];
+    for (let i = 0; i < n; i++) items.push(unpack());
+    return items;
+  };
+
+  const map = (n) => {
+    const result = {};
+    for (let i = 0; i < n; i++) {
+      let key = unpack();
+      if (typeof key === 'number') {
+        if (key >= FIELD_TAGS.length) throw new Error(`Unknown field tag ${key}`);
+        key = FIELD_TAGS[key];
+      }
+      result[key] = unpack();
+    }
+    return result;
+  };
+
+  const read = (method, size) => {
+    need(size);
+    const value = buf[method](offset);
+    offset += size;
+    return typeof value === 'bigint' ? Number(value) : value;
+  };
+
+  const unpack = () => {
+    need(1);
+    const code = buf[offset++];
+
+    if (code < 0x80) return code;
+    if (code >= 0xe0) return code - 0x100;
+    if (code >= 0xa0 && code <= 0xbf) return str(code & 0x1f);
+    if (code >= 0x90 && code <= 0x9f) return array(code & 0x0f);
+    if (code >= 0x80 && code <= 0x8f) return map(code & 0x0f);
+
+    switch (code) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xcc: return read('readUInt8', 1);
+      case 0xcd: return read('readUInt16BE', 2);
+      case 0xce: return read('readUInt32BE', 4);
+      case 0xcf: return read('readBigUInt64BE', 8);
+      case 0xd0: return read('readInt8', 1);
+      case 0xd1: return read('readInt16BE', 2);
+      case 0xd2: return read('readInt32BE', 4);
+      case 0xd3: return read('readBigInt64BE', 8);
+      case 0xca: return read('readFloatBE', 4);
+      case 0xcb: return read('readDoubleBE', 8);
+      case 0xd9: return str(read('readUInt8', 1));
+      case 0xda: return str(read('readUInt16BE', 2));
+      case 0xdb: return str(read('readUInt32BE', 4));
+      case 0xc4:
+      case 0xc5:
+      case 0xc6: {
+        const n = code === 0xc4 ? read('readUInt8', 1) : code === 0xc5 ? read('readUInt16BE', 2) : read('readUInt32BE', 4);
+        need(n);
+        const value = buf.subarray(offset, offset + n);
+        offset += n;
+        return value;
+      }
+      case 0xdc: return array(read('readUInt16BE', 2));
+      case 0xdd: return array(read('readUInt32BE', 4));
+      case 0xde: return map(read('readUInt16BE', 2));
+      case 0xdf: return map(read('readUInt32BE', 4));
+      default:
+        throw new Error(`Unsupported type code 0x${code.toString(16)}`);
+    }
+  };
+
+  const value = unpack();
+  if (offset !== buf.length) throw new Error('Trailing bytes after message');
+  return value;
+}
+
+module.exports = { WIRE_FORMAT, FIELD_TAGS, encode, decode };
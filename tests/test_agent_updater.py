@@ -0,0 +1,154 @@
+"""Update mirror path of agent_updater against a local http.server stand-in
+
+Run from the repository root with: python -m unittest discover tests
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "agents"))
+
+from agent_updater import AgentUpdater  # noqa: E402
+
+ARTIFACT = os.urandom(300 * 1024)
+ARTIFACT_SHA256 = hashlib.sha256(ARTIFACT).hexdigest()
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """Serves manifest.json and one artifact, with Range support and an optional mid-transfer drop"""
+
+    manifest = None
+    manifest_status = 200
+    cut_after = None  # Close the first artifact response after this many bytes
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests_seen.append((self.path, self.headers.get("Range"), self.headers.get("Accept-Encoding")))
+        if self.path.endswith("/manifest.json"):
+            body = json.dumps(self.manifest).encode("utf-8")
+            self.send_response(self.manifest_status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(ARTIFACT) - 1}/{len(ARTIFACT)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", '"artifact-1"')
+        self.send_header("Content-Length", str(len(ARTIFACT) - start))
+        self.end_headers()
+
+        body = ARTIFACT[start:]
+        if type(self).cut_after is not None:
+            body = body[:type(self).cut_after]
+            type(self).cut_after = None
+            self.wfile.write(body)
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+class MirrorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), MirrorHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/agent-updates"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.updater = AgentUpdater()
+        self.updater.set_mirrors([self.base_url])
+        self.name = self.updater.platform_asset_name()
+        MirrorHandler.manifest = {
+            "version": "v99.0.0",
+            "release_notes": "notes",
+            "artifacts": {
+                self.name: {"url": f"artifacts/99.0.0/{self.name}", "size": len(ARTIFACT), "sha256": ARTIFACT_SHA256}
+            }
+        }
+        MirrorHandler.manifest_status = 200
+        MirrorHandler.cut_after = None
+        MirrorHandler.requests_seen = []
+        self.directory = tempfile.TemporaryDirectory()
+        self.destination = os.path.join(self.directory.name, self.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_manifest_and_verified_download(self):
+        info = self.updater.check_for_updates()
+        self.assertEqual(info["latest_version"], "99.0.0")
+        self.assertTrue(info["has_update"])
+        self.assertEqual(info["source"], f"mirror {self.base_url}/")
+        self.assertEqual(info["download_url"], f"{self.base_url}/artifacts/99.0.0/{self.name}")
+
+        digest = self.updater.download_verified(info["download_url"], self.destination, info["sha256"], info["size"])
+        self.assertEqual(digest, ARTIFACT_SHA256)
+        with open(self.destination, "rb") as f:
+            self.assertEqual(f.read(), ARTIFACT)
+        # Byte offsets must match the file on disk, so the body is never content-encoded
+        encodings = [seen[2] for seen in MirrorHandler.requests_seen if "/artifacts/" in seen[0]]
+        self.assertEqual(encodings, ["identity"])
+
+    def test_checksum_mismatch_is_rejected(self):
+        MirrorHandler.manifest["artifacts"][self.name]["sha256"] = "0" * 64
+        info = self.updater.check_for_updates()
+
+        with self.assertRaisesRegex(ValueError, "Checksum mismatch"):
+            self.updater.download_verified(info["download_url"], self.destination, info["sha256"], info["size"])
+        self.assertFalse(os.path.exists(self.destination))
+        self.assertFalse(os.path.exists(self.destination + ".part"))
+
+    def test_interrupted_download_resumes_with_range(self):
+        MirrorHandler.cut_after = 100 * 1024
+        info = self.updater.check_for_updates()
+
+        with mock.patch("agent_updater.time.sleep"):
+            digest = self.updater.download_verified(info["download_url"], self.destination, info["sha256"], info["size"])
+        self.assertEqual(digest, ARTIFACT_SHA256)
+        ranges = [seen[1] for seen in MirrorHandler.requests_seen if "/artifacts/" in seen[0]]
+        # The retry asks only for what is missing (a chunk cut short mid-read is fetched again)
+        self.assertEqual(len(ranges), 2)
+        self.assertIsNone(ranges[0])
+        offset = int(ranges[1][len("bytes="):-1])
+        self.assertTrue(0 < offset <= 100 * 1024)
+        with open(self.destination, "rb") as f:
+            self.assertEqual(f.read(), ARTIFACT)
+
+    def test_broken_mirror_falls_back_to_github(self):
+        MirrorHandler.manifest_status = 500
+        github_release = {
+            "version": "99.0.0",
+            "download_url": "https://github.com/example/artifact",
+            "sha256": ARTIFACT_SHA256,
+            "size": len(ARTIFACT),
+            "deltas": {},
+            "release_notes": ""
+        }
+        with mock.patch.object(self.updater.github, "latest", return_value=github_release):
+            info = self.updater.check_for_updates()
+        self.assertEqual(info["source"], "github")
+        self.assertEqual(info["download_url"], "https://github.com/example/artifact")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Lane ordering of the agent's single-writer OutboundQueue
+
+Run from the repository root with: python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "agents"))
+
+from outbound_queue import OutboundQueue  # noqa: E402
+
+class OutboundQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def test_heartbeat_not_starved_by_results(self):
+        written = []
+
+        async def slow_write(websocket, message):
+            await asyncio.sleep(0.01)
+            written.append(message)
+
+        queue = OutboundQueue(None, slow_write, heartbeat_max_wait=0.1)
+        writer = asyncio.create_task(queue.run())
+
+        async def stream_output(command_id):
+            # Keeps the results lane non-empty for the whole test
+            for seq in range(60):
+                await queue.send({"type": "command_output", "command_id": command_id, "seq": seq})
+
+        producers = [asyncio.create_task(stream_output(name)) for name in ("a", "b")]
+        await asyncio.sleep(0.05)
+        heartbeat = queue.put({"type": "heartbeat", "cpu": 1}, coalesce_key="heartbeat")
+        queue.put({"type": "heartbeat", "cpu": 2}, coalesce_key="heartbeat")
+        await asyncio.wait_for(heartbeat, timeout=0.5)
+        self.assertFalse(all(task.done() for task in producers))
+
+        await asyncio.gather(*producers)
+        writer.cancel()
+        heartbeats = [message for message in written if message["type"] == "heartbeat"]
+        self.assertEqual(heartbeats, [{"type": "heartbeat", "cpu": 2}])
+
+    async def test_results_go_before_fresh_heartbeat(self):
+        written = []
+
+        async def write(websocket, message):
+            written.append(message["type"])
+
+        queue = OutboundQueue(None, write)
+        queue.put({"type": "heartbeat"}, coalesce_key="heartbeat")
+        last = queue.put({"type": "command_result"})
+        writer = asyncio.create_task(queue.run())
+        await last
+        await asyncio.sleep(0)
+        writer.cancel()
+        self.assertEqual(written, ["command_result", "heartbeat"])
+
+if __name__ == "__main__":
+    unittest.main()